@@ -0,0 +1,74 @@
+"""
+Stand-alone benchmarks for fb_post.
+
+Each ``bench_*`` module is run with ``python -m benchmarks.bench_<name>`` from
+the project root. It builds a throw-away test database, fills it and prints a
+timing table, so the development ``db.sqlite3`` is never touched.
+"""
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import django
+
+
+@contextmanager
+def benchmark_database():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'testing_assignment_004.settings')
+    django.setup()
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+@contextmanager
+def benchmark_file_database():
+    """
+    A migrated SQLite file in a temporary directory, for benchmarks that
+    use several connections or server processes. Settings come from
+    benchmarks.settings; the environment, inherited by subprocesses, names
+    the file.
+    :return: path of the database file
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'db.sqlite3')
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+        os.environ['FB_POST_BENCHMARK_DB'] = path
+        django.setup()
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+        yield path
+
+
+def begin_immediate():
+    """
+    Opens SQLite write transactions with BEGIN IMMEDIATE, as Django 5.1's
+    ``transaction_mode`` option does: with Django 4.2's deferred BEGIN, two
+    transactions that read before writing deadlock on the lock upgrade
+    until the busy timeout.
+    """
+    from django.db.backends.sqlite3.base import DatabaseWrapper
+
+    def start_transaction(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
+
+    DatabaseWrapper._start_transaction_under_autocommit = start_transaction
+
+
+def time_call(func, *args, repeat=50, **kwargs):
+    """
+    :return: median wall time of ``func(*args, **kwargs)`` in milliseconds
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
@@ -0,0 +1,96 @@
+"""
+Requests per second of every JSON endpoint, served in-process through the
+Django test client over a seeded dataset.
+
+    python -m benchmarks.bench_api [--scale 1]
+"""
+import argparse
+import json
+import time
+
+from benchmarks import benchmark_database
+from benchmarks.dataset import generate_dataset
+
+REQUEST_COUNT = 200
+
+
+def requests_per_second(send, count=REQUEST_COUNT):
+    start = time.perf_counter()
+    for index in range(count):
+        response = send(index)
+        assert response.status_code < 400, response.content
+        if response.streaming:
+            b''.join(response.streaming_content)
+    return count / (time.perf_counter() - start)
+
+
+def get_cases(client, data):
+    user_ids = data['user_ids']
+    post_ids = data['post_ids']
+    comment_ids = data['comment_ids']
+    viral_post_id = data['viral_post_id']
+    page_ids = ','.join(str(post_id) for post_id in post_ids[:20])
+    viral_post_url = '/fb_post/posts/{}/'.format(viral_post_id)
+    viral_post_etag = client.get(viral_post_url)['ETag']
+
+    def post_json(url, body):
+        return client.post(url, json.dumps(body),
+                           content_type='application/json')
+
+    return [
+        ('GET posts/<id>/', lambda index: client.get(
+            '/fb_post/posts/{}/'.format(post_ids[index % len(post_ids)]))),
+        ('GET posts/<id>/ If-None-Match (304)', lambda index: client.get(
+            viral_post_url, HTTP_IF_NONE_MATCH=viral_post_etag)),
+        ('GET posts/?ids= (20)', lambda index: client.get(
+            '/fb_post/posts/?ids=' + page_ids)),
+        ('GET users/<id>/posts/?page_size=20', lambda index: client.get(
+            '/fb_post/users/{}/posts/?page_size=20'.format(
+                data['heavy_user_id']))),
+        ('GET comments/<id>/replies/', lambda index: client.get(
+            '/fb_post/comments/{}/replies/'.format(
+                data['viral_comment_id']))),
+        ('GET posts/<id>/reactions/', lambda index: client.get(
+            '/fb_post/posts/{}/reactions/'.format(viral_post_id))),
+        ('GET posts/<id>/reaction-metrics/', lambda index: client.get(
+            '/fb_post/posts/{}/reaction-metrics/'.format(viral_post_id))),
+        ('POST posts/', lambda index: post_json(
+            '/fb_post/posts/', {"user_id": user_ids[index % len(user_ids)],
+                                "post_content": 'api post'})),
+        ('POST posts/<id>/comments/', lambda index: post_json(
+            '/fb_post/posts/{}/comments/'.format(viral_post_id),
+            {"user_id": user_ids[index % len(user_ids)],
+             "comment_content": 'api comment'})),
+        ('POST comments/<id>/replies/', lambda index: post_json(
+            '/fb_post/comments/{}/replies/'.format(
+                comment_ids[index % len(comment_ids)]),
+            {"user_id": user_ids[index % len(user_ids)],
+             "reply_content": 'api reply'})),
+        ('POST posts/<id>/reactions/', lambda index: post_json(
+            '/fb_post/posts/{}/reactions/'.format(viral_post_id),
+            {"user_id": user_ids[index % len(user_ids)],
+             "reaction_type": 'LO'})),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=REQUEST_COUNT)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        from django.test import Client
+        from django.test.utils import setup_test_environment
+
+        setup_test_environment()
+        data = generate_dataset(args.scale)
+        client = Client()
+        print('{:<36} {:>12}'.format('endpoint', 'requests/s'))
+        for name, send in get_cases(client, data):
+            print('{:<36} {:>12.0f}'.format(
+                name, requests_per_second(send, args.requests)))
+
+
+if __name__ == '__main__':
+    main()
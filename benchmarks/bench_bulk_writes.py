@@ -0,0 +1,67 @@
+"""
+Rows per second of the bulk write API against the single-row functions.
+
+    python -m benchmarks.bench_bulk_writes
+"""
+import time
+
+from benchmarks import benchmark_database
+
+ROW_COUNT = 20000
+SINGLE_ROW_COUNT = 1000
+USER_COUNT = 500
+
+
+def rows_per_second(func, rows):
+    start = time.perf_counter()
+    func()
+    return rows / (time.perf_counter() - start)
+
+
+def main():
+    with benchmark_database():
+        from fb_post.models import User
+        from fb_post.utils import bulk_create_comments, bulk_create_posts, \
+            bulk_react, create_post, react_to_post
+
+        user_ids = [user.id for user in User.objects.bulk_create(
+            User(name='writer', profile_pic='https://x.y/z')
+            for _ in range(USER_COUNT))]
+
+        single_posts = rows_per_second(
+            lambda: [create_post(user_ids[index % USER_COUNT], 'post')
+                     for index in range(SINGLE_ROW_COUNT)], SINGLE_ROW_COUNT)
+        post_ids = []
+        bulk_posts = rows_per_second(lambda: post_ids.extend(
+            bulk_create_posts({'user_id': user_ids[index % USER_COUNT],
+                               'post_content': 'post'}
+                              for index in range(ROW_COUNT))[0]), ROW_COUNT)
+
+        bulk_comments = rows_per_second(lambda: bulk_create_comments(
+            {'user_id': user_ids[index % USER_COUNT],
+             'post_id': post_ids[index % len(post_ids)],
+             'comment_content': 'comment'}
+            for index in range(ROW_COUNT)), ROW_COUNT)
+
+        single_reactions = rows_per_second(
+            lambda: [react_to_post(user_ids[index % USER_COUNT],
+                                   post_ids[index // USER_COUNT], 'HA')
+                     for index in range(SINGLE_ROW_COUNT)], SINGLE_ROW_COUNT)
+        bulk_reactions = rows_per_second(lambda: bulk_react(
+            {'user_id': user_ids[index % USER_COUNT],
+             'post_id': post_ids[-1 - index // USER_COUNT],
+             'reaction_type': 'LO'}
+            for index in range(ROW_COUNT)), ROW_COUNT)
+
+        print('{:<10} {:>12} {:>12}'.format('rows/s', 'single', 'bulk'))
+        print('{:<10} {:>12.0f} {:>12.0f}'.format('posts', single_posts,
+                                                  bulk_posts))
+        print('{:<10} {:>12} {:>12.0f}'.format('comments', '-',
+                                               bulk_comments))
+        print('{:<10} {:>12.0f} {:>12.0f}'.format('reactions',
+                                                  single_reactions,
+                                                  bulk_reactions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Feed requests per second with 100, 500 and 1000 concurrent HTTP clients.
+
+    python -m benchmarks.bench_concurrency [--scale 1] [--duration 5]
+
+Seeds a temporary SQLite file and serves it from a local server process:
+
+``wsgi``        Django's threaded WSGI server (runserver's), sync views
+``asgi``        uvicorn running asgi.py, async views under /fb_post/async/
+``asgi sync``   uvicorn running asgi.py, sync views
+
+Every client keeps one HTTP/1.1 connection open and requests one page of a
+user's posts after another. uvicorn is needed for the ASGI rows.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks import benchmark_file_database
+
+DEFAULT_CLIENTS = (100, 500, 1000)
+DEFAULT_DURATION = 5
+SERVER_BACKLOG = 2048
+FEED_PATHS = {
+    'wsgi': '/fb_post/users/{}/posts/?page_size=20',
+    'asgi': '/fb_post/async/users/{}/posts/?page_size=20',
+    'asgi sync': '/fb_post/users/{}/posts/?page_size=20',
+}
+
+
+def serve(server, port):
+    if server == 'wsgi':
+        from django.core.servers.basehttp import run, WSGIServer
+        from django.core.wsgi import get_wsgi_application
+
+        class BenchmarkWSGIServer(WSGIServer):
+            request_queue_size = SERVER_BACKLOG
+
+        application = get_wsgi_application()
+        # One access log line per request would cost more than the views.
+        logging.getLogger('django.server').setLevel(logging.WARNING)
+        run('127.0.0.1', port, application, threading=True,
+            server_cls=BenchmarkWSGIServer)
+    else:
+        import uvicorn
+        uvicorn.run('testing_assignment_004.asgi:application',
+                    host='127.0.0.1', port=port, backlog=SERVER_BACKLOG,
+                    log_level='warning', access_log=False)
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server, environ):
+    port = get_free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-W', 'ignore', '-m', 'benchmarks.bench_concurrency',
+         '--serve', server, '--port', str(port)],
+        env=environ, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('{} server did not start'.format(server))
+
+
+async def read_response(reader):
+    """
+    :return: (status, keep alive) after reading the whole response
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+        return status, headers.get('connection', '').lower() != 'close'
+    await reader.read()
+    return status, False
+
+
+async def run_client(port, paths, deadline, latencies, errors):
+    connection = None
+    index = 0
+    while time.monotonic() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.monotonic()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection('127.0.0.1', port)
+            reader, writer = connection
+            writer.write('GET {} HTTP/1.1\r\nHost: 127.0.0.1\r\n\r\n'.format(
+                path).encode())
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append(1)
+            connection = None
+            continue
+        if status >= 400:
+            errors.append(status)
+        else:
+            latencies.append(time.monotonic() - start)
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+async def measure(port, paths, clients, duration):
+    latencies = []
+    errors = []
+    start = time.monotonic()
+    await asyncio.gather(*[
+        run_client(port, paths[client:] + paths[:client], start + duration,
+                   latencies, errors)
+        for client in range(clients)])
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    return {
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000
+        if latencies else 0,
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION,
+                        help='seconds per measurement')
+    parser.add_argument('--clients', type=int, nargs='+',
+                        default=DEFAULT_CLIENTS)
+    parser.add_argument('--servers', nargs='+', default=list(FEED_PATHS),
+                        choices=list(FEED_PATHS))
+    parser.add_argument('--serve', choices=('wsgi', 'asgi'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    servers = args.servers
+    try:
+        import uvicorn  # noqa: F401
+    except ImportError:
+        print('uvicorn is not installed; skipping the ASGI servers')
+        servers = [server for server in servers
+                   if not server.startswith('asgi')]
+
+    with benchmark_file_database():
+        from benchmarks.dataset import generate_dataset
+
+        user_ids = generate_dataset(args.scale)['user_ids']
+        environ = dict(os.environ)
+
+        print('{:<10} {:>8} {:>12} {:>9} {:>9} {:>7}'.format(
+            'server', 'clients', 'requests/s', 'p50 ms', 'p99 ms', 'errors'))
+        for server in servers:
+            paths = [FEED_PATHS[server].format(user_id)
+                     for user_id in user_ids]
+            process, port = start_server(server.split()[0], environ)
+            try:
+                asyncio.run(measure(port, paths, 10, 1))
+                for clients in args.clients:
+                    result = asyncio.run(measure(port, paths, clients,
+                                                 args.duration))
+                    print('{:<10} {:>8} {:>12.0f} {:>9.1f} {:>9.1f} '
+                          '{:>7}'.format(server, clients,
+                                         result['requests_per_second'],
+                                         result['p50_ms'], result['p99_ms'],
+                                         result['errors']))
+            finally:
+                process.terminate()
+                process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Latency of concurrent writers while a post with 100k reactions is deleted.
+
+    python -m benchmarks.bench_delete_post [--reactions 100000]
+
+``cascade`` deletes the post the way delete_post used to, with Django's
+collector in one transaction; ``tombstone`` is delete_post followed by
+purge_deleted_posts. Meanwhile another thread keeps toggling reactions on
+an unrelated post, and every toggle's latency is recorded. SQLite lets one
+writer in at a time, so a long delete transaction shows up directly as
+writer stalls.
+
+Both sides open write transactions with BEGIN IMMEDIATE; see
+benchmarks.begin_immediate.
+"""
+import argparse
+import threading
+import time
+
+from benchmarks import begin_immediate, benchmark_file_database
+
+REACTION_COUNT = 100000
+COMMENT_COUNT = 2000
+REACTIONS_PER_COMMENT = 10
+# Pause between two writes; a writer without one saturates SQLite's single
+# write lock and starves any other writer, deleting or not.
+WRITE_INTERVAL = 0.005
+
+
+def build_viral_post(author_id, user_ids, reaction_count):
+    from datetime import datetime
+    from django.db import connection, transaction
+    from fb_post.models import Comment, Post, React
+    from fb_post.reactions import add_to_total_reaction_count
+    from fb_post.seeding import insert_rows
+    from fb_post.utils import set_comment_paths
+
+    now = datetime.now()
+    reacted_at = React._meta.get_field('reacted_at').get_db_prep_save(
+        now, connection)
+    with transaction.atomic():
+        post = Post.objects.create(content='viral', posted_at=now,
+                                   posted_by_id=author_id)
+        comments = Comment.objects.bulk_create(
+            Comment(content='comment', commented_at=now,
+                    commented_by_id=user_ids[index], post=post)
+            for index in range(COMMENT_COUNT))
+        set_comment_paths([comment.id for comment in comments])
+        rows = [(post.id, None, user_id, 'LO', reacted_at)
+                for user_id in user_ids[:reaction_count]]
+        rows += [(None, comment.id, user_id, 'HA', reacted_at)
+                 for comment in comments
+                 for user_id in user_ids[:REACTIONS_PER_COMMENT]]
+        insert_rows(React, ('post', 'comment', 'reacted_by', 'reaction',
+                            'reacted_at'), rows, 2000)
+        add_to_total_reaction_count(len(rows))
+    return post.id, len(rows)
+
+
+def write_until(done, user_ids, post_id, latencies):
+    from django.db import connection
+    from fb_post.utils import react_to_post
+
+    index = 0
+    while not done.is_set():
+        start = time.perf_counter()
+        react_to_post(user_ids[index % len(user_ids)], post_id, 'LI')
+        latencies.append((time.perf_counter() - start) * 1000)
+        index += 1
+        time.sleep(WRITE_INTERVAL)
+    connection.close()
+
+
+def measure(delete, user_ids, post_id):
+    latencies = []
+    done = threading.Event()
+    writer = threading.Thread(target=write_until,
+                              args=(done, user_ids, post_id, latencies))
+    writer.start()
+    time.sleep(0.5)
+    before = len(latencies)
+    start = time.perf_counter()
+    delete()
+    elapsed = time.perf_counter() - start
+    # The write blocked by the delete's last transaction only finishes
+    # after it, so stop the writer before counting.
+    done.set()
+    writer.join()
+    return elapsed, sorted(latencies[before:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--reactions', type=int, default=REACTION_COUNT)
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='purge batch size')
+    parser.add_argument('--pause', type=float, default=None,
+                        help='purge pause between batches, in seconds')
+    args = parser.parse_args()
+
+    with benchmark_file_database():
+        begin_immediate()
+        from fb_post.models import Post, User
+        from fb_post.purge import (
+            purge_deleted_posts, PURGE_BATCH_SIZE, PURGE_PAUSE)
+        from fb_post.utils import create_post, delete_post
+
+        batch_size = args.batch_size or PURGE_BATCH_SIZE
+        pause = PURGE_PAUSE if args.pause is None else args.pause
+        user_ids = [user.id for user in User.objects.bulk_create(
+            (User(name='user', profile_pic='https://x.y/z')
+             for _ in range(args.reactions)), batch_size=2000)]
+        author_id = user_ids[0]
+        other_post_id = create_post(author_id, 'busy post')
+
+        def cascade(post_id):
+            return lambda: Post.objects.filter(id=post_id).delete()
+
+        def tombstone(post_id):
+            def delete():
+                delete_post(author_id, post_id)
+                purge_deleted_posts(batch_size=batch_size,
+                                    pause=pause)
+            return delete
+
+        print('{:<10} {:>10} {:>8} {:>9} {:>9} {:>9}'.format(
+            'delete', 'rows', 'total s', 'writes', 'p99 ms', 'max ms'))
+        for name, make_delete in (('cascade', cascade),
+                                  ('tombstone', tombstone)):
+            post_id, rows = build_viral_post(author_id, user_ids,
+                                             args.reactions)
+            elapsed, latencies = measure(make_delete(post_id), user_ids,
+                                         other_post_id)
+            print('{:<10} {:>10} {:>8.2f} {:>9} {:>9.1f} {:>9.1f}'.format(
+                name, rows + COMMENT_COUNT + 1, elapsed, len(latencies),
+                latencies[int(len(latencies) * 0.99)] if latencies else 0,
+                latencies[-1] if latencies else 0))
+
+
+if __name__ == '__main__':
+    main()
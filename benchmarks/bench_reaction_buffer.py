@@ -0,0 +1,99 @@
+"""
+Reaction toggles per second on one viral post, written directly or through
+fb_post.reaction_buffer.
+
+    python -m benchmarks.bench_reaction_buffer [--threads 16] [--clicks 500]
+
+Every thread clicks reactions on the same post for a random user out of
+--users, so some users click more than once. ``direct`` is react_to_post
+with one transaction per click; ``buffered`` queues the clicks and
+``journaled`` also appends them to an fsynced journal first. Buffered
+timings include the final flush, so every click is in the database when
+the clock stops. All modes run with the validation cache on, leaving the
+writes as the cost that differs.
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks import begin_immediate, benchmark_file_database
+
+REACTION_TYPES = ('LI', 'LO', 'HA', 'WO')
+
+
+def click(user_ids, post_id, clicks, seed, latencies):
+    from django.db import connection
+    from fb_post.utils import react_to_post
+
+    rng = random.Random(seed)
+    for _ in range(clicks):
+        start = time.perf_counter()
+        react_to_post(rng.choice(user_ids), post_id,
+                      rng.choice(REACTION_TYPES))
+        latencies.append((time.perf_counter() - start) * 1000)
+    connection.close()
+
+
+def measure(user_ids, post_id, threads, clicks):
+    from fb_post.reaction_buffer import stop_reaction_buffer
+
+    latencies = []
+    workers = [threading.Thread(target=click, args=(user_ids, post_id,
+                                                    clicks, seed, latencies))
+               for seed in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    stop_reaction_buffer()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--clicks', type=int, default=500,
+                        help='clicks per thread')
+    parser.add_argument('--users', type=int, default=2000)
+    args = parser.parse_args()
+
+    with benchmark_file_database(), tempfile.TemporaryDirectory() as journals:
+        begin_immediate()
+        from django.test.utils import override_settings
+        from fb_post.models import React, User
+        from fb_post.utils import create_post
+
+        user_ids = [user.id for user in User.objects.bulk_create(
+            User(name='user', profile_pic='https://x.y/z')
+            for _ in range(args.users))]
+        modes = {
+            'direct': {},
+            'buffered': {'FB_POST_REACTION_BUFFER_ENABLED': True},
+            'journaled': {'FB_POST_REACTION_BUFFER_ENABLED': True,
+                          'FB_POST_REACTION_JOURNAL': os.path.join(
+                              journals, 'reactions.jsonl')},
+        }
+
+        print('{:<10} {:>8} {:>9} {:>9} {:>9} {:>9}'.format(
+            'mode', 'clicks', 'clicks/s', 'p50 ms', 'p99 ms', 'rows'))
+        for mode, overrides in modes.items():
+            post_id = create_post(user_ids[0], 'viral post')
+            with override_settings(FB_POST_VALIDATION_CACHE_SIZE=10000,
+                                   **overrides):
+                elapsed, latencies = measure(user_ids, post_id, args.threads,
+                                             args.clicks)
+            print('{:<10} {:>8} {:>9.0f} {:>9.2f} {:>9.2f} {:>9}'.format(
+                mode, len(latencies), len(latencies) / elapsed,
+                latencies[len(latencies) // 2],
+                latencies[int(len(latencies) * 0.99)],
+                React.objects.filter(post_id=post_id).count()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Reaction summary latency as one post goes viral.
+
+    python -m benchmarks.bench_reaction_summaries
+
+The post and one of its comments receive ``n`` reactions each. Summaries are
+served from the counter columns, so every column should stay flat as ``n``
+grows; the last column is the growth factor against the smallest size.
+"""
+from datetime import datetime
+
+from benchmarks import benchmark_database, time_call
+
+REACTION_SIZES = (1000, 10000, 100000)
+REACTION_TYPES = ('WO', 'LI', 'LO', 'HA', 'TU', 'TD', 'AN', 'SA')
+
+
+def main():
+    with benchmark_database():
+        from fb_post.models import Comment, Post, React, User
+        from fb_post.reactions import rebuild_reaction_counters
+        from fb_post.utils import get_posts, get_reactions_detail, \
+            get_reactions_detail_of_comments
+
+        author = User.objects.create(name='author', profile_pic='https://x.y/z')
+        post = Post.objects.create(content='viral', posted_at=datetime.now(),
+                                   posted_by=author)
+        comment = Comment.objects.create(content='first',
+                                         commented_at=datetime.now(),
+                                         commented_by=author, post=post)
+
+        print('{:>9} {:>12} {:>12} {:>12} {:>8}'.format(
+            'reactions', 'posts ms', 'comments ms', 'get_posts ms', 'growth'))
+        first_timing = None
+        for size in REACTION_SIZES:
+            existing = User.objects.count() - 1
+            users = User.objects.bulk_create(
+                User(name='fan', profile_pic='https://x.y/z')
+                for _ in range(size - existing))
+            reactions = []
+            for index, user in enumerate(users, start=existing):
+                reaction = REACTION_TYPES[index % len(REACTION_TYPES)]
+                reactions.append(React(post=post, reaction=reaction,
+                                       reacted_at=datetime.now(),
+                                       reacted_by=user))
+                reactions.append(React(comment=comment, reaction=reaction,
+                                       reacted_at=datetime.now(),
+                                       reacted_by=user))
+            React.objects.bulk_create(reactions, batch_size=2000)
+            rebuild_reaction_counters()
+
+            posts = time_call(get_reactions_detail, [post.id])
+            comments = time_call(get_reactions_detail_of_comments,
+                                 [comment.id])
+            document = time_call(get_posts, [post.id])
+            first_timing = first_timing or document
+            print('{:>9} {:>12.3f} {:>12.3f} {:>12.3f} {:>8.2f}'.format(
+                size, posts, comments, document, document / first_timing))
+
+
+if __name__ == '__main__':
+    main()
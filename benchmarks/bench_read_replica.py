@@ -0,0 +1,103 @@
+"""
+Feed read latency while reactions are written, with and without a read
+replica.
+
+    python -m benchmarks.bench_read_replica [--scale 5] [--duration 5]
+
+Reader threads build get_posts for ten random posts at a time inside
+fb_post.routers.replica_reads(), as a request would; writer threads toggle
+reactions on the viral post meanwhile. ``primary`` sends every read to the
+database being written; ``replica`` to a second SQLite file copied from it
+by sync_read_replica's copy before the run. SQLite blocks readers while a
+writer commits, which the replica avoids.
+"""
+import argparse
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks import begin_immediate, benchmark_file_database
+
+POSTS_PER_READ = 10
+
+
+def read_until(deadline, post_ids, seed, latencies):
+    from django.db import connections
+    from fb_post.routers import replica_reads
+    from fb_post.utils import get_posts
+
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        with replica_reads():
+            get_posts(rng.sample(post_ids, POSTS_PER_READ))
+        latencies.append((time.perf_counter() - start) * 1000)
+    connections.close_all()
+
+
+def write_until(deadline, user_ids, post_id, seed):
+    from django.db import connection
+    from fb_post.utils import react_to_post
+
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        react_to_post(rng.choice(user_ids), post_id, 'LI')
+    connection.close()
+
+
+def measure(dataset, readers, writers, duration):
+    latencies = []
+    deadline = time.monotonic() + duration
+    threads = [threading.Thread(target=read_until,
+                                args=(deadline, dataset['post_ids'], seed,
+                                      latencies))
+               for seed in range(readers)]
+    threads += [threading.Thread(target=write_until,
+                                 args=(deadline, dataset['user_ids'],
+                                       dataset['viral_post_id'], seed))
+                for seed in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scale', type=int, default=5)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['FB_POST_BENCHMARK_REPLICA_DB'] = os.path.join(
+            directory, 'replica.sqlite3')
+        with benchmark_file_database():
+            begin_immediate()
+            from django.core.management import call_command
+            from django.test.utils import override_settings
+            from benchmarks.dataset import generate_dataset
+
+            dataset = generate_dataset(args.scale)
+            call_command('sync_read_replica', stdout=io.StringIO())
+
+            print('{:<8} {:>8} {:>8} {:>9} {:>9}'.format(
+                'reads', 'reads/s', 'p50 ms', 'p99 ms', 'max ms'))
+            for mode, replicas in (('primary', []), ('replica', ['replica'])):
+                with override_settings(FB_POST_READ_REPLICAS=replicas):
+                    latencies = measure(dataset, args.readers, args.writers,
+                                        args.duration)
+                print('{:<8} {:>8.0f} {:>8.2f} {:>9.2f} {:>9.2f}'.format(
+                    mode, len(latencies) / args.duration,
+                    latencies[len(latencies) // 2],
+                    latencies[int(len(latencies) * 0.99)], latencies[-1]))
+
+
+if __name__ == '__main__':
+    main()
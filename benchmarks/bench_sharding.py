@@ -0,0 +1,101 @@
+"""
+Write throughput of several writer processes over 1, 2 and 4 database
+shards.
+
+    python -m benchmarks.bench_sharding [--writers 8] [--duration 5]
+
+Each writer process creates posts for random users and reacts to them,
+one transaction per call, until the deadline. The users are spread over
+the shards by fb_post.sharding, so with one shard every writer queues for
+the lock of one SQLite file and with N shards the writes split over N
+files. Each shard count runs in a fresh interpreter, as settings are read
+once per process.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks import begin_immediate, benchmark_file_database
+
+DEFAULT_SHARDS = (1, 2, 4)
+REACTIONS_PER_POST = 4
+
+
+def write_until(deadline, user_ids, seed, operations):
+    from fb_post.utils import create_post, react_to_post
+
+    begin_immediate()
+    rng = random.Random(seed)
+    count = 0
+    while time.monotonic() < deadline:
+        post_id = create_post(rng.choice(user_ids), 'sharded post')
+        for _ in range(REACTIONS_PER_POST):
+            react_to_post(rng.choice(user_ids), post_id, 'LI')
+        count += 1 + REACTIONS_PER_POST
+    operations.put(count)
+
+
+def run(shards, writers, duration, users):
+    os.environ['FB_POST_BENCHMARK_SHARDS'] = str(shards)
+    with benchmark_file_database():
+        from django.core.management import call_command
+        from django.db import connections
+        from fb_post.models import Post
+        from fb_post.sharding import create_user, for_each_shard, get_shards
+
+        for alias in get_shards()[1:]:
+            call_command('migrate', database=alias, verbosity=0)
+        user_ids = [create_user('user', 'https://x.y/z')
+                    for _ in range(users)]
+        # Forked writers must not share the parent's connections.
+        connections.close_all()
+
+        context = multiprocessing.get_context('fork')
+        operations = context.Queue()
+        deadline = time.monotonic() + duration
+        processes = [context.Process(target=write_until,
+                                     args=(deadline, user_ids, seed,
+                                           operations))
+                     for seed in range(writers)]
+        for process in processes:
+            process.start()
+        total = sum(operations.get() for _ in processes)
+        for process in processes:
+            process.join()
+        posts = for_each_shard(lambda: Post.objects.count())
+        print('{:<8} {:>8} {:>8.0f} {:>20}'.format(
+            shards, total, total / duration,
+            '/'.join(str(count) for count in posts)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--shards', type=int, nargs='+',
+                        default=DEFAULT_SHARDS)
+    parser.add_argument('--run', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.shards[0], args.writers, args.duration, args.users)
+        return
+    print('{:<8} {:>8} {:>8} {:>20}'.format(
+        'shards', 'writes', 'writes/s', 'posts per shard'))
+    for shards in args.shards:
+        # Output goes straight to the terminal, row by row.
+        subprocess.run([sys.executable, '-m', 'benchmarks.bench_sharding',
+                        '--run', '--shards', str(shards),
+                        '--writers', str(args.writers),
+                        '--duration', str(args.duration),
+                        '--users', str(args.users)], check=True)
+
+
+if __name__ == '__main__':
+    main()
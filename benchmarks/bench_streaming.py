@@ -0,0 +1,56 @@
+"""
+Peak Python memory of get_user_posts against iter_user_posts.
+
+    python -m benchmarks.bench_streaming
+
+Each post carries a few comments and replies. The list version holds every
+document at once; the streaming version should peak at about one chunk.
+"""
+import tracemalloc
+from datetime import datetime
+
+from benchmarks import benchmark_database
+
+POST_COUNTS = (500, 2000, 8000)
+COMMENTS_PER_POST = 3
+
+
+def measure_peak(consume):
+    tracemalloc.start()
+    consume()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1024 / 1024
+
+
+def main():
+    with benchmark_database():
+        from fb_post.models import Comment, Post, User
+        from fb_post.utils import get_user_posts, iter_user_posts
+
+        user = User.objects.create(name='archivist',
+                                   profile_pic='https://x.y/z')
+        print('{:>7} {:>10} {:>12}'.format('posts', 'list MiB',
+                                           'stream MiB'))
+        for size in POST_COUNTS:
+            posts = Post.objects.bulk_create(
+                Post(content='post ' * 20, posted_at=datetime.now(),
+                     posted_by=user)
+                for _ in range(size - Post.objects.count()))
+            comments = Comment.objects.bulk_create(
+                Comment(content='comment ' * 10, commented_at=datetime.now(),
+                        commented_by=user, post=post)
+                for post in posts for _ in range(COMMENTS_PER_POST))
+            Comment.objects.bulk_create(
+                Comment(content='reply ' * 10, commented_at=datetime.now(),
+                        commented_by=user, parent_comment=comment)
+                for comment in comments)
+
+            listed = measure_peak(lambda: get_user_posts(user.id))
+            streamed = measure_peak(
+                lambda: sum(1 for _ in iter_user_posts(user.id)))
+            print('{:>7} {:>10.2f} {:>12.2f}'.format(size, listed, streamed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Existence-check latency as the Post table grows.
+
+    python -m benchmarks.bench_validation
+
+``full scan`` is the membership test the validators used to run
+(``id in Post.objects.values_list('id', flat=True)``); the other columns go
+through fb_post.validation. Indexed checks should stay flat across sizes.
+"""
+from datetime import datetime
+
+from benchmarks import benchmark_database, time_call
+
+TABLE_SIZES = (1000, 10000, 100000)
+BATCH_SIZE = 50
+
+
+def main():
+    with benchmark_database():
+        from fb_post.models import Post, User
+        from fb_post.validation import get_missing_ids
+
+        user = User.objects.create(name='bench', profile_pic='https://x.y/z')
+        print('{:>8} {:>14} {:>14} {:>14}'.format(
+            'posts', 'full scan ms', 'single ms',
+            '{} ids ms'.format(BATCH_SIZE)))
+        for size in TABLE_SIZES:
+            missing = size - Post.objects.count()
+            Post.objects.bulk_create(
+                Post(content='post', posted_at=datetime.now(), posted_by=user)
+                for _ in range(missing))
+            last_id = Post.objects.order_by('-id').values_list(
+                'id', flat=True)[0]
+            batch = list(range(last_id - BATCH_SIZE + 1, last_id + 1))
+
+            full_scan = time_call(
+                lambda: last_id in Post.objects.values_list('id', flat=True),
+                repeat=5)
+            single = time_call(get_missing_ids, Post, [last_id])
+            batched = time_call(get_missing_ids, Post, batch)
+            print('{:>8} {:>14.3f} {:>14.3f} {:>14.3f}'.format(
+                size, full_scan, single, batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Deterministic synthetic fb_post data for benchmarks.
+
+``generate_dataset(scale)`` seeds ``USERS_PER_SCALE * scale`` users through
+``fb_post.seeding.seed_graph`` (power-law posts per user, comment and reply
+trees, heavy-tailed reactions) and picks the hottest inputs for the cases:
+the author with most posts, the post with most reactions and the comment
+with most replies. The same ``scale`` and ``seed`` always produce the same
+rows.
+"""
+USERS_PER_SCALE = 100
+
+
+def generate_dataset(scale, seed=0):
+    """
+    :param scale: multiplier of the base size; rows grow roughly linearly
+    :param seed:
+    :return: dict of the generated ids and row counts
+    """
+    from django.db.models import Count
+    from fb_post.models import Comment, Post, React, User
+    from fb_post.seeding import seed_graph
+
+    counts = seed_graph(USERS_PER_SCALE * scale, seed=seed)
+    heavy_user_id = Post.objects.values('posted_by_id').annotate(
+        posts=Count('id')).order_by('-posts', 'posted_by_id')[0][
+        'posted_by_id']
+    viral_post_id = Post.objects.order_by(
+        '-reactions_count', 'id').values_list('id', flat=True)[0]
+    viral_comment_id = Comment.objects.filter(post__isnull=False).annotate(
+        replies=Count('comment')).order_by('-replies', 'id').values_list(
+        'id', flat=True)[0]
+
+    return {
+        'user_ids': list(User.objects.order_by('id').values_list(
+            'id', flat=True)),
+        'post_ids': list(Post.objects.order_by('id').values_list(
+            'id', flat=True)),
+        'comment_ids': list(Comment.objects.filter(
+            post__isnull=False).order_by('id').values_list('id', flat=True)),
+        'reply_ids': list(Comment.objects.filter(
+            parent_comment__isnull=False).order_by('id').values_list(
+            'id', flat=True)),
+        'heavy_user_id': heavy_user_id,
+        'viral_post_id': viral_post_id,
+        'viral_comment_id': viral_comment_id,
+        'rows': (counts['users'] + counts['posts'] + counts['comments'] +
+                 React.objects.count()),
+    }
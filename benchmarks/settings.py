@@ -0,0 +1,31 @@
+"""
+Project settings for benchmarks with several connections or a separate
+server process: production-like DEBUG and the database file named by the
+FB_POST_BENCHMARK_DB environment variable, with a lock timeout long enough
+that blocked writers wait instead of failing. FB_POST_BENCHMARK_REPLICA_DB
+adds a read replica file, FB_POST_BENCHMARK_SHARDS=N database shards in
+files next to it.
+"""
+import os
+
+from testing_assignment_004.settings import *  # noqa: F401,F403
+from testing_assignment_004.settings import DATABASES
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+DATABASES = {
+    'default': dict(DATABASES['default'],
+                    NAME=os.environ['FB_POST_BENCHMARK_DB'],
+                    OPTIONS={'timeout': 60}),
+}
+FB_POST_READ_REPLICAS = []
+if os.environ.get('FB_POST_BENCHMARK_REPLICA_DB'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'], NAME=os.environ['FB_POST_BENCHMARK_REPLICA_DB'])
+    FB_POST_READ_REPLICAS = ['replica']
+FB_POST_SHARDS = ['default']
+for index in range(1, int(os.environ.get('FB_POST_BENCHMARK_SHARDS', 1))):
+    DATABASES['shard_{}'.format(index)] = dict(
+        DATABASES['default'], NAME='{}.shard_{}'.format(
+            os.environ['FB_POST_BENCHMARK_DB'], index))
+    FB_POST_SHARDS.append('shard_{}'.format(index))
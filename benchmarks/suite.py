@@ -0,0 +1,275 @@
+"""
+Scaling benchmark for every public function of fb_post.utils.
+
+    python -m benchmarks.suite [--scales 1 4 16] [--output results.json]
+    python -m benchmarks.suite --write-baseline
+
+For every scale a fresh database is filled by ``benchmarks.dataset`` and each
+case is timed on its hottest input (the viral post, the heaviest author, the
+most replied comment). A function is flagged when
+
+* its median is more than ``--tolerance`` times the stored baseline at the
+  same scale, or
+* the slope of log(latency) over log(scale) exceeds its expected growth
+  exponent by more than ``GROWTH_SLACK`` (0 = flat, 1 = linear in the data).
+
+Public functions without a case are reported too, so new ones cannot slip
+past the suite. The exit status is 1 when anything was flagged.
+"""
+import argparse
+import inspect
+import json
+import math
+import os
+import sys
+import time
+import warnings
+from itertools import count
+
+from benchmarks import benchmark_database
+from benchmarks.dataset import generate_dataset
+
+DEFAULT_SCALES = (1, 4, 16)
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_TOLERANCE = 1.5
+GROWTH_SLACK = 0.35
+TIME_BUDGET = 0.2
+MIN_REPEAT = 5
+MAX_REPEAT = 200
+BULK_RECORDS = 100
+PAGE_POSTS = 50
+
+# Building blocks the cases reach through other functions.
+HELPERS = {'get_record_errors', 'set_comment_paths',
+           'get_reactions_details_list', 'get_chunks', 'get_reply_details',
+           'validate_post_content', 'validate_comment_content',
+           'validate_reaction_type', 'get_timestamp', 'load_post_documents'}
+
+
+def read_cases(data):
+    """
+    :return: {function name: (expected growth exponent, zero-argument call)}
+    """
+    from fb_post import utils
+
+    post_id = data['viral_post_id']
+    post_ids = data['post_ids'][:PAGE_POSTS]
+    comment_id = data['viral_comment_id']
+    user_id = data['heavy_user_id']
+    return {
+        'validate_post': (0, lambda: utils.validate_post(post_id)),
+        'validate_posts': (0, lambda: utils.validate_posts(post_ids)),
+        'validate_user': (0, lambda: utils.validate_user(user_id)),
+        'validate_comment': (0, lambda: utils.validate_comment(comment_id)),
+        'get_total_reaction_count': (0, utils.get_total_reaction_count),
+        'get_reaction_metrics': (
+            0, lambda: utils.get_reaction_metrics(post_id)),
+        'get_posts_with_more_positive_reactions': (
+            0, lambda: utils.get_posts_with_more_positive_reactions(
+                limit=PAGE_POSTS, order_by_margin=True)),
+        'get_posts_reacted_by_user': (
+            1, lambda: utils.get_posts_reacted_by_user(user_id)),
+        'get_reactions_to_post': (
+            1, lambda: utils.get_reactions_to_post(post_id)),
+        'get_reactions_detail': (
+            0, lambda: utils.get_reactions_detail(post_ids)),
+        'get_reactions_detail_of_comments': (
+            0, lambda: utils.get_reactions_detail_of_comments([comment_id])),
+        'get_reactions_detail_of_comments_replies': (
+            0, lambda: utils.get_reactions_detail_of_comments_replies(
+                [comment_id])),
+        'get_replieses_details': (
+            0, lambda: utils.get_replieses_details([comment_id])),
+        'get_comments_details': (
+            0, lambda: utils.get_comments_details(post_ids)),
+        'get_posts': (0, lambda: utils.get_posts(post_ids)),
+        'build_posts': (0, lambda: utils.build_posts(post_ids)),
+        'get_user_posts': (1, lambda: utils.get_user_posts(user_id)),
+        'iter_posts': (0, lambda: list(utils.iter_posts(post_ids))),
+        'iter_user_posts': (1, lambda: list(utils.iter_user_posts(user_id))),
+        'get_user_posts_page': (
+            0, lambda: utils.get_user_posts_page(user_id)),
+        'get_replies_for_comments': (
+            1, lambda: utils.get_replies_for_comments(comment_id)),
+        'get_replies_for_comments_page': (
+            0, lambda: utils.get_replies_for_comments_page(comment_id)),
+        'get_comment_thread': (
+            0, lambda: utils.get_comment_thread(comment_id)),
+    }
+
+
+def write_cases(data):
+    """
+    Writes go to a quiet author and a quiet post, so they do not inflate
+    the inputs of the read cases.
+    """
+    from fb_post import utils
+
+    user_id = data['user_ids'][-1]
+    post_id = data['post_ids'][-1]
+    comment_id = data['comment_ids'][-1]
+    user_ids = data['user_ids'][:BULK_RECORDS]
+    reactions = ('WO', 'LI')
+    toggles = count()
+    doomed_post_ids = iter(utils.bulk_create_posts(
+        {'user_id': user_id, 'post_content': 'doomed'}
+        for _ in range(MAX_REPEAT + 1))[0])
+
+    return {
+        'create_post': (0, lambda: utils.create_post(user_id, 'post')),
+        'create_comment': (
+            0, lambda: utils.create_comment(user_id, post_id, 'comment')),
+        'reply_to_comment': (
+            0, lambda: utils.reply_to_comment(user_id, comment_id, 'reply')),
+        'react_to_post': (0, lambda: utils.react_to_post(
+            user_id, post_id, reactions[next(toggles) % 2])),
+        'react_to_comment': (0, lambda: utils.react_to_comment(
+            user_id, comment_id, reactions[next(toggles) % 2])),
+        'delete_post': (
+            0, lambda: utils.delete_post(user_id, next(doomed_post_ids))),
+        'bulk_create_posts': (0, lambda: utils.bulk_create_posts(
+            {'user_id': reactor_id, 'post_content': 'bulk'}
+            for reactor_id in user_ids)),
+        'bulk_create_comments': (0, lambda: utils.bulk_create_comments(
+            {'user_id': reactor_id, 'post_id': post_id,
+             'comment_content': 'bulk'} for reactor_id in user_ids)),
+        'bulk_react': (0, lambda: utils.bulk_react(
+            {'user_id': reactor_id, 'post_id': post_id,
+             'reaction_type': 'HA'} for reactor_id in user_ids)),
+    }
+
+
+def time_case(call):
+    """
+    Repeats ``call`` until TIME_BUDGET is spent, within MIN_REPEAT and
+    MAX_REPEAT runs, after one warm-up run.
+    :return: median wall time in milliseconds
+    """
+    call()
+    timings = []
+    deadline = time.perf_counter() + TIME_BUDGET
+    while len(timings) < MAX_REPEAT and (
+            len(timings) < MIN_REPEAT or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def get_growth_exponent(timings):
+    """
+    :param timings: {scale: milliseconds}
+    :return: least-squares slope of log(milliseconds) over log(scale)
+    """
+    points = [(math.log(scale), math.log(max(milliseconds, 1e-6)))
+              for scale, milliseconds in timings.items()]
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if spread == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def get_uncovered_functions(names):
+    from fb_post import utils
+
+    public = {name for name, member in inspect.getmembers(
+        utils, inspect.isfunction)
+        if member.__module__ == utils.__name__ and not name.startswith('_')}
+    return sorted(public - HELPERS - set(names))
+
+
+def run(scales):
+    """
+    :return: {"scales", "rows": {scale: rows},
+              "functions": {name: {"expected_exponent", "ms": {scale: ms}}}}
+    """
+    results = {'scales': list(scales), 'rows': {}, 'functions': {}}
+    for scale in scales:
+        with benchmark_database():
+            data = generate_dataset(scale)
+            results['rows'][str(scale)] = data['rows']
+            for cases in (read_cases, write_cases):
+                for name, (exponent, call) in cases(data).items():
+                    function = results['functions'].setdefault(
+                        name, {'expected_exponent': exponent, 'ms': {}})
+                    function['ms'][str(scale)] = time_case(call)
+        print('scale {:>3}: {} rows'.format(scale, data['rows']),
+              file=sys.stderr)
+    return results
+
+
+def get_flags(results, baseline, tolerance):
+    """
+    :return: list of human readable problems, empty when all is well
+    """
+    flags = ['{}: no benchmark case'.format(name)
+             for name in get_uncovered_functions(results['functions'])]
+    for name, function in sorted(results['functions'].items()):
+        timings = {int(scale): ms for scale, ms in function['ms'].items()}
+        exponent = function['exponent'] = get_growth_exponent(timings)
+        if exponent > function['expected_exponent'] + GROWTH_SLACK:
+            flags.append('{}: grows as scale^{:.2f}, expected ^{}'.format(
+                name, exponent, function['expected_exponent']))
+        baseline_ms = baseline.get('functions', {}).get(name, {}).get('ms', {})
+        for scale in results['scales']:
+            ms = function['ms'][str(scale)]
+            if str(scale) in baseline_ms and \
+                    ms > baseline_ms[str(scale)] * tolerance:
+                flags.append('{}: {:.3f} ms at scale {}, baseline {:.3f} ms'
+                             .format(name, ms, scale, baseline_ms[str(scale)]))
+    return flags
+
+
+def print_table(results):
+    scales = [str(scale) for scale in results['scales']]
+    print('{:<42}'.format('function') +
+          ''.join('{:>11}'.format('x{} ms'.format(scale))
+                  for scale in scales) +
+          '{:>9}'.format('growth'))
+    for name, function in sorted(results['functions'].items()):
+        print('{:<42}'.format(name) +
+              ''.join('{:>11.3f}'.format(function['ms'][scale])
+                      for scale in scales) +
+              '{:>9.2f}'.format(function['exponent']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', type=int, nargs='+',
+                        default=DEFAULT_SCALES)
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown against the baseline')
+    parser.add_argument('--write-baseline', action='store_true',
+                        help='store these results as the new baseline')
+    args = parser.parse_args(argv)
+    # The dataset uses the same naive timestamps as fb_post.utils.
+    warnings.filterwarnings('ignore', category=RuntimeWarning,
+                            message='.*received a naive datetime')
+
+    results = run(args.scales)
+    baseline = {}
+    if not args.write_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    flags = get_flags(results, baseline, args.tolerance)
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(dict(results, flags=flags), output_file, indent=2,
+                      sort_keys=True)
+    if args.write_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+    for flag in flags:
+        print('FLAG ' + flag)
+    return 1 if flags else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class FbPostConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fb_post'
+
+    def ready(self):
+        from fb_post.sharding import check_shard_vendors, \
+            end_migration_routing, reserve_id_ranges, route_migrations
+
+        check_shard_vendors()
+        pre_migrate.connect(route_migrations, sender=self)
+        post_migrate.connect(reserve_id_ranges, sender=self)
+        post_migrate.connect(end_migration_routing, sender=self)
@@ -0,0 +1,21 @@
+from django.urls import path
+
+from fb_post import async_views
+
+urlpatterns = [
+    path('posts/', async_views.posts, name='async_posts'),
+    path('posts/<int:post_id>/', async_views.post, name='async_post'),
+    path('posts/<int:post_id>/comments/', async_views.post_comments,
+         name='async_post_comments'),
+    path('posts/<int:post_id>/reactions/', async_views.post_reactions,
+         name='async_post_reactions'),
+    path('posts/<int:post_id>/reaction-metrics/',
+         async_views.post_reaction_metrics,
+         name='async_post_reaction_metrics'),
+    path('users/<int:user_id>/posts/', async_views.user_posts,
+         name='async_user_posts'),
+    path('comments/<int:comment_id>/replies/', async_views.comment_replies,
+         name='async_comment_replies'),
+    path('comments/<int:comment_id>/reactions/',
+         async_views.comment_reactions, name='async_comment_reactions'),
+]
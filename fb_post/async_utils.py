@@ -0,0 +1,79 @@
+"""
+Async counterparts of the fb_post.utils read functions and the comment and
+reaction writes, for async views served under ASGI.
+
+Each ``a<name>`` runs ``<name>`` on a shared pool of
+FB_POST_ASYNC_WORKERS threads, so slow feed builds overlap with each other
+instead of queueing on the single thread Django runs sync views on under
+ASGI. Like a request, every call starts and ends with
+close_old_connections(), so a worker thread keeps its database connection
+no longer than CONN_MAX_AGE allows.
+
+Generators (iter_posts, iter_user_posts) have no counterpart: they hold a
+cursor on the thread that started them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from fb_post import utils
+
+DEFAULT_ASYNC_WORKERS = 8
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'FB_POST_ASYNC_WORKERS',
+                                        DEFAULT_ASYNC_WORKERS),
+                    thread_name_prefix='fb_post')
+    return _executor
+
+
+def run_in_worker(func):
+    @wraps(func)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await sync_to_async(call, thread_sensitive=False,
+                                   executor=get_executor())(*args, **kwargs)
+    return wrapper
+
+
+avalidate_user = run_in_worker(utils.validate_user)
+avalidate_posts = run_in_worker(utils.validate_posts)
+
+aget_posts = run_in_worker(utils.get_posts)
+aget_user_posts = run_in_worker(utils.get_user_posts)
+aget_user_posts_page = run_in_worker(utils.get_user_posts_page)
+aget_replies_for_comments = run_in_worker(utils.get_replies_for_comments)
+aget_replies_for_comments_page = run_in_worker(
+    utils.get_replies_for_comments_page)
+aget_comment_thread = run_in_worker(utils.get_comment_thread)
+aget_reactions_to_post = run_in_worker(utils.get_reactions_to_post)
+aget_reaction_metrics = run_in_worker(utils.get_reaction_metrics)
+aget_total_reaction_count = run_in_worker(utils.get_total_reaction_count)
+aget_posts_reacted_by_user = run_in_worker(utils.get_posts_reacted_by_user)
+aget_posts_with_more_positive_reactions = run_in_worker(
+    utils.get_posts_with_more_positive_reactions)
+
+acreate_comment = run_in_worker(utils.create_comment)
+areply_to_comment = run_in_worker(utils.reply_to_comment)
+areact_to_post = run_in_worker(utils.react_to_post)
+areact_to_comment = run_in_worker(utils.react_to_comment)
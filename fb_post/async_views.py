@@ -0,0 +1,140 @@
+"""
+Async versions of the fb_post.views endpoints, mounted under /fb_post/async/.
+Under ASGI they await fb_post.async_utils, so concurrent requests share its
+worker pool; the sync views would all run on one thread there. Under WSGI
+prefer the sync views, which skip the event loop round trip.
+
+Responses are built in full instead of streamed, since the streaming
+generators cannot move between worker threads. Django 4.2's view
+decorators do not wrap coroutines, so async_api_view does the method
+check, CSRF exemption, error mapping and conditional GET itself.
+"""
+from calendar import timegm
+from functools import wraps
+
+from django.http import HttpResponseNotAllowed
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from fb_post import async_utils, utils
+from fb_post.async_utils import run_in_worker
+from fb_post.views import ERROR_STATUSES, InvalidRequestBody, \
+    json_response, error_response, reaction_response, get_body, get_int, \
+    get_int_list, get_single_post_validators, get_post_list_validators, \
+    get_user_posts_validators
+
+
+def async_api_view(methods, get_validators=None):
+    """
+    :param methods: allowed HTTP methods
+    :param get_validators: as for views.conditional, run in the worker pool
+        for GET and HEAD
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            etag = last_modified = None
+            try:
+                if get_validators is not None and \
+                        request.method in ('GET', 'HEAD'):
+                    validators = await run_in_worker(get_validators)(
+                        request, *args, **kwargs)
+                    if validators:
+                        etag = quote_etag(validators[0])
+                        if validators[1] is not None:
+                            last_modified = timegm(
+                                validators[1].utctimetuple())
+                        response = get_conditional_response(
+                            request, etag=etag, last_modified=last_modified)
+                        if response is not None:
+                            return response
+                response = await view(request, *args, **kwargs)
+            except InvalidRequestBody as error:
+                return error_response(error, 400)
+            except tuple(ERROR_STATUSES) as error:
+                return error_response(error, ERROR_STATUSES[type(error)])
+            if last_modified and not response.has_header('Last-Modified'):
+                response.headers['Last-Modified'] = http_date(last_modified)
+            if etag:
+                response.headers.setdefault('ETag', etag)
+            return response
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+@async_api_view(['GET'], get_post_list_validators)
+async def posts(request):
+    post_ids = get_int_list(request, 'ids')
+    return json_response(await async_utils.aget_posts(
+        post_ids, native_timestamps=True))
+
+
+@async_api_view(['GET'], get_single_post_validators)
+async def post(request, post_id):
+    documents = await async_utils.aget_posts([post_id],
+                                             native_timestamps=True)
+    return json_response(documents[0])
+
+
+@async_api_view(['POST'])
+async def post_comments(request, post_id):
+    user_id, comment_content = get_body(request, 'user_id', 'comment_content')
+    comment_id = await async_utils.acreate_comment(user_id, post_id,
+                                                   comment_content)
+    return json_response({"comment_id": comment_id}, status=201)
+
+
+@async_api_view(['GET', 'POST'], get_single_post_validators)
+async def post_reactions(request, post_id):
+    if request.method == 'POST':
+        user_id, reaction_type = get_body(request, 'user_id', 'reaction_type')
+        action = await async_utils.areact_to_post(user_id, post_id,
+                                                  reaction_type)
+        return reaction_response(action)
+
+    return json_response(await async_utils.aget_reactions_to_post(post_id))
+
+
+@async_api_view(['GET'], get_single_post_validators)
+async def post_reaction_metrics(request, post_id):
+    return json_response(await async_utils.aget_reaction_metrics(post_id))
+
+
+@async_api_view(['GET'], get_user_posts_validators)
+async def user_posts(request, user_id):
+    if 'page_size' in request.GET or 'cursor' in request.GET:
+        page_size = get_int(request, 'page_size', utils.DEFAULT_PAGE_SIZE)
+        return json_response(await async_utils.aget_user_posts_page(
+            user_id, page_size, request.GET.get('cursor'),
+            native_timestamps=True))
+
+    return json_response(await async_utils.aget_user_posts(
+        user_id, native_timestamps=True))
+
+
+@async_api_view(['GET', 'POST'])
+async def comment_replies(request, comment_id):
+    if request.method == 'POST':
+        user_id, reply_content = get_body(request, 'user_id', 'reply_content')
+        reply_id = await async_utils.areply_to_comment(user_id, comment_id,
+                                                       reply_content)
+        return json_response({"comment_id": reply_id}, status=201)
+
+    if 'page_size' in request.GET or 'cursor' in request.GET:
+        page_size = get_int(request, 'page_size', utils.DEFAULT_PAGE_SIZE)
+        return json_response(await async_utils.aget_replies_for_comments_page(
+            comment_id, page_size, request.GET.get('cursor'),
+            native_timestamps=True))
+    return json_response(await async_utils.aget_replies_for_comments(
+        comment_id, native_timestamps=True))
+
+
+@async_api_view(['POST'])
+async def comment_reactions(request, comment_id):
+    user_id, reaction_type = get_body(request, 'user_id', 'reaction_type')
+    action = await async_utils.areact_to_comment(user_id, comment_id,
+                                                 reaction_type)
+    return reaction_response(action)
@@ -7,7 +7,9 @@ class InvalidPostContent(Exception):
 
 
 class InvalidPostException(Exception):
-    pass
+    def __init__(self, *args, post_ids=()):
+        super().__init__(*args)
+        self.post_ids = list(post_ids)
 
 
 class InvalidCommentException(Exception):
@@ -18,5 +20,13 @@ class UserCannotDeletePostException(Exception):
     pass
 
 
-class InvalidCommentContent(Exception):
+class InvalidCommentContent(InvalidCommentException):
+    pass
+
+
+class InvalidReactionTypeException(Exception):
+    pass
+
+
+class InvalidCursorException(Exception):
     pass
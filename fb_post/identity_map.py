@@ -0,0 +1,223 @@
+"""
+Request-scoped identity map of fb_post rows.
+
+Inside an identity_scope(), which identity_map_middleware opens for every
+request and the fb_post.utils read functions open for their own call when
+nothing has, each User, Post and Comment id is looked up at most once:
+existence checks (fb_post.validation), user profiles (fb_post.profiles),
+post rows and comment rows go through the scope's IdentityMap first and
+add what they load. Nested scopes share the outer map.
+
+The first write of the scope, as fb_post.routers.ReadReplicaRouter sees it,
+empties the map, so a scope never reads rows from before its own writes.
+Writes of other requests are not seen until the next scope, as with any
+per-request snapshot. FB_POST_IDENTITY_MAP_SIZE bounds the rows kept per
+scope, least recently used out first; 0 turns the map off.
+"""
+import inspect
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+
+from django.conf import settings
+
+DEFAULT_SIZE = 10000
+
+_identity_map = ContextVar('fb_post_identity_map', default=None)
+
+
+class IdentityMap:
+    """
+    Rows and existence results of one scope, keyed by (model, id). Rows are
+    shared by every reader of the scope; treat them as read-only.
+    """
+
+    def __init__(self, max_size=DEFAULT_SIZE):
+        self.max_size = max_size
+        self._rows = OrderedDict()
+        self._existing = set()
+        self._missing = set()
+        # Async views may run several calls of one request at once.
+        self._lock = Lock()
+
+    def get_rows(self, model, object_ids):
+        """
+        :return: {id: row} of the ids whose row is in the map
+        """
+        label = model._meta.label
+        rows = {}
+        with self._lock:
+            for object_id in object_ids:
+                key = (label, object_id)
+                if key in self._rows:
+                    self._rows.move_to_end(key)
+                    rows[object_id] = self._rows[key]
+        return rows
+
+    def get_known_ids(self, model, object_ids):
+        """
+        :return: (ids known to exist, ids known to be missing)
+        """
+        label = model._meta.label
+        with self._lock:
+            existing_ids = {object_id for object_id in object_ids
+                            if (label, object_id) in self._existing}
+            missing_ids = {object_id for object_id in object_ids
+                           if (label, object_id) in self._missing}
+        return existing_ids, missing_ids
+
+    def add_rows(self, model, rows):
+        """
+        :param rows: {id: row} loaded from the database
+        """
+        label = model._meta.label
+        with self._lock:
+            for object_id, row in rows.items():
+                self._rows[(label, object_id)] = row
+                self._rows.move_to_end((label, object_id))
+                self._existing.add((label, object_id))
+            while len(self._rows) > self.max_size:
+                self._rows.popitem(last=False)
+
+    def add_ids(self, model, existing_ids=(), missing_ids=()):
+        label = model._meta.label
+        with self._lock:
+            self._existing.update((label, object_id)
+                                  for object_id in existing_ids)
+            self._missing.update((label, object_id)
+                                 for object_id in missing_ids)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._existing.clear()
+            self._missing.clear()
+
+
+def get_max_size():
+    return getattr(settings, 'FB_POST_IDENTITY_MAP_SIZE', DEFAULT_SIZE)
+
+
+def get_identity_map():
+    """
+    :return: IdentityMap of the current scope, None outside a scope
+    """
+    return _identity_map.get()
+
+
+def get_scope_map():
+    """
+    :return: the current scope's IdentityMap, else a new one; None while
+        the map is turned off
+    """
+    identity_map = _identity_map.get()
+    if identity_map is None and get_max_size() > 0:
+        identity_map = IdentityMap(get_max_size())
+    return identity_map
+
+
+@contextmanager
+def identity_scope(identity_map=None):
+    """
+    Looks rows up through ``identity_map`` inside the block.
+    :param identity_map: IdentityMap to continue, say for the streamed body
+        of a response; by default the enclosing scope's, else a new one
+    :return: the scope's IdentityMap, None while the map is turned off
+    """
+    identity_map = identity_map or get_scope_map()
+    token = _identity_map.set(identity_map)
+    try:
+        yield identity_map
+    finally:
+        _identity_map.reset(token)
+
+
+def iter_in_identity_scope(iterable, identity_map):
+    """
+    :return: iterator over ``iterable`` that advances it inside
+        identity_scope(identity_map)
+    """
+    iterator = iter(iterable)
+    while True:
+        with identity_scope(identity_map):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def identity_scoped(func):
+    """
+    Decorator running the function, or advancing the generator it returns,
+    inside one identity_scope().
+    """
+    if inspect.isgeneratorfunction(func):
+        @wraps(func)
+        def generator_wrapper(*args, **kwargs):
+            yield from iter_in_identity_scope(func(*args, **kwargs),
+                                              get_scope_map())
+        return generator_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with identity_scope():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def remember_rows(model, rows):
+    """
+    Adds model instances loaded by other queries, say the comments of a
+    post, to the current scope's map.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        identity_map.add_rows(model, {row.pk: row for row in rows})
+
+
+def remember_ids(model, existing_ids=(), missing_ids=()):
+    """
+    Records existence results found by other queries in the current scope's
+    map.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        identity_map.add_ids(model, existing_ids, missing_ids)
+
+
+def clear_identity_map():
+    """
+    Empties the current scope's map; called on every write.
+    """
+    identity_map = _identity_map.get()
+    if identity_map is not None:
+        identity_map.clear()
+
+
+def get_rows(model, object_ids, load_rows):
+    """
+    Rows by id through the current scope's map.
+    :param object_ids: ids, duplicates allowed
+    :param load_rows: function loading {id: row} of a list of ids from the
+        database; rows it does not return count as missing
+    :return: {id: row} of the ids with a row
+    """
+    identity_map = _identity_map.get()
+    object_ids = list(dict.fromkeys(object_ids))
+    if identity_map is None:
+        return load_rows(object_ids) if object_ids else {}
+    rows = identity_map.get_rows(model, object_ids)
+    _, missing_ids = identity_map.get_known_ids(model, object_ids)
+    unknown_ids = [object_id for object_id in object_ids
+                   if object_id not in rows and object_id not in missing_ids]
+    if unknown_ids:
+        loaded_rows = load_rows(unknown_ids)
+        identity_map.add_rows(model, loaded_rows)
+        identity_map.add_ids(model, missing_ids=[
+            object_id for object_id in unknown_ids
+            if object_id not in loaded_rows])
+        rows.update(loaded_rows)
+    return rows
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from fb_post.reactions import backfill_post_sentiment, COUNTER_BATCH_SIZE
+from fb_post.sharding import for_each_shard
+
+
+class Command(BaseCommand):
+    help = 'Fills the positive/negative reaction tallies and the reaction ' \
+           'margin of every post from the React table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=COUNTER_BATCH_SIZE,
+                            help='Posts per batch.')
+        parser.add_argument('--start-after', type=int, default=0,
+                            help='Resume after this post id.')
+
+    def handle(self, *args, **options):
+        def progress(done, last_id):
+            self.stdout.write('{} posts, last post id {}'.format(done,
+                                                                 last_id))
+
+        # Post ids grow with the shard, so --start-after resumes across
+        # shards as well.
+        done = sum(for_each_shard(backfill_post_sentiment,
+                                  batch_size=options['batch_size'],
+                                  start_after=options['start_after'],
+                                  progress=progress))
+        self.stdout.write(self.style.SUCCESS(
+            'Backfilled sentiment of {} posts.'.format(done)))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from fb_post.reactions import compact_reaction_count_shards
+from fb_post.sharding import for_each_shard
+
+
+class Command(BaseCommand):
+    help = 'Verifies the sharded total reaction count against the React ' \
+           'table and folds the shards into one. Meant to run periodically.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Verify without compacting.')
+
+    def handle(self, *args, **options):
+        totals = for_each_shard(compact_reaction_count_shards,
+                                dry_run=options['dry_run'])
+        stored_total = sum(stored for stored, _ in totals)
+        actual_total = sum(actual for _, actual in totals)
+
+        if stored_total == actual_total:
+            self.stdout.write(self.style.SUCCESS(
+                'Reaction count shards hold {} reactions, in sync.'.format(
+                    actual_total)))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                'Reaction count shards hold {} reactions, React has {}.'
+                .format(stored_total, actual_total)))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Corrected reaction count shards from {} to {} reactions.'
+                .format(stored_total, actual_total)))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from fb_post.purge import (
+    purge_deleted_posts, PURGE_BATCH_SIZE, PURGE_PAUSE)
+
+
+class Command(BaseCommand):
+    help = 'Removes posts deleted by delete_post, with their comments, ' \
+           'replies and reactions, in small batches. Safe to interrupt ' \
+           'and run again.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            default=PURGE_BATCH_SIZE,
+                            help='Rows per transaction.')
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches.')
+        parser.add_argument('--pause', type=float, default=PURGE_PAUSE,
+                            help='Seconds to sleep between batches.')
+
+    def handle(self, *args, **options):
+        def progress(totals):
+            if totals['batches'] % 100 == 0:
+                self.stdout.write('{batches} batches: {posts} posts, '
+                                  '{comments} comments, {reactions} '
+                                  'reactions'.format(**totals))
+
+        totals = purge_deleted_posts(batch_size=options['batch_size'],
+                                     max_batches=options['max_batches'],
+                                     pause=options['pause'],
+                                     progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            'Purged {posts} posts, {comments} comments and {reactions} '
+            'reactions in {batches} batches.'.format(**totals)))
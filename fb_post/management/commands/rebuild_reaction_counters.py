@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from fb_post.reactions import rebuild_reaction_counters
+from fb_post.sharding import for_each_shard
+
+
+class Command(BaseCommand):
+    help = 'Recounts the per-type reaction counters of every post and ' \
+           'comment from the React table and reports any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drift without fixing it.')
+
+    def handle(self, *args, **options):
+        drift = [item for shard_drift in for_each_shard(
+                     rebuild_reaction_counters, dry_run=options['dry_run'])
+                 for item in shard_drift]
+        for label, object_id, changed in drift:
+            fields = ', '.join(
+                '{} {} -> {}'.format(field, stored, actual)
+                for field, (stored, actual) in sorted(changed.items()))
+            self.stdout.write('{} {}: {}'.format(label, object_id, fields))
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Reaction counters are in '
+                                                 'sync.'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                '{} objects have drifted counters.'.format(len(drift))))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Rebuilt counters of {} objects.'.format(len(drift))))
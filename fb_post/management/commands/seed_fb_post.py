@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from fb_post.seeding import seed_graph, SEED_BATCH_SIZE, AUTHORS_PER_CHUNK, \
+    REACTIONS_PER_POST, REACTIONS_PER_COMMENT, POSITIVE_SHARE
+
+
+class Command(BaseCommand):
+    help = 'Seeds a deterministic graph of users, posts, comment trees and ' \
+           'reactions. Re-running with the same arguments resumes an ' \
+           'interrupted run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--reactions-per-post', type=float,
+                            default=REACTIONS_PER_POST,
+                            help='Mean reactions per post.')
+        parser.add_argument('--reactions-per-comment', type=float,
+                            default=REACTIONS_PER_COMMENT,
+                            help='Mean reactions per comment and reply.')
+        parser.add_argument('--positive-share', type=float,
+                            default=POSITIVE_SHARE,
+                            help='Share of positive reactions, 0 to 1.')
+        parser.add_argument('--batch-size', type=int, default=SEED_BATCH_SIZE)
+        parser.add_argument('--authors-per-chunk', type=int,
+                            default=AUTHORS_PER_CHUNK,
+                            help='Authors written per transaction.')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(done, total, counts):
+            rows = counts['posts'] + counts['comments'] + counts['reactions']
+            self.stdout.write(
+                'authors {}/{}: {} posts, {} comments, {} reactions '
+                '({:.0f} rows/s)'.format(
+                    done, total, counts['posts'], counts['comments'],
+                    counts['reactions'],
+                    rows / max(time.perf_counter() - start, 1e-9)))
+
+        counts = seed_graph(
+            options['users'], seed=options['seed'], progress=progress,
+            reactions_per_post=options['reactions_per_post'],
+            reactions_per_comment=options['reactions_per_comment'],
+            positive_share=options['positive_share'],
+            batch_size=options['batch_size'],
+            authors_per_chunk=options['authors_per_chunk'])
+
+        if counts['skipped_authors']:
+            self.stdout.write('Resumed after {} already seeded authors.'
+                              .format(counts['skipped_authors']))
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded {} posts, {} comments and {} reactions for {} users in '
+            '{:.1f}s.'.format(counts['posts'], counts['comments'],
+                              counts['reactions'], counts['users'],
+                              time.perf_counter() - start)))
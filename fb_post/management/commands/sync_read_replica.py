@@ -0,0 +1,53 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from fb_post.routers import get_read_replicas
+
+
+def copy_sqlite_database(source_path, target_path):
+    """
+    Copies a consistent snapshot of one SQLite file over another with the
+    online backup API; readers of the target never see a half-copied file.
+    """
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+class Command(BaseCommand):
+    help = 'Copies the default SQLite database over the FB_POST_READ_' \
+           'REPLICAS files, once or every --interval seconds. Stands in ' \
+           'for real replication when trying read replicas locally.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Repeat every this many seconds.')
+
+    def handle(self, *args, **options):
+        source = connections[DEFAULT_DB_ALIAS].settings_dict
+        targets = [connections[alias].settings_dict
+                   for alias in get_read_replicas()]
+        if not targets:
+            raise CommandError('FB_POST_READ_REPLICAS is empty.')
+        for settings_dict in [source] + targets:
+            if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('Only SQLite databases can be copied; '
+                                   'use the database\'s own replication.')
+
+        while True:
+            start = time.monotonic()
+            for target in targets:
+                copy_sqlite_database(str(source['NAME']),
+                                     str(target['NAME']))
+            self.stdout.write('Copied to {} replica(s) in {:.0f} ms.'.format(
+                len(targets), (time.monotonic() - start) * 1000))
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,263 @@
+import time
+from bisect import bisect_left
+from functools import wraps
+from inspect import isfunction, isgeneratorfunction
+from threading import Lock
+
+from django.conf import settings
+from django.db import connections
+
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                    0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """
+    Per-bucket counts; render_histogram() turns them into Prometheus'
+    cumulative ``le`` buckets.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def snapshot(self):
+        return {'buckets': dict(zip(self.buckets, self.counts)),
+                'overflow': self.counts[-1],
+                'count': sum(self.counts), 'sum': self.sum}
+
+
+class FunctionMetrics:
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = 0
+        self.errors = 0
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.sql_queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.sql_duration = Histogram(DURATION_BUCKETS)
+
+    def record(self, duration, sql_queries, sql_duration, failed):
+        with self.lock:
+            self.calls += 1
+            self.errors += failed
+            self.duration.observe(duration)
+            self.sql_queries.observe(sql_queries)
+            self.sql_duration.observe(sql_duration)
+
+    def snapshot(self):
+        with self.lock:
+            return {'calls': self.calls, 'errors': self.errors,
+                    'duration_seconds': self.duration.snapshot(),
+                    'sql_queries': self.sql_queries.snapshot(),
+                    'sql_duration_seconds': self.sql_duration.snapshot()}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = Lock()
+        self._functions = {}
+        self.enabled = None
+
+    def get(self, name):
+        metrics = self._functions.get(name)
+        if metrics is None:
+            with self._lock:
+                metrics = self._functions.setdefault(name, FunctionMetrics())
+        return metrics
+
+    def snapshot(self):
+        with self._lock:
+            functions = dict(self._functions)
+        return {name: metrics.snapshot()
+                for name, metrics in sorted(functions.items())}
+
+    def reset(self):
+        with self._lock:
+            self._functions.clear()
+
+
+registry = MetricsRegistry()
+
+
+def is_enabled():
+    if registry.enabled is None:
+        return getattr(settings, 'FB_POST_METRICS_ENABLED', True)
+    return registry.enabled
+
+
+def set_enabled(enabled):
+    """
+    Switches recording on or off at runtime; None goes back to the
+    FB_POST_METRICS_ENABLED setting.
+    """
+    registry.enabled = enabled
+
+
+class SqlTimer:
+    """
+    ``connection.execute_wrapper`` hook counting the queries and their time
+    while it is installed on every connection of the current thread.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.duration += time.perf_counter() - start
+
+    def install(self):
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+    def uninstall(self):
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+def instrument(func, name=None):
+    """
+    Records call count, wall time, SQL query count and SQL time of ``func``
+    under ``name``. Nested instrumented calls are recorded on their own too,
+    so the numbers of a caller include its callees. Generators are measured
+    over the steps of their iteration only, not the time their consumer
+    spends between steps.
+    :param func:
+    :param name: defaults to func.__name__
+    :return: wrapped function
+    """
+    metrics_name = name or func.__name__
+
+    if isgeneratorfunction(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                yield from func(*args, **kwargs)
+                return
+            sql_timer = SqlTimer()
+            duration = 0
+            failed = False
+            generator = func(*args, **kwargs)
+            try:
+                while True:
+                    sql_timer.install()
+                    start = time.perf_counter()
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        duration += time.perf_counter() - start
+                        sql_timer.uninstall()
+                    yield item
+            except Exception:
+                failed = True
+                raise
+            finally:
+                generator.close()
+                registry.get(metrics_name).record(
+                    duration, sql_timer.queries, sql_timer.duration, failed)
+        return wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_enabled():
+            return func(*args, **kwargs)
+        sql_timer = SqlTimer()
+        sql_timer.install()
+        failed = False
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            sql_timer.uninstall()
+            registry.get(metrics_name).record(
+                duration, sql_timer.queries, sql_timer.duration, failed)
+    return wrapper
+
+
+def instrument_module(namespace, exclude=()):
+    """
+    Replaces every public function defined in the module owning
+    ``namespace`` with its instrumented version, so calls between the
+    module's own functions are recorded as well.
+    :param namespace: globals() of the module
+    :param exclude: names left alone, e.g. per-row helpers
+    :return:
+    """
+    module_name = namespace['__name__']
+    for name, value in list(namespace.items()):
+        if isfunction(value) and value.__module__ == module_name and \
+                not name.startswith('_') and name not in exclude:
+            namespace[name] = instrument(value, name)
+
+
+def get_metrics_snapshot():
+    """
+    :return: {function name: {"calls", "errors", "duration_seconds",
+              "sql_queries", "sql_duration_seconds"}}; the last three are
+              histograms {"buckets": {upper bound: count}, "overflow",
+              "count", "sum"}
+    """
+    return registry.snapshot()
+
+
+def reset_metrics():
+    registry.reset()
+
+
+def render_histogram(lines, metric, name, histogram):
+    cumulative = 0
+    for bound, count in histogram['buckets'].items():
+        cumulative += count
+        lines.append('{}_bucket{{function="{}",le="{}"}} {}'.format(
+            metric, name, bound, cumulative))
+    lines.append('{}_bucket{{function="{}",le="+Inf"}} {}'.format(
+        metric, name, histogram['count']))
+    lines.append('{}_sum{{function="{}"}} {}'.format(
+        metric, name, histogram['sum']))
+    lines.append('{}_count{{function="{}"}} {}'.format(
+        metric, name, histogram['count']))
+
+
+def render_prometheus():
+    """
+    :return: the snapshot in the Prometheus text exposition format
+    """
+    snapshot = get_metrics_snapshot()
+    lines = []
+    for metric, key, help_text in (
+            ('fb_post_calls_total', 'calls', 'Calls per function.'),
+            ('fb_post_errors_total', 'errors', 'Calls that raised.')):
+        lines.append('# HELP {} {}'.format(metric, help_text))
+        lines.append('# TYPE {} counter'.format(metric))
+        for name, metrics in snapshot.items():
+            lines.append('{}{{function="{}"}} {}'.format(
+                metric, name, metrics[key]))
+    for metric, key, help_text in (
+            ('fb_post_call_duration_seconds', 'duration_seconds',
+             'Wall time per call.'),
+            ('fb_post_sql_queries', 'sql_queries', 'SQL queries per call.'),
+            ('fb_post_sql_duration_seconds', 'sql_duration_seconds',
+             'SQL time per call.')):
+        lines.append('# HELP {} {}'.format(metric, help_text))
+        lines.append('# TYPE {} histogram'.format(metric))
+        for name, metrics in snapshot.items():
+            render_histogram(lines, metric, name, metrics[key])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,58 @@
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+
+from fb_post.identity_map import identity_scope, iter_in_identity_scope
+from fb_post.routers import ReadScope, iter_in_scope, replica_reads
+
+
+def continue_streaming(response, iter_in, scope):
+    # Streamed bodies are read after the view returns; ``iter_in`` advances
+    # them in ``scope`` again.
+    if response.streaming and not response.is_async:
+        response.streaming_content = iter_in(response.streaming_content,
+                                             scope)
+    return response
+
+
+@sync_and_async_middleware
+def read_replica_middleware(get_response):
+    """
+    Serves every request, streamed body included, inside
+    fb_post.routers.replica_reads(): reads may use a replica until the
+    request's first write.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            scope = ReadScope()
+            with replica_reads(scope):
+                response = await get_response(request)
+            return continue_streaming(response, iter_in_scope, scope)
+    else:
+        def middleware(request):
+            scope = ReadScope()
+            with replica_reads(scope):
+                response = get_response(request)
+            return continue_streaming(response, iter_in_scope, scope)
+    return middleware
+
+
+@sync_and_async_middleware
+def identity_map_middleware(get_response):
+    """
+    Serves every request, streamed body included, inside one
+    fb_post.identity_map.identity_scope(), so the utils calls of a request
+    load each row once.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            with identity_scope() as identity_map:
+                response = await get_response(request)
+            return continue_streaming(response, iter_in_identity_scope,
+                                      identity_map)
+    else:
+        def middleware(request):
+            with identity_scope() as identity_map:
+                response = get_response(request)
+            return continue_streaming(response, iter_in_identity_scope,
+                                      identity_map)
+    return middleware
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:10
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def delete_duplicate_reactions(apps, schema_editor):
+    # The old toggle logic could leave several reactions per user and target;
+    # keep the most recent one so the unique constraints can be created.
+    React = apps.get_model('fb_post', 'React')
+    for target in ('post', 'comment'):
+        duplicates = React.objects.filter(**{target + '__isnull': False}) \
+            .values('reacted_by', target) \
+            .annotate(reactions=Count('id'), latest_id=Max('id')) \
+            .filter(reactions__gt=1)
+        for duplicate in duplicates:
+            React.objects.filter(
+                reacted_by=duplicate['reacted_by'],
+                **{target: duplicate[target]}
+            ).exclude(id=duplicate['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0005_alter_react_reacted_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_reactions,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='react',
+            constraint=models.UniqueConstraint(fields=('reacted_by', 'post'), name='unique_post_reaction_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='react',
+            constraint=models.UniqueConstraint(fields=('reacted_by', 'comment'), name='unique_comment_reaction_per_user'),
+        ),
+    ]
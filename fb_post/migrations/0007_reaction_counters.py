@@ -0,0 +1,135 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:10
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+REACTION_COUNT_FIELDS = {
+    'WO': 'wow_count',
+    'LI': 'lit_count',
+    'LO': 'love_count',
+    'HA': 'haha_count',
+    'TU': 'thumbs_up_count',
+    'TD': 'thumbs_down_count',
+    'AN': 'angry_count',
+    'SA': 'sad_count',
+}
+
+
+def fill_reaction_counters(apps, schema_editor):
+    React = apps.get_model('fb_post', 'React')
+    for target, model_name in (('post', 'Post'), ('comment', 'Comment')):
+        model = apps.get_model('fb_post', model_name)
+        counters = defaultdict(dict)
+        rows = React.objects.filter(**{target + '__isnull': False}) \
+            .values(target, 'reaction').annotate(count=Count('id'))
+        for row in rows:
+            field = REACTION_COUNT_FIELDS.get(row['reaction'])
+            if field is not None:
+                counters[row[target]][field] = row['count']
+        for target_id, counts in counters.items():
+            model.objects.filter(id=target_id).update(
+                reactions_count=sum(counts.values()), **counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0006_react_unique_reaction_per_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='angry_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='haha_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='lit_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='love_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reactions_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='sad_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thumbs_down_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thumbs_up_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='wow_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='angry_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='haha_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='lit_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='love_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reactions_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='sad_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thumbs_down_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thumbs_up_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='wow_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_reaction_counters,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0007_reaction_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent_comment', 'commented_at', 'id'], name='comment_reply_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['posted_by', 'posted_at', 'id'], name='post_author_timeline_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0008_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'commented_at', 'id'], name='comment_post_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='react',
+            index=models.Index(fields=['post', 'reacted_by'], name='react_post_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='react',
+            index=models.Index(fields=['comment', 'reacted_by'], name='react_comment_user_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:17
+
+from django.db import migrations, models
+
+PATH_SEGMENT_WIDTH = 12
+BATCH_SIZE = 500
+
+
+def fill_comment_paths(apps, schema_editor):
+    # Walks the comment forest one level at a time, starting from the
+    # comments that belong directly to a post.
+    Comment = apps.get_model('fb_post', 'Comment')
+    levels = [Comment.objects.filter(parent_comment__isnull=True)]
+    parent_paths = {}
+    depth = 0
+    while levels:
+        paths = {}
+        for level in levels:
+            comments = list(level.only('id', 'parent_comment_id'))
+            for comment in comments:
+                parent_path = parent_paths.get(comment.parent_comment_id, '')
+                comment.path = parent_path + str(comment.id).zfill(
+                    PATH_SEGMENT_WIDTH) + '/'
+                comment.depth = depth
+                paths[comment.id] = comment.path
+            Comment.objects.bulk_update(comments, ['path', 'depth'],
+                                        batch_size=BATCH_SIZE)
+        parent_ids = list(paths)
+        levels = [Comment.objects.filter(
+            parent_comment_id__in=parent_ids[start:start + BATCH_SIZE])
+            for start in range(0, len(parent_ids), BATCH_SIZE)]
+        parent_paths = paths
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=1000),
+        ),
+        migrations.RunPython(fill_comment_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:34
+
+from django.db import migrations, models
+
+REACTION_COUNT_SHARDS = 16
+
+
+def create_shards(apps, schema_editor):
+    React = apps.get_model('fb_post', 'React')
+    ReactionCountShard = apps.get_model('fb_post', 'ReactionCountShard')
+    ReactionCountShard.objects.bulk_create(
+        ReactionCountShard(shard=shard,
+                           count=React.objects.count() if shard == 0 else 0)
+        for shard in range(REACTION_COUNT_SHARDS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0011_post_sentiment_tallies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionCountShard',
+            fields=[
+                ('shard', models.PositiveSmallIntegerField(primary_key=True, serialize=False)),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_shards, migrations.RunPython.noop),
+    ]
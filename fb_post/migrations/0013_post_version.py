@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:10
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def copy_posted_at(apps, schema_editor):
+    Post = apps.get_model('fb_post', 'Post')
+    Post.objects.update(updated_at=F('posted_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0012_reaction_count_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_posted_at, migrations.RunPython.noop),
+    ]
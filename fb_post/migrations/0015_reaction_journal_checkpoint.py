@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 21:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0014_post_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReactionJournalCheckpoint',
+            fields=[
+                ('journal', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('sequence', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb_post', '0015_reaction_journal_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='comment',
+            name='path',
+            field=models.TextField(blank=True, db_index=True, default=''),
+        ),
+    ]
@@ -1,5 +1,37 @@
 from django.db import models
 
+REACTION_COUNT_FIELDS = {
+    'WO': 'wow_count',
+    'LI': 'lit_count',
+    'LO': 'love_count',
+    'HA': 'haha_count',
+    'TU': 'thumbs_up_count',
+    'TD': 'thumbs_down_count',
+    'AN': 'angry_count',
+    'SA': 'sad_count',
+}
+POSITIVE_REACTION_TYPES = ('TU', 'LI', 'LO', 'HA', 'WO')
+NEGATIVE_REACTION_TYPES = ('SA', 'AN', 'TD')
+
+
+class ReactionCounters(models.Model):
+    """
+    Per-type reaction counts kept on the reacted object by the reaction write
+    path, so reads never have to count React rows.
+    """
+    wow_count = models.IntegerField(default=0)
+    lit_count = models.IntegerField(default=0)
+    love_count = models.IntegerField(default=0)
+    haha_count = models.IntegerField(default=0)
+    thumbs_up_count = models.IntegerField(default=0)
+    thumbs_down_count = models.IntegerField(default=0)
+    angry_count = models.IntegerField(default=0)
+    sad_count = models.IntegerField(default=0)
+    reactions_count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
 
 class User(models.Model):
     name = models.CharField(max_length=100)
@@ -9,16 +41,81 @@ class User(models.Model):
         return self.name
 
 
-class Post(models.Model):
+class LivePostManager(models.Manager):
+    """
+    Default Post manager; it leaves out posts deleted by delete_post whose
+    rows are still waiting for fb_post.purge to remove them.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class Post(ReactionCounters):
     content = models.CharField(max_length=1000)
     posted_at = models.DateTimeField(auto_now_add=True)
     posted_by = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Sentiment tallies kept next to the per-type counters; the margin is
+    # positive minus negative reactions and is indexed for range queries.
+    positive_reactions_count = models.IntegerField(default=0)
+    negative_reactions_count = models.IntegerField(default=0)
+    reaction_margin = models.IntegerField(default=0)
+    # Bumped by every write that changes the post's document (its comments,
+    # replies and reactions included); read endpoints derive ETag and
+    # Last-Modified from them.
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now_add=True)
+    # Tombstone set by delete_post; the row, its comments and reactions are
+    # removed later in small batches by fb_post.purge.
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LivePostManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['posted_by', 'posted_at', 'id'],
+                         name='post_author_timeline_idx'),
+            models.Index(fields=['reaction_margin', 'id'],
+                         name='post_reaction_margin_idx'),
+            models.Index(fields=['deleted_at', 'id'],
+                         condition=models.Q(deleted_at__isnull=False),
+                         name='post_tombstone_idx'),
+        ]
 
     def __str__(self):
         return self.content
 
 
-class Comment(models.Model):
+PATH_SEGMENT_WIDTH = 12
+
+
+def get_comment_path(parent_path, comment_id):
+    """
+    Materialized path of a comment: the zero-padded ids of its ancestors and
+    itself, each followed by '/'. Sorting by path gives depth-first thread
+    order.
+    """
+    return parent_path + str(comment_id).zfill(PATH_SEGMENT_WIDTH) + '/'
+
+
+def get_root_comment_id(path):
+    """
+    :return: id of the top-level comment of the thread, the first segment
+        of every path in it
+    """
+    return int(path[:PATH_SEGMENT_WIDTH])
+
+
+def get_subtree_path_range(path):
+    """
+    :return: (lower, upper) so that lower <= p < upper holds exactly for the
+        paths of the comment and all of its descendants
+    """
+    return path, path[:-1] + '0'
+
+
+class Comment(ReactionCounters):
     content = models.CharField(max_length=1000)
     commented_at = models.DateTimeField(auto_now_add=True)
     commented_by = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -26,6 +123,31 @@ class Comment(models.Model):
                              blank=True)
     parent_comment = models.ForeignKey('self', on_delete=models.CASCADE,
                                        null=True, blank=True)
+    # 13 characters per level and no length limit, so threads can nest
+    # arbitrarily deep.
+    path = models.TextField(blank=True, default='', db_index=True)
+    depth = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'commented_at', 'id'],
+                         name='comment_post_timeline_idx'),
+            models.Index(fields=['parent_comment', 'commented_at', 'id'],
+                         name='comment_reply_timeline_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.path:
+            # The path ends with the comment's own id, so it can only be
+            # written once the row exists.
+            parent_path = ''
+            if self.parent_comment_id is not None:
+                parent_path = self.parent_comment.path
+                self.depth = self.parent_comment.depth + 1
+            self.path = get_comment_path(parent_path, self.id)
+            Comment.objects.filter(id=self.id).update(path=self.path,
+                                                      depth=self.depth)
 
     def __str__(self):
         return self.content
@@ -52,5 +174,48 @@ class React(models.Model):
     reacted_at = models.DateTimeField(auto_now_add=True)
     reacted_by = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'reacted_by'],
+                         name='react_post_user_idx'),
+            models.Index(fields=['comment', 'reacted_by'],
+                         name='react_comment_user_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['reacted_by', 'post'],
+                                    name='unique_post_reaction_per_user'),
+            models.UniqueConstraint(fields=['reacted_by', 'comment'],
+                                    name='unique_comment_reaction_per_user'),
+        ]
+
     def __str__(self):
         return self.reaction
+
+
+REACTION_COUNT_SHARDS = 16
+
+
+class ReactionCountShard(models.Model):
+    """
+    One slice of the total number of React rows. Reaction writes add to a
+    random shard, so concurrent writers rarely wait on the same row, and
+    the total is the sum of REACTION_COUNT_SHARDS rows.
+    """
+    shard = models.PositiveSmallIntegerField(primary_key=True)
+    count = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '{}: {}'.format(self.shard, self.count)
+
+
+class ReactionJournalCheckpoint(models.Model):
+    """
+    Sequence number of the last journaled reaction a ReactionBuffer has
+    written to the database, saved in the same transaction as the reactions,
+    so replaying a journal after a crash never applies a toggle twice.
+    """
+    journal = models.CharField(max_length=255, primary_key=True)
+    sequence = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return '{}: {}'.format(self.journal, self.sequence)
@@ -0,0 +1,62 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from fb_post.exceptions import InvalidCursorException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(timestamp, object_id):
+    payload = json.dumps([timestamp.isoformat(), object_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """
+    :param cursor: value returned as next_cursor by a previous page
+    :return: (timestamp, object_id) of the last row of that page
+    """
+    try:
+        timestamp, object_id = json.loads(base64.urlsafe_b64decode(
+            cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(object_id)
+    except (binascii.Error, TypeError, ValueError):
+        raise InvalidCursorException('InvalidCursorException')
+
+
+def get_keyset_page(queryset, time_field, page_size, cursor=None,
+                    descending=False):
+    """
+    Returns one page of ``queryset`` ordered by (time_field, id). The cursor
+    turns into a range condition on that pair, so with a matching composite
+    index every page costs the same as the first one.
+    :param queryset:
+    :param time_field: name of the timestamp the page is ordered by
+    :param page_size: clamped to 1..MAX_PAGE_SIZE
+    :param cursor:
+    :param descending: newest first
+    :return: (list of objects, next cursor or None on the last page)
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    if cursor is not None:
+        timestamp, object_id = decode_cursor(cursor)
+        if descending:
+            queryset = queryset.filter(**{time_field + '__lte': timestamp}) \
+                .exclude(**{time_field: timestamp, 'id__gte': object_id})
+        else:
+            queryset = queryset.filter(**{time_field + '__gte': timestamp}) \
+                .exclude(**{time_field: timestamp, 'id__lte': object_id})
+    if descending:
+        queryset = queryset.order_by('-' + time_field, '-id')
+    else:
+        queryset = queryset.order_by(time_field, 'id')
+
+    objects = list(queryset[:page_size + 1])
+    if len(objects) <= page_size:
+        return objects, None
+    objects = objects[:page_size]
+    last = objects[-1]
+    return objects, encode_cursor(getattr(last, time_field), last.id)
@@ -0,0 +1,173 @@
+import time
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from fb_post.models import Comment, PATH_SEGMENT_WIDTH
+from fb_post.sharding import get_db
+from fb_post.validation import ID_BATCH_SIZE
+
+VERSION_KEY = 'fb_post:post_version:{}'
+DOCUMENT_KEY = 'fb_post:post:{}:{}:{}'
+DEFAULT_TIMEOUT = 300
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def snapshot(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+cache_stats = CacheStats()
+
+
+def is_enabled():
+    return getattr(settings, 'FB_POST_CACHE_ENABLED', False)
+
+
+def get_cache():
+    return caches[getattr(settings, 'FB_POST_CACHE_ALIAS', 'default')]
+
+
+def new_version():
+    # A fresh token per (re)created version key means documents cached under
+    # an evicted version can never be mistaken for the current one.
+    return time.time_ns()
+
+
+def get_post_versions(post_ids):
+    cache = get_cache()
+    version_keys = {post_id: VERSION_KEY.format(post_id)
+                    for post_id in post_ids}
+    cached_versions = cache.get_many(version_keys.values())
+    versions = {}
+    new_versions = {}
+    for post_id, key in version_keys.items():
+        if key in cached_versions:
+            versions[post_id] = cached_versions[key]
+        else:
+            versions[post_id] = new_versions[key] = new_version()
+    if new_versions:
+        cache.set_many(new_versions, timeout=None)
+    return versions
+
+
+def get_post_documents(post_ids, build_posts, variant='str'):
+    """
+    Serves post documents from the cache and builds all misses with one
+    ``build_posts`` call.
+    :param post_ids: ids known to exist
+    :param build_posts: loader returning documents for a list of post ids
+    :param variant: name of the document shape ``build_posts`` returns, so
+        differently shaped documents of a post do not share a key
+    :return: documents in the order of ``post_ids``
+    """
+    if not is_enabled():
+        return build_posts(post_ids)
+
+    cache = get_cache()
+    post_ids = list(dict.fromkeys(post_ids))
+    versions = get_post_versions(post_ids)
+    document_keys = {post_id: DOCUMENT_KEY.format(post_id, versions[post_id],
+                                                  variant)
+                     for post_id in post_ids}
+    cached_documents = cache.get_many(document_keys.values())
+    documents = {post_id: cached_documents[key]
+                 for post_id, key in document_keys.items()
+                 if key in cached_documents}
+
+    missing_post_ids = [post_id for post_id in post_ids
+                        if post_id not in documents]
+    cache_stats.record(hits=len(documents), misses=len(missing_post_ids))
+    if missing_post_ids:
+        built_documents = {document['post_id']: document
+                           for document in build_posts(missing_post_ids)}
+        cache.set_many(
+            {document_keys[post_id]: document
+             for post_id, document in built_documents.items()},
+            timeout=getattr(settings, 'FB_POST_CACHE_TIMEOUT',
+                            DEFAULT_TIMEOUT))
+        documents.update(built_documents)
+    return [documents[post_id] for post_id in post_ids
+            if post_id in documents]
+
+
+def bump_post_versions(post_ids):
+    cache = get_cache()
+    for post_id in post_ids:
+        try:
+            cache.incr(VERSION_KEY.format(post_id))
+        except ValueError:
+            cache.set(VERSION_KEY.format(post_id), new_version(),
+                      timeout=None)
+
+
+def invalidate_posts(post_ids):
+    """
+    Moves the posts to a new version once the current transaction commits,
+    so no reader can cache the pre-commit state under the new version.
+    :param post_ids:
+    :return:
+    """
+    if is_enabled():
+        post_ids = list(post_ids)
+        transaction.on_commit(lambda: bump_post_versions(post_ids),
+                              using=get_db())
+
+
+def get_comment_post_ids(comment_ids):
+    """
+    :param comment_ids: comments or replies at any depth
+    :return: ids of the posts whose threads contain the comments; a reply's
+        post is the one of the top-level comment its path starts with
+    """
+    comment_ids = list(comment_ids)
+    post_ids = set()
+    root_ids = set()
+    for start in range(0, len(comment_ids), ID_BATCH_SIZE):
+        rows = Comment.objects.filter(
+            id__in=comment_ids[start:start + ID_BATCH_SIZE]).values_list(
+            'post_id', 'path')
+        for post_id, path in rows:
+            if post_id is not None:
+                post_ids.add(post_id)
+            elif path:
+                root_ids.add(int(path[:PATH_SEGMENT_WIDTH]))
+    root_ids = list(root_ids)
+    for start in range(0, len(root_ids), ID_BATCH_SIZE):
+        post_ids.update(Comment.objects.filter(
+            id__in=root_ids[start:start + ID_BATCH_SIZE],
+            post__isnull=False).values_list('post_id', flat=True))
+    return post_ids
+
+
+def invalidate_comment_posts(comment_ids):
+    """
+    Invalidates the posts whose documents render the given comments, either
+    as top-level comments or as replies at any depth.
+    :param comment_ids:
+    :return:
+    """
+    if is_enabled():
+        invalidate_posts(get_comment_post_ids(comment_ids))
+
+
+def get_cache_stats():
+    return cache_stats.snapshot()
@@ -0,0 +1,122 @@
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, F, Max, Sum
+
+from fb_post.identity_map import remember_ids
+from fb_post.models import Post
+from fb_post.pagination import get_keyset_page
+from fb_post.post_cache import invalidate_posts, get_comment_post_ids
+from fb_post.sharding import group_by_shard, on_shard_of, use_shard
+from fb_post.validation import ID_BATCH_SIZE
+
+
+def touch_posts(post_ids):
+    """
+    Moves the posts to their next version and invalidates their cached
+    documents. Call it inside the transaction of the write.
+    :param post_ids:
+    :return:
+    """
+    post_ids = list(post_ids)
+    changes = get_next_version()
+    for start in range(0, len(post_ids), ID_BATCH_SIZE):
+        Post.objects.filter(id__in=post_ids[start:start + ID_BATCH_SIZE]) \
+            .update(**changes)
+    invalidate_posts(post_ids)
+
+
+def get_next_version():
+    """
+    :return: update() changes moving posts to their next version, for
+        writes that update the post rows anyway; they still have to
+        invalidate the cached documents
+    """
+    return {'version': F('version') + 1, 'updated_at': datetime.now()}
+
+
+def touch_comment_posts(comment_ids):
+    """
+    touch_posts for the posts whose threads contain the comments.
+    :param comment_ids:
+    :return:
+    """
+    touch_posts(get_comment_post_ids(comment_ids))
+
+
+def get_post_validators(post_ids):
+    """
+    :param post_ids:
+    :return: {post_id: (version, updated_at)} of the posts that exist
+    """
+    validators = {}
+    for alias, shard_post_ids in group_by_shard(post_ids).items():
+        with use_shard(alias):
+            for start in range(0, len(shard_post_ids), ID_BATCH_SIZE):
+                rows = Post.objects.filter(
+                    id__in=shard_post_ids[start:start + ID_BATCH_SIZE]) \
+                    .values_list('id', 'version', 'updated_at')
+                for post_id, version, updated_at in rows:
+                    validators[post_id] = (version, updated_at)
+    # The views validate the same posts next.
+    remember_ids(Post, validators, [post_id for post_id in post_ids
+                                    if post_id not in validators])
+    return validators
+
+
+@on_shard_of('user_id')
+def get_user_post_validators(user_id, page_size=None, cursor=None):
+    """
+    Validators of the user's posts that cost one aggregate query for the
+    whole list and one page query for a page, however many posts there are.
+    :param page_size: validators of that get_user_posts_page page instead
+        of the whole list
+    :param cursor: of the page
+    :return: (etag, last modified), None when the user has no posts
+    """
+    posts = Post.objects.filter(posted_by_id=user_id)
+    if page_size is not None:
+        rows, next_cursor = get_keyset_page(
+            posts.only('id', 'posted_at', 'version', 'updated_at'),
+            'posted_at', page_size, cursor, descending=True)
+        validators = {row.id: (row.version, row.updated_at) for row in rows}
+        if not validators:
+            return None
+        return (get_combined_etag(validators, page_size, cursor,
+                                  next_cursor),
+                get_last_modified(validators))
+
+    # Ids only grow, so the same count and latest id mean no post was
+    # created or deleted, and versions only grow too.
+    summary = posts.aggregate(count=Count('id'), latest_id=Max('id'),
+                              versions=Sum('version'),
+                              updated_at=Max('updated_at'))
+    if not summary['count']:
+        return None
+    return (get_combined_etag({}, summary['count'], summary['latest_id'],
+                              summary['versions']),
+            summary['updated_at'])
+
+
+def get_post_etag(post_id, version):
+    return '"{}.{}"'.format(post_id, version)
+
+
+def get_combined_etag(validators, *extra):
+    """
+    One ETag for a list of posts; it changes when any post of the list
+    gets a new version or the list itself changes.
+    :param validators: {post_id: (version, updated_at)}, in list order
+    :param extra: further values the response depends on, e.g. paging
+    :return:
+    """
+    digest = hashlib.sha1()
+    for post_id, (version, _) in validators.items():
+        digest.update('{}.{},'.format(post_id, version).encode())
+    digest.update(repr(extra).encode())
+    return '"{}"'.format(digest.hexdigest()[:32])
+
+
+def get_last_modified(validators):
+    return max((updated_at for _, updated_at in validators.values()),
+               default=None)
@@ -0,0 +1,52 @@
+from fb_post.identity_map import get_rows
+from fb_post.models import User
+from fb_post.validation import ID_BATCH_SIZE
+
+
+def load_user_profiles(user_ids):
+    """
+    :param user_ids: list of user ids
+    :return: {user_id: {"user_id", "name", "profile_pic"}} of the users that
+        exist
+    """
+    profiles = dict()
+    for start in range(0, len(user_ids), ID_BATCH_SIZE):
+        rows = User.objects.filter(
+            id__in=user_ids[start:start + ID_BATCH_SIZE]).values_list(
+            'id', 'name', 'profile_pic')
+        for user_id, name, profile_pic in rows:
+            profiles[user_id] = {"user_id": user_id, "name": name,
+                                 "profile_pic": profile_pic}
+    return profiles
+
+
+class UserProfiles:
+    """
+    Interned {"user_id", "name", "profile_pic"} dicts for one read call.
+    Row builders announce the user ids they will need with want(); the
+    first lookup fetches every announced profile in one batched query, and
+    all rows of a user share its dict, so treat the dicts as read-only.
+    Inside an identity scope the dicts are shared with the scope's other
+    calls, and profiles loaded there are not fetched again.
+    """
+
+    def __init__(self):
+        self._profiles = dict()
+        self._wanted = set()
+
+    def want(self, user_ids):
+        self._wanted.update(user_ids)
+
+    def __getitem__(self, user_id):
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            self._wanted.add(user_id)
+            self._load()
+            profile = self._profiles[user_id]
+        return profile
+
+    def _load(self):
+        user_ids = sorted(user_id for user_id in self._wanted
+                          if user_id not in self._profiles)
+        self._wanted = set()
+        self._profiles.update(get_rows(User, user_ids, load_user_profiles))
@@ -0,0 +1,187 @@
+import time
+
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+
+from fb_post.models import Post, Comment, React, get_subtree_path_range
+from fb_post.sharding import atomic, get_shards, use_shard
+from fb_post.validation import forget_ids, forget_model, ID_BATCH_SIZE
+
+PURGE_BATCH_SIZE = 500
+# SQLite does not queue writers: a writer sleeping in the busy handler can
+# miss every gap between back to back batches and wait for the whole purge.
+# A few milliseconds between batches let it in.
+PURGE_PAUSE = 0.005
+
+
+def delete_rows(queryset):
+    """
+    Deletes ``queryset``; delete_post already took the reactions of the
+    post off the total count.
+    :return: {model label: rows deleted}
+    """
+    _, deleted_rows = queryset.delete()
+    return deleted_rows
+
+
+def get_subtrees(roots):
+    """
+    :param roots: (id, path) of top-level comments
+    :return: Q matching the comments of their subtrees
+    """
+    subtrees = Q()
+    for root_id, path in roots:
+        if path:
+            lower, upper = get_subtree_path_range(path)
+            subtrees |= Q(path__gte=lower, path__lt=upper)
+        else:
+            subtrees |= Q(id=root_id)
+    return subtrees
+
+
+def get_comment_group(post_id, batch_size):
+    """
+    :return: up to ``batch_size`` ids from the subtrees of the post's first
+        top-level comments, deepest path first; descendants sort after
+        their ancestors, so the group never holds a comment without the
+        rest of its subtree
+    """
+    roots = list(Comment.objects.filter(post_id=post_id).order_by(
+        'commented_at', 'id').values_list('id', 'path')[
+        :min(batch_size, ID_BATCH_SIZE // 2)])
+    if not roots:
+        return []
+    return list(Comment.objects.filter(get_subtrees(roots)).order_by(
+        '-path').values_list('id', flat=True)[:batch_size])
+
+
+def get_tree_reaction_count(post_id):
+    """
+    :return: reactions to the post and to the comments of its threads, as
+        their reaction counters hold them
+    """
+    count = Post.all_objects.filter(id=post_id).values_list(
+        'reactions_count', flat=True).first() or 0
+    roots = list(Comment.objects.filter(post_id=post_id).values_list(
+        'id', 'path'))
+    for start in range(0, len(roots), ID_BATCH_SIZE // 2):
+        count += Comment.objects.filter(get_subtrees(
+            roots[start:start + ID_BATCH_SIZE // 2])).aggregate(
+            count=Coalesce(Sum('reactions_count'), 0))['count']
+    return count
+
+
+def count_tree_reactions(post_id):
+    """
+    :return: React rows of the post and of the comments of its threads
+    """
+    count = React.objects.filter(post_id=post_id).count()
+    roots = list(Comment.objects.filter(post_id=post_id).values_list(
+        'id', 'path'))
+    for start in range(0, len(roots), ID_BATCH_SIZE // 2):
+        count += React.objects.filter(comment__in=Comment.objects.filter(
+            get_subtrees(roots[start:start + ID_BATCH_SIZE // 2]))).count()
+    return count
+
+
+def purge_reactions(reactions, batch_size):
+    """
+    :param reactions: React queryset
+    :return: rows deleted by one batch of ``reactions``, None when none is
+        left
+    """
+    reaction_ids = list(reactions.values_list('id', flat=True)[:batch_size])
+    if not reaction_ids:
+        return None
+    # Read outside the transaction, so it holds the write lock only for the
+    # DELETE itself.
+    with atomic():
+        return delete_rows(React.objects.filter(id__in=reaction_ids))
+
+
+def iter_purge_batches(post_id, batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes a post tombstoned by delete_post, at most ``batch_size`` rows
+    per transaction: reactions to the post; then, group by group of
+    comment subtrees, reactions to the comments and the comments
+    themselves; finally the post row. Every batch leaves a consistent tree,
+    so the purge can stop between any two of them.
+    :param post_id:
+    :param batch_size:
+    :return: iterator of {model label: rows deleted}, one per transaction
+    """
+    post_reactions = React.objects.filter(post_id=post_id)
+    while True:
+        deleted_rows = purge_reactions(post_reactions, batch_size)
+        if deleted_rows is None:
+            break
+        yield deleted_rows
+
+    while True:
+        comment_ids = get_comment_group(post_id, batch_size)
+        if not comment_ids:
+            break
+        comment_reactions = React.objects.filter(comment_id__in=comment_ids)
+        while True:
+            deleted_rows = purge_reactions(comment_reactions, batch_size)
+            if deleted_rows is None:
+                break
+            yield deleted_rows
+        with atomic():
+            deleted_rows = delete_rows(
+                Comment.objects.filter(id__in=comment_ids))
+        if deleted_rows.get(Comment._meta.label, 0) > len(comment_ids):
+            # Replies written after the group was read went with the
+            # cascade; their ids are unknown.
+            forget_model(Comment)
+        else:
+            forget_ids(Comment, comment_ids)
+        yield deleted_rows
+
+    with atomic():
+        deleted_rows = delete_rows(Post.all_objects.filter(id=post_id))
+    yield deleted_rows
+
+
+def get_next_deleted_post_id():
+    return Post.all_objects.filter(deleted_at__isnull=False).order_by(
+        'deleted_at', 'id').values_list('id', flat=True).first()
+
+
+def purge_deleted_posts(batch_size=PURGE_BATCH_SIZE, max_batches=None,
+                        pause=PURGE_PAUSE, progress=None):
+    """
+    Removes posts tombstoned by delete_post together with their comments,
+    replies and reactions, shard by shard and oldest tombstone first, in
+    batches of at most ``batch_size`` rows with one transaction each. All
+    progress is kept in the database, so an interrupted purge simply
+    resumes on the next run.
+    :param batch_size: rows per transaction
+    :param max_batches: stop after this many batches, None for all
+    :param pause: seconds to sleep between batches, leaving the database to
+        other writers
+    :param progress: called with the running totals after every batch
+    :return: {"posts", "comments", "reactions", "batches"}
+    """
+    totals = {'posts': 0, 'comments': 0, 'reactions': 0, 'batches': 0}
+    for alias in get_shards():
+        with use_shard(alias):
+            while True:
+                post_id = get_next_deleted_post_id()
+                if post_id is None:
+                    break
+                for deleted_rows in iter_purge_batches(post_id, batch_size):
+                    totals['posts'] += deleted_rows.get(Post._meta.label, 0)
+                    totals['comments'] += deleted_rows.get(
+                        Comment._meta.label, 0)
+                    totals['reactions'] += deleted_rows.get(
+                        React._meta.label, 0)
+                    totals['batches'] += 1
+                    if progress is not None:
+                        progress(totals)
+                    if max_batches is not None and \
+                            totals['batches'] >= max_batches:
+                        return totals
+                    if pause:
+                        time.sleep(pause)
+    return totals
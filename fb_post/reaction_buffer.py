@@ -0,0 +1,350 @@
+"""
+Write-behind mode of react_to_post / react_to_comment for hot posts.
+
+With FB_POST_REACTION_BUFFER_ENABLED the two functions validate the click,
+queue it in the process-wide ReactionBuffer and return REACTION_QUEUED. A
+background thread writes the queue through bulk_react, in one transaction
+per database shard, every FB_POST_REACTION_BUFFER_INTERVAL seconds or as
+soon as FB_POST_REACTION_BUFFER_SIZE users/targets are waiting. Toggles of one
+user on one target are coalesced while they wait, so a burst of clicks
+costs one row write. Reads see a toggle only once it is flushed.
+
+Queued toggles live in memory; with FB_POST_REACTION_JOURNAL set they are
+first appended to that file (fsynced unless FB_POST_REACTION_JOURNAL_FSYNC
+is False), and a restarted process replays whatever the database has not
+seen. The journal belongs to one process: give every worker its own path.
+"""
+import atexit
+import glob
+import logging
+import os
+from threading import Event, Lock, Thread
+
+from django.conf import settings
+from django.db import connections
+
+from fb_post.json_encoding import dumps, loads
+from fb_post.models import ReactionJournalCheckpoint
+from fb_post.sharding import atomic, get_record_shard, get_shards, \
+    group_by_shard, use_shard
+
+DEFAULT_INTERVAL = 0.05
+DEFAULT_BUFFER_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+def coalesce_toggles(reaction_types):
+    """
+    :param reaction_types: toggles of one user on one target, in order
+    :return: the shortest toggle list with the same effect whatever the
+        user's current reaction is; at most three long
+    """
+    first = reaction_types[0]
+    # After the first toggle the reaction is either None (it was `first`)
+    # or `first`; follow both outcomes through the rest.
+    from_none, from_first = None, first
+    other = None
+    for reaction_type in reaction_types[1:]:
+        from_none = None if from_none == reaction_type else reaction_type
+        from_first = None if from_first == reaction_type else reaction_type
+        if reaction_type != first:
+            other = reaction_type
+
+    if (from_none, from_first) == (None, first):
+        return [first]
+    if (from_none, from_first) == (first, None):
+        return [first, first]
+    # Both outcomes merged, which takes a toggle of some `other` type.
+    if from_none is None:
+        return [first, other, other]
+    if from_none == first:
+        return [first, other, first]
+    return [first, from_none]
+
+
+class ReactionJournal:
+    """
+    Append-only JSON-lines file of queued toggles, one
+    [sequence, user_id, post_id, comment_id, reaction_type] per line.
+    Before a flush the file is renamed to ``<path>.<last sequence>``; the
+    renamed segments are removed once the checkpoint covers them.
+    """
+
+    def __init__(self, path, fsync=True):
+        self.path = os.path.abspath(path)
+        self.fsync = fsync
+        self._file = open(self.path, 'ab')
+
+    def append(self, sequence, toggle):
+        self._file.write(dumps([sequence, *toggle]) + b'\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def rotate(self, sequence):
+        self._file.close()
+        os.replace(self.path, '{}.{}'.format(self.path, sequence))
+        self._file = open(self.path, 'ab')
+
+    def get_segments(self):
+        """
+        :return: [(last sequence, path)] of the renamed segments, oldest
+            first
+        """
+        segments = []
+        for path in glob.glob(glob.escape(self.path) + '.*'):
+            suffix = path[len(self.path) + 1:]
+            if suffix.isdigit():
+                segments.append((int(suffix), path))
+        return sorted(segments)
+
+    def read(self):
+        """
+        :return: iterator of (sequence, (user_id, post_id, comment_id,
+            reaction_type)) over the segments and the current file
+        """
+        paths = [path for _, path in self.get_segments()] + [self.path]
+        for path in paths:
+            with open(path, 'rb') as journal_file:
+                for line in journal_file:
+                    try:
+                        sequence, *toggle = loads(line)
+                    except ValueError:
+                        # A line torn by a crash was never acknowledged.
+                        continue
+                    yield sequence, tuple(toggle)
+
+    def remove_segments(self, sequence):
+        for last_sequence, path in self.get_segments():
+            if last_sequence <= sequence:
+                os.remove(path)
+
+    def close(self):
+        self._file.close()
+
+
+class ReactionBuffer:
+    """
+    Queue of reaction toggles written by bulk_react in batches; see the
+    module docstring.
+    """
+
+    def __init__(self, interval=DEFAULT_INTERVAL,
+                 buffer_size=DEFAULT_BUFFER_SIZE, journal_path=None,
+                 fsync=True):
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.journal = None if journal_path is None \
+            else ReactionJournal(journal_path, fsync=fsync)
+        self._pending = {}
+        self._sequence = 0
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._wake = Event()
+        self._stopped = Event()
+        self._thread = None
+        self.flushed = 0
+        self.rejected = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        """
+        Replays the journal, then starts the flushing thread.
+        """
+        if self.journal is not None:
+            self.replay()
+        self._thread = Thread(target=self.run, name='fb_post-reactions',
+                              daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the flushing thread and writes whatever is still queued.
+        """
+        if self._thread is not None:
+            self._stopped.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        if self.journal is not None:
+            self.journal.close()
+
+    def run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopped.is_set():
+                # stop() flushes the rest on its own thread.
+                break
+            try:
+                self.flush()
+            except Exception:
+                # The batch went back into the queue; retry on the next
+                # interval rather than lose the thread.
+                self.failed_flushes += 1
+                with self._lock:
+                    waiting = len(self._pending)
+                # A queue that outgrew a batch is not catching up.
+                level = logging.ERROR if waiting < self.buffer_size \
+                    else logging.CRITICAL
+                logger.log(level, 'Flushing queued reactions failed %d '
+                           'time(s) in a row; %d users/targets wait for the '
+                           'retry', self.failed_flushes, waiting,
+                           exc_info=True)
+                continue
+            self.failed_flushes = 0
+        connections.close_all()
+
+    def replay(self):
+        checkpoints = {}
+        for alias in get_shards():
+            with use_shard(alias):
+                checkpoints[alias] = get_checkpoint(self.journal.path)
+        with self._lock:
+            self._sequence = max(checkpoints.values())
+            for sequence, toggle in self.journal.read():
+                self._sequence = max(self._sequence, sequence)
+                if sequence > checkpoints[get_toggle_shard(toggle)]:
+                    self._queue(toggle)
+            sequence = self._sequence
+        self.flush()
+        # Segments a crash left behind after their flush committed.
+        self.journal.remove_segments(sequence)
+
+    def add(self, user_id, post_id, comment_id, reaction_type):
+        """
+        Queues one toggle; with a journal it is on disk when this returns.
+        """
+        toggle = (user_id, post_id, comment_id, reaction_type)
+        with self._lock:
+            self._sequence += 1
+            if self.journal is not None:
+                self.journal.append(self._sequence, toggle)
+            self._queue(toggle)
+            is_full = len(self._pending) >= self.buffer_size
+        if is_full:
+            if self._thread is not None:
+                self._wake.set()
+            else:
+                self.flush()
+
+    def _queue(self, toggle):
+        key = toggle[:3]
+        self._pending[key] = coalesce_toggles(
+            self._pending.get(key, []) + [toggle[3]])
+
+    def flush(self):
+        """
+        Writes the queued toggles in one transaction per database shard.
+        Toggles rejected by bulk_react, say on a post deleted meanwhile, are
+        dropped.
+        :return: number of toggles written
+        """
+        # fb_post.utils imports this module for react_to_post.
+        from fb_post.utils import bulk_react
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                sequence = self._sequence
+                if pending and self.journal is not None:
+                    self.journal.rotate(sequence)
+            if not pending:
+                return 0
+
+            shard_wise_keys = group_by_shard(pending,
+                                             get_shard=get_toggle_shard)
+            written = 0
+            for alias, keys in list(shard_wise_keys.items()):
+                records = [{'user_id': key[0], 'post_id': key[1],
+                            'comment_id': key[2], 'reaction_type': reaction}
+                           for key in keys for reaction in pending[key]]
+                try:
+                    with use_shard(alias), atomic():
+                        _, errors = bulk_react(records)
+                        if self.journal is not None:
+                            # Per shard: a replay skips what this shard
+                            # has, whatever happened to the others.
+                            save_checkpoint(self.journal.path, sequence)
+                except Exception:
+                    self._requeue({key: pending[key]
+                                   for keys in shard_wise_keys.values()
+                                   for key in keys})
+                    raise
+                del shard_wise_keys[alias]
+                written += len(records) - len(errors)
+                self.rejected += len(errors)
+            self.flushed += written
+
+            if self.journal is not None:
+                self.journal.remove_segments(sequence)
+            return written
+
+    def _requeue(self, pending):
+        with self._lock:
+            for key, reactions in self._pending.items():
+                pending[key] = coalesce_toggles(
+                    pending.get(key, []) + reactions)
+            self._pending = pending
+
+
+def get_toggle_shard(toggle):
+    return get_record_shard({'user_id': toggle[0], 'post_id': toggle[1],
+                             'comment_id': toggle[2]})
+
+
+def get_checkpoint(journal_path):
+    return ReactionJournalCheckpoint.objects.filter(
+        journal=journal_path).values_list('sequence', flat=True).first() or 0
+
+
+def save_checkpoint(journal_path, sequence):
+    ReactionJournalCheckpoint.objects.update_or_create(
+        journal=journal_path, defaults={'sequence': sequence})
+
+
+def is_enabled():
+    return getattr(settings, 'FB_POST_REACTION_BUFFER_ENABLED', False)
+
+
+_buffer = None
+_buffer_lock = Lock()
+
+
+def get_reaction_buffer():
+    """
+    :return: the process-wide ReactionBuffer, started on first use
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = ReactionBuffer(
+                    interval=getattr(settings,
+                                     'FB_POST_REACTION_BUFFER_INTERVAL',
+                                     DEFAULT_INTERVAL),
+                    buffer_size=getattr(settings,
+                                        'FB_POST_REACTION_BUFFER_SIZE',
+                                        DEFAULT_BUFFER_SIZE),
+                    journal_path=getattr(settings, 'FB_POST_REACTION_JOURNAL',
+                                         None),
+                    fsync=getattr(settings, 'FB_POST_REACTION_JOURNAL_FSYNC',
+                                  True)).start()
+                atexit.register(_buffer.stop)
+    return _buffer
+
+
+def stop_reaction_buffer():
+    """
+    Flushes and stops the process-wide buffer; the next toggle starts a new
+    one with the current settings.
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is not None:
+            atexit.unregister(_buffer.stop)
+            _buffer.stop()
+            _buffer = None
@@ -0,0 +1,437 @@
+import random
+from collections import defaultdict
+from datetime import datetime
+
+from django.db import IntegrityError, connections
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from fb_post.post_versions import get_next_version
+from fb_post.purge import count_tree_reactions
+from fb_post.sharding import atomic, get_db
+from fb_post.models import Post, Comment, React, ReactionCountShard, \
+    REACTION_COUNT_FIELDS, REACTION_COUNT_SHARDS, POSITIVE_REACTION_TYPES, \
+    NEGATIVE_REACTION_TYPES
+
+REACTION_CREATED = 'CREATED'
+REACTION_UPDATED = 'UPDATED'
+REACTION_DELETED = 'DELETED'
+# Buffered mode: the toggle is queued and its outcome not known yet.
+REACTION_QUEUED = 'QUEUED'
+
+COUNTER_FIELDS = list(REACTION_COUNT_FIELDS.values()) + ['reactions_count']
+SENTIMENT_FIELDS = ['positive_reactions_count', 'negative_reactions_count',
+                    'reaction_margin']
+COUNTER_BATCH_SIZE = 500
+# Each (user, target) pair costs at most two bound parameters in the lookup.
+TOGGLE_LOOKUP_BATCH_SIZE = 250
+
+
+def get_target_filter(post_id=None, comment_id=None):
+    if post_id is not None:
+        return {'post_id': post_id}
+    return {'comment_id': comment_id}
+
+
+def get_reaction_counts(target):
+    """
+    :param target: Post or Comment with its counter fields loaded
+    :return: {reaction_type: count} for every type with a reaction
+    """
+    counts = {}
+    for reaction, field in REACTION_COUNT_FIELDS.items():
+        count = getattr(target, field)
+        if count:
+            counts[reaction] = count
+    return counts
+
+
+def get_reaction_summary(target):
+    """
+    :param target: Post or Comment with its counter fields loaded
+    :return: {"count": total, "type": [reaction types]} or None without
+        reactions
+    """
+    if not target.reactions_count:
+        return None
+    return {"count": target.reactions_count,
+            "type": list(get_reaction_counts(target))}
+
+
+def get_sentiment_deltas(reaction_deltas):
+    """
+    :param reaction_deltas: {reaction_type: delta}
+    :return: {sentiment field: delta} for the post sentiment tallies
+    """
+    positive = sum(delta for reaction, delta in reaction_deltas.items()
+                   if reaction in POSITIVE_REACTION_TYPES)
+    negative = sum(delta for reaction, delta in reaction_deltas.items()
+                   if reaction in NEGATIVE_REACTION_TYPES)
+    return {'positive_reactions_count': positive,
+            'negative_reactions_count': negative,
+            'reaction_margin': positive - negative}
+
+
+def get_counter_fields(model):
+    if model is Post:
+        return COUNTER_FIELDS + SENTIMENT_FIELDS
+    return COUNTER_FIELDS
+
+
+def get_reaction_summaries(queryset):
+    """
+    Summarises many posts or comments with one query over their counter
+    columns; the cost grows with the number of targets, never with the
+    number of reactions on them.
+    :param queryset: Post or Comment queryset selecting the targets
+    :return: {target id: summary} for targets with at least one reaction
+    """
+    targets = queryset.filter(reactions_count__gt=0).only('id',
+                                                          *COUNTER_FIELDS)
+    return {target.id: get_reaction_summary(target) for target in targets}
+
+
+def update_reaction_counters(reaction_deltas, post_id=None, comment_id=None):
+    """
+    Applies {reaction_type: delta} to the counters of one post or comment,
+    and to the sentiment tallies and the version of a post, in a single
+    UPDATE.
+    :param reaction_deltas:
+    :param post_id:
+    :param comment_id:
+    :return:
+    """
+    changes = {}
+    for reaction, delta in reaction_deltas.items():
+        if delta:
+            field = REACTION_COUNT_FIELDS[reaction]
+            changes[field] = F(field) + delta
+    total_delta = sum(reaction_deltas.values())
+    if total_delta:
+        changes['reactions_count'] = F('reactions_count') + total_delta
+    if not changes:
+        return
+    if post_id is not None:
+        for field, delta in get_sentiment_deltas(reaction_deltas).items():
+            if delta:
+                changes[field] = F(field) + delta
+        changes.update(get_next_version())
+        Post.objects.filter(id=post_id).update(**changes)
+    else:
+        Comment.objects.filter(id=comment_id).update(**changes)
+
+
+def add_to_total_reaction_count(delta):
+    """
+    Adds ``delta`` to a random shard of the total reaction count; call it in
+    the transaction that writes the React rows.
+    :param delta:
+    :return:
+    """
+    if not delta:
+        return
+    shard = random.randrange(REACTION_COUNT_SHARDS)
+    updated = ReactionCountShard.objects.filter(shard=shard).update(
+        count=F('count') + delta)
+    if not updated:
+        ReactionCountShard.objects.get_or_create(shard=shard)
+        ReactionCountShard.objects.filter(shard=shard).update(
+            count=F('count') + delta)
+
+
+def get_total_reaction_count_from_shards():
+    return ReactionCountShard.objects.aggregate(
+        count=Coalesce(Sum('count'), 0))['count']
+
+
+def compact_reaction_count_shards(dry_run=False):
+    """
+    Verifies the shard total against the React table and folds all shards
+    into shard 0 holding the real count. Reactions in the tree of a deleted
+    post left the total at delete_post and are not counted. The shards are
+    locked before React is counted, so a writer either committed before the
+    count or adds its delta after the compaction.
+    :param dry_run: only verify
+    :return: (total of the shards, number of React rows)
+    """
+    with atomic():
+        stored_total = sum(ReactionCountShard.objects.select_for_update()
+                           .order_by('shard').values_list('count', flat=True))
+        actual_total = React.objects.count() - sum(
+            count_tree_reactions(post_id) for post_id in
+            Post.all_objects.filter(deleted_at__isnull=False).values_list(
+                'id', flat=True))
+        if not dry_run:
+            ReactionCountShard.objects.exclude(shard=0).update(count=0)
+            ReactionCountShard.objects.update_or_create(
+                shard=0, defaults={'count': actual_total})
+    return stored_total, actual_total
+
+
+def toggle_reaction(user_id, reaction_type, post_id=None, comment_id=None):
+    """
+    Creates, replaces or removes the reaction of a user on one post or
+    comment and adjusts the target's reaction counters. Every statement is an
+    indexed lookup on the (reacted_by, post) / (reacted_by, comment) unique
+    constraints or the target's primary key, so the cost does not depend on
+    the size of the React table. Must run inside a transaction.
+    :param user_id:
+    :param reaction_type:
+    :param post_id:
+    :param comment_id:
+    :return: REACTION_CREATED, REACTION_UPDATED or REACTION_DELETED
+    """
+    target = get_target_filter(post_id, comment_id)
+    existing = React.objects.select_for_update().filter(
+        reacted_by_id=user_id, **target).values_list('id', 'reaction').first()
+
+    if existing is None:
+        try:
+            with atomic():
+                React.objects.create(reaction=reaction_type,
+                                     reacted_at=datetime.now(),
+                                     reacted_by_id=user_id, **target)
+        except IntegrityError:
+            # A concurrent click from the same user inserted first; toggle
+            # against the row it wrote.
+            existing = React.objects.select_for_update().filter(
+                reacted_by_id=user_id, **target).values_list(
+                'id', 'reaction').get()
+        else:
+            update_reaction_counters({reaction_type: 1}, post_id, comment_id)
+            add_to_total_reaction_count(1)
+            return REACTION_CREATED
+
+    reaction_id, existing_reaction = existing
+    if existing_reaction == reaction_type:
+        React.objects.filter(id=reaction_id).delete()
+        update_reaction_counters({existing_reaction: -1}, post_id, comment_id)
+        add_to_total_reaction_count(-1)
+        return REACTION_DELETED
+    React.objects.filter(id=reaction_id).update(reaction=reaction_type,
+                                                reacted_at=datetime.now())
+    update_reaction_counters({existing_reaction: -1, reaction_type: 1},
+                             post_id, comment_id)
+    return REACTION_UPDATED
+
+
+def get_existing_reactions(keys):
+    """
+    :param keys: list of (user_id, post_id, comment_id)
+    :return: {key: (reaction id, reaction type)} for keys with a reaction
+    """
+    existing = {}
+    key_set = set(keys)
+    for target in ('post_id', 'comment_id'):
+        target_index = 1 if target == 'post_id' else 2
+        target_keys = sorted((key for key in keys
+                              if key[target_index] is not None),
+                             key=lambda key: key[target_index])
+        for start in range(0, len(target_keys), TOGGLE_LOOKUP_BATCH_SIZE):
+            batch = target_keys[start:start + TOGGLE_LOOKUP_BATCH_SIZE]
+            # Users x targets is a superset of the batch's pairs; both
+            # columns are covered by the (target, reacted_by) index and the
+            # extra pairs are dropped below.
+            rows = React.objects.filter(**{
+                target + '__in': {key[target_index] for key in batch},
+                'reacted_by_id__in': {key[0] for key in batch},
+            }).values_list('id', 'reacted_by_id', 'post_id', 'comment_id',
+                           'reaction')
+            for reaction_id, user_id, post_id, comment_id, reaction in rows:
+                key = (user_id, post_id, comment_id)
+                if key in key_set:
+                    existing[key] = (reaction_id, reaction)
+    return existing
+
+
+def apply_reaction_toggles(toggles, batch_size=COUNTER_BATCH_SIZE):
+    """
+    Set-based toggle_reaction for many clicks. The clicks are replayed in
+    order against the current reactions in memory, so repeated toggles of
+    one user on one target collapse into a single write. Existing reactions
+    are read in a few batched queries, then new ones are bulk-inserted,
+    changed ones bulk-updated and removed ones deleted by id; each touched
+    target gets one counter UPDATE. Must run inside a transaction.
+    :param toggles: list of (user_id, post_id, comment_id, reaction_type),
+        with exactly one of post_id / comment_id set
+    :param batch_size:
+    :return: one of REACTION_CREATED/UPDATED/DELETED per toggle
+    """
+    keys = list(dict.fromkeys(toggle[:3] for toggle in toggles))
+    existing = get_existing_reactions(keys)
+    states = {key: reaction for key, (_, reaction) in existing.items()}
+    actions = []
+    for user_id, post_id, comment_id, reaction_type in toggles:
+        key = (user_id, post_id, comment_id)
+        state = states.get(key)
+        if state is None:
+            actions.append(REACTION_CREATED)
+            states[key] = reaction_type
+        elif state == reaction_type:
+            actions.append(REACTION_DELETED)
+            states[key] = None
+        else:
+            actions.append(REACTION_UPDATED)
+            states[key] = reaction_type
+
+    now = datetime.now()
+    new_reactions = []
+    changed_reactions = []
+    deleted_reaction_ids = []
+    target_wise_deltas = defaultdict(lambda: defaultdict(int))
+    for key, final_reaction in states.items():
+        reaction_id, initial_reaction = existing.get(key, (None, None))
+        if final_reaction == initial_reaction:
+            continue
+        user_id, post_id, comment_id = key
+        deltas = target_wise_deltas[(post_id, comment_id)]
+        if initial_reaction is not None:
+            deltas[initial_reaction] -= 1
+        if final_reaction is not None:
+            deltas[final_reaction] += 1
+
+        if initial_reaction is None:
+            new_reactions.append(React(reaction=final_reaction,
+                                       reacted_at=now, reacted_by_id=user_id,
+                                       post_id=post_id, comment_id=comment_id))
+        elif final_reaction is None:
+            deleted_reaction_ids.append(reaction_id)
+        else:
+            changed_reactions.append(React(id=reaction_id,
+                                           reaction=final_reaction,
+                                           reacted_at=now))
+
+    React.objects.bulk_create(new_reactions, batch_size=batch_size)
+    React.objects.bulk_update(changed_reactions, ['reaction', 'reacted_at'],
+                              batch_size=batch_size)
+    for start in range(0, len(deleted_reaction_ids), batch_size):
+        React.objects.filter(
+            id__in=deleted_reaction_ids[start:start + batch_size]).delete()
+    for (post_id, comment_id), deltas in target_wise_deltas.items():
+        update_reaction_counters(deltas, post_id, comment_id)
+    add_to_total_reaction_count(len(new_reactions) - len(deleted_reaction_ids))
+    return actions
+
+
+def rebuild_reaction_counters(dry_run=False):
+    """
+    Recounts React rows per post and comment and overwrites counters and
+    post sentiment tallies that drifted, e.g. after rows were written or
+    cascaded outside the reaction write path.
+    :param dry_run: only report the drift
+    :return: list of (model label, object id, {field: (stored, actual)})
+    """
+    drift = []
+    for model, target in ((Post, 'post_id'), (Comment, 'comment_id')):
+        counter_fields = get_counter_fields(model)
+        target_wise_counts = defaultdict(dict)
+        rows = React.objects.filter(**{target + '__isnull': False}) \
+            .values_list(target, 'reaction').annotate(count=Count('id')) \
+            .order_by()
+        for target_id, reaction, count in rows:
+            if reaction in REACTION_COUNT_FIELDS:
+                target_wise_counts[target_id][reaction] = count
+
+        stale_ids = []
+        stored_rows = model.objects.values('id', *counter_fields).iterator(
+            chunk_size=COUNTER_BATCH_SIZE)
+        for stored in stored_rows:
+            actual = get_counter_values(
+                target_wise_counts.get(stored['id'], {}), counter_fields)
+            changed = {field: (stored[field], actual[field])
+                       for field in counter_fields
+                       if stored[field] != actual[field]}
+            if changed:
+                drift.append((model._meta.label, stored['id'], changed))
+                stale_ids.append(stored['id'])
+        if not dry_run:
+            for start in range(0, len(stale_ids), COUNTER_BATCH_SIZE):
+                recount_reaction_counters(
+                    model, stale_ids[start:start + COUNTER_BATCH_SIZE],
+                    counter_fields)
+    return drift
+
+
+def get_recount_expressions(model):
+    """
+    :return: {counter field: expression counting the React rows of the
+        row being updated}, for every field of get_counter_fields(model)
+    """
+    target = 'post_id' if model is Post else 'comment_id'
+
+    def count_reactions(reactions):
+        counts = React.objects.filter(
+            **{target: OuterRef('pk'), 'reaction__in': reactions}) \
+            .order_by().values(target).annotate(count=Count('id')) \
+            .values('count')
+        return Coalesce(Subquery(counts), 0)
+
+    expressions = {field: count_reactions([reaction])
+                   for reaction, field in REACTION_COUNT_FIELDS.items()}
+    expressions['reactions_count'] = count_reactions(
+        list(REACTION_COUNT_FIELDS))
+    if model is Post:
+        positive = count_reactions(POSITIVE_REACTION_TYPES)
+        negative = count_reactions(NEGATIVE_REACTION_TYPES)
+        expressions.update(positive_reactions_count=positive,
+                           negative_reactions_count=negative,
+                           reaction_margin=positive - negative)
+    return expressions
+
+
+def recount_reaction_counters(model, object_ids, fields):
+    """
+    Overwrites ``fields`` of the given posts or comments with counts of
+    their React rows. The rows are locked first where the database has row
+    locks, so a toggle either commits before the recount or adds its delta
+    after it; the recount itself is a single UPDATE, which SQLite never
+    interleaves with another writer.
+    :param fields: counter fields to recount
+    """
+    expressions = get_recount_expressions(model)
+    with atomic():
+        if connections[get_db()].features.has_select_for_update:
+            list(model.objects.select_for_update().filter(
+                id__in=object_ids).values_list('id', flat=True))
+        model.objects.filter(id__in=object_ids).update(
+            **{field: expressions[field] for field in fields})
+
+
+def get_counter_values(reaction_counts, counter_fields=COUNTER_FIELDS):
+    """
+    :param reaction_counts: {reaction_type: count}
+    :param counter_fields: COUNTER_FIELDS, plus SENTIMENT_FIELDS for posts
+    :return: {field: value} for every field in counter_fields
+    """
+    values = {REACTION_COUNT_FIELDS[reaction]: reaction_counts.get(reaction, 0)
+              for reaction in REACTION_COUNT_FIELDS}
+    values['reactions_count'] = sum(reaction_counts.values())
+    values.update(get_sentiment_deltas(reaction_counts))
+    return {field: values[field] for field in counter_fields}
+
+
+def backfill_post_sentiment(batch_size=COUNTER_BATCH_SIZE, start_after=0,
+                            progress=None):
+    """
+    Recomputes the sentiment tallies of every post from its React rows, in
+    batches of posts walked by id, so it can run on a live table and resume
+    with ``start_after`` set to the last id it reported. Each batch is
+    counted and written by recount_reaction_counters, so toggles made
+    meanwhile are kept.
+    :param batch_size: posts per batch
+    :param start_after: post id to resume after
+    :param progress: called with (posts done, last post id) after each batch
+    :return: number of posts visited
+    """
+    done = 0
+    last_id = start_after
+    while True:
+        post_ids = list(Post.objects.filter(id__gt=last_id).order_by(
+            'id').values_list('id', flat=True)[:batch_size])
+        if not post_ids:
+            return done
+        recount_reaction_counters(Post, post_ids, SENTIMENT_FIELDS)
+        done += len(post_ids)
+        last_id = post_ids[-1]
+        if progress is not None:
+            progress(done, last_id)
@@ -0,0 +1,135 @@
+"""
+Read-replica routing for fb_post.
+
+Inside a replica_reads() scope, which ReadReplicaMiddleware opens for every
+request, reads go to one of the FB_POST_READ_REPLICAS database aliases.
+The first write of the scope pins it to the primary ('default'), so a
+request reads its own writes; reads inside a transaction on the primary
+stay there as well. Functions that write pin the scope as soon as they
+are called (pinned_to_primary), so the checks they run before writing do
+not read a lagging replica. Outside a scope, for instance in management
+commands, everything uses the primary.
+
+Code running on a database shard (fb_post.sharding.use_shard) reads and
+writes that shard, replicas or not. Every write also empties the identity
+map of the current scope (fb_post.identity_map).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from fb_post.identity_map import clear_identity_map
+from fb_post.sharding import get_current_shard, get_shards
+
+
+class ReadScope:
+    def __init__(self):
+        self.pinned = False
+
+
+# A mutable scope object rather than a flag, so a write in a worker thread
+# (async views) pins the request that started it.
+_read_scope = ContextVar('fb_post_read_scope', default=None)
+
+
+def get_read_replicas():
+    return getattr(settings, 'FB_POST_READ_REPLICAS', [])
+
+
+@contextmanager
+def replica_reads(scope=None):
+    """
+    Lets reads use the replicas until the first write.
+    :param scope: ReadScope to continue, say for the streamed body of a
+        response; a new one by default
+    """
+    token = _read_scope.set(scope or ReadScope())
+    try:
+        yield
+    finally:
+        _read_scope.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """
+    Sends the reads of the enclosed block to the primary.
+    """
+    token = _read_scope.set(None)
+    try:
+        yield
+    finally:
+        _read_scope.reset(token)
+
+
+def iter_in_scope(iterable, scope):
+    """
+    :return: iterator over ``iterable`` that advances it inside
+        replica_reads(scope)
+    """
+    iterator = iter(iterable)
+    while True:
+        with replica_reads(scope):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def pin_to_primary():
+    scope = _read_scope.get()
+    if scope is not None:
+        scope.pinned = True
+
+
+def pinned_to_primary(func):
+    """
+    Decorator for functions that write: pins the read scope to the primary
+    and empties the identity map before the function runs, so everything
+    it reads sees the rows its writes are going to change.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        pin_to_primary()
+        clear_identity_map()
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def is_pinned_to_primary():
+    scope = _read_scope.get()
+    return scope is None or scope.pinned
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        shard = get_current_shard()
+        if shard is not None:
+            return shard
+        replicas = get_read_replicas()
+        if not replicas or is_pinned_to_primary() or \
+                connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        clear_identity_map()
+        return get_current_shard() or DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_read_replicas(), *get_shards()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema with the data from the copy job.
+        if db in get_read_replicas():
+            return False
+        return None
@@ -0,0 +1,240 @@
+import random
+from collections import Counter
+from datetime import datetime
+
+from django.db import connection, transaction
+
+from fb_post.models import User, Post, Comment, React, \
+    POSITIVE_REACTION_TYPES, NEGATIVE_REACTION_TYPES
+from fb_post.reactions import get_counter_fields, get_counter_values, \
+    add_to_total_reaction_count
+
+SEED_BATCH_SIZE = 2000
+AUTHORS_PER_CHUNK = 100
+POST_SHAPE = 1.5
+MAX_POSTS_PER_USER = 200
+COMMENTS_PER_POST = 3
+REPLIES_PER_COMMENT = 2
+MAX_REPLY_DEPTH = 3
+REACTIONS_PER_POST = 20
+REACTIONS_PER_COMMENT = 3
+REACTION_SHAPE = 1.2
+POSITIVE_SHARE = 0.7
+PROFILE_PIC = 'https://www.shutterstock.com/image-photo/large-thick-' \
+              'industrial-black-metal-chain-1081708619'
+
+
+def get_user_name_prefix(seed):
+    return 'seed {} user '.format(seed)
+
+
+def pick_count(rng, mean):
+    # Exponential draw around ``mean``: most objects get a few children and
+    # a handful get many.
+    return int(rng.expovariate(1 / mean)) if mean > 0 else 0
+
+
+def pick_reaction_count(rng, mean, user_count):
+    # Pareto draw with the given mean; the heavy tail makes some posts viral.
+    scale = mean * (REACTION_SHAPE - 1) / REACTION_SHAPE
+    return min(user_count, int(scale * rng.paretovariate(REACTION_SHAPE)))
+
+
+def pick_reactions(rng, user_ids, mean, positive_share):
+    """
+    :return: list of (user id, reaction type), at most one per user
+    """
+    reactions = []
+    for user_id in rng.sample(user_ids,
+                              pick_reaction_count(rng, mean, len(user_ids))):
+        if rng.random() < positive_share:
+            reaction_types = POSITIVE_REACTION_TYPES
+        else:
+            reaction_types = NEGATIVE_REACTION_TYPES
+        reactions.append((user_id, rng.choice(reaction_types)))
+    return reactions
+
+
+def get_reaction_counters(model, reactions):
+    return get_counter_values(
+        Counter(reaction_type for _, reaction_type in reactions),
+        get_counter_fields(model))
+
+
+def insert_rows(model, field_names, rows, batch_size):
+    """
+    Plain executemany INSERT for rows whose ids are not needed back; it skips
+    building a model instance per row, which dominates bulk_create at
+    millions of rows.
+    :param rows: iterable of tuples of database values for ``field_names``
+    """
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(model._meta.get_field(name).column)
+                  for name in field_names),
+        ', '.join(['%s'] * len(field_names)))
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+    return len(rows)
+
+
+def seed_users(count, seed, batch_size=SEED_BATCH_SIZE):
+    """
+    Creates the seed users that do not exist yet.
+    :return: ids of the ``count`` seed users in creation order
+    """
+    prefix = get_user_name_prefix(seed)
+    user_ids = list(User.objects.filter(name__startswith=prefix).order_by(
+        'id').values_list('id', flat=True)[:count])
+    users = User.objects.bulk_create(
+        (User(name=prefix + str(index), profile_pic=PROFILE_PIC)
+         for index in range(len(user_ids), count)),
+        batch_size=batch_size)
+    return user_ids + [user.id for user in users]
+
+
+def get_seeded_chunk_count(author_chunks):
+    """
+    Chunks are committed one by one in order and every author gets at least
+    one post, so the chunks with posts form a prefix; binary search for it.
+    """
+    low, high = 0, len(author_chunks)
+    while low < high:
+        middle = (low + high) // 2
+        if Post.objects.filter(
+                posted_by_id__in=author_chunks[middle]).exists():
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def create_comments(targets, rng, user_ids, options, now):
+    """
+    :param targets: list of (post id, parent comment id, mean number of
+        comments) to comment on
+    :return: list of (comment, reactions)
+    """
+    comments = []
+    for post_id, parent_comment_id, mean in targets:
+        for _ in range(pick_count(rng, mean)):
+            reactions = pick_reactions(rng, user_ids,
+                                       options['reactions_per_comment'],
+                                       options['positive_share'])
+            comment = Comment(content='seed comment', commented_at=now,
+                              commented_by_id=rng.choice(user_ids),
+                              post_id=post_id,
+                              parent_comment_id=parent_comment_id,
+                              **get_reaction_counters(Comment, reactions))
+            comments.append((comment, reactions))
+    Comment.objects.bulk_create([comment for comment, _ in comments],
+                                batch_size=options['batch_size'])
+    return comments
+
+
+def seed_author_chunk(rng, author_ids, user_ids, options):
+    """
+    Writes the posts of ``author_ids`` with their comment trees and
+    reactions. Counters are filled in before the insert, so no recount is
+    needed afterwards.
+    :return: {"posts", "comments", "reactions"} row counts
+    """
+    from fb_post.utils import set_comment_paths
+
+    now = datetime.now()
+    posts = []
+    for author_id in author_ids:
+        post_count = min(options['max_posts_per_user'],
+                         int(rng.paretovariate(options['post_shape'])))
+        for index in range(post_count):
+            reactions = pick_reactions(rng, user_ids,
+                                       options['reactions_per_post'],
+                                       options['positive_share'])
+            posts.append((Post(content='seed post {}'.format(index),
+                               posted_at=now, posted_by_id=author_id,
+                               **get_reaction_counters(Post, reactions)),
+                          reactions))
+    Post.objects.bulk_create([post for post, _ in posts],
+                             batch_size=options['batch_size'])
+
+    levels = [create_comments(
+        [(post.id, None, options['comments_per_post']) for post, _ in posts],
+        rng, user_ids, options, now)]
+    for depth in range(1, options['max_reply_depth'] + 1):
+        levels.append(create_comments(
+            [(None, comment.id, options['replies_per_comment'] / depth)
+             for comment, _ in levels[-1]],
+            rng, user_ids, options, now))
+    comments = [comment for level in levels for comment in level]
+    set_comment_paths([comment.id for comment, _ in comments])
+
+    reacted_at = React._meta.get_field('reacted_at').get_db_prep_save(
+        now, connection)
+    reaction_count = insert_rows(
+        React, ('post', 'comment', 'reacted_by', 'reaction', 'reacted_at'),
+        [(post.id, None, user_id, reaction_type, reacted_at)
+         for post, reactions in posts
+         for user_id, reaction_type in reactions] +
+        [(None, comment.id, user_id, reaction_type, reacted_at)
+         for comment, reactions in comments
+         for user_id, reaction_type in reactions],
+        options['batch_size'])
+    add_to_total_reaction_count(reaction_count)
+    return {'posts': len(posts), 'comments': len(comments),
+            'reactions': reaction_count}
+
+
+def seed_graph(users, seed=0, progress=None, **options):
+    """
+    Builds a deterministic fb_post graph with batched bulk_create: ``users``
+    users, a power-law number of posts per user, comment and reply trees and
+    heavy-tailed reactions. Authors are written in chunks, one transaction
+    each, from a random stream derived from (seed, chunk), so a run that was
+    interrupted resumes, given the same arguments, with the first chunk it
+    had not committed and ends with the same rows as an uninterrupted one.
+    :param users: number of seed users
+    :param seed:
+    :param progress: called with (authors done, authors total, row counts)
+        after every chunk
+    :param options: overrides of post_shape, max_posts_per_user,
+        comments_per_post, replies_per_comment, max_reply_depth,
+        reactions_per_post, reactions_per_comment, positive_share,
+        batch_size and authors_per_chunk
+    :return: {"users", "posts", "comments", "reactions"} rows written by
+        this run, "users" being all seed users, and "skipped_authors"
+        already seeded by an earlier run
+    """
+    options = dict({'post_shape': POST_SHAPE,
+                    'max_posts_per_user': MAX_POSTS_PER_USER,
+                    'comments_per_post': COMMENTS_PER_POST,
+                    'replies_per_comment': REPLIES_PER_COMMENT,
+                    'max_reply_depth': MAX_REPLY_DEPTH,
+                    'reactions_per_post': REACTIONS_PER_POST,
+                    'reactions_per_comment': REACTIONS_PER_COMMENT,
+                    'positive_share': POSITIVE_SHARE,
+                    'batch_size': SEED_BATCH_SIZE,
+                    'authors_per_chunk': AUTHORS_PER_CHUNK}, **options)
+    with transaction.atomic():
+        user_ids = seed_users(users, seed, options['batch_size'])
+    chunk_size = options['authors_per_chunk']
+    author_chunks = [user_ids[start:start + chunk_size]
+                     for start in range(0, len(user_ids), chunk_size)]
+    first_chunk = get_seeded_chunk_count(author_chunks)
+
+    counts = {'users': len(user_ids), 'posts': 0, 'comments': 0,
+              'reactions': 0,
+              'skipped_authors': min(len(user_ids), first_chunk * chunk_size)}
+    for chunk_index in range(first_chunk, len(author_chunks)):
+        rng = random.Random('{}:{}'.format(seed, chunk_index))
+        with transaction.atomic():
+            chunk_counts = seed_author_chunk(
+                rng, author_chunks[chunk_index], user_ids, options)
+        for key, count in chunk_counts.items():
+            counts[key] += count
+        if progress is not None:
+            progress(min(len(user_ids), (chunk_index + 1) * chunk_size),
+                     len(user_ids), counts)
+    return counts
@@ -0,0 +1,328 @@
+"""
+Partitioning of fb_post data by author across database aliases.
+
+FB_POST_SHARDS lists the aliases, 'default' first. A post lives on the
+shard of its author, FB_POST_SHARDS[user_id % len(FB_POST_SHARDS)], and its
+comments, replies and reactions live with it, so every thread is read and
+written on one database. Users are read on every shard and fb_post never
+writes them: create them with create_user(), which stores the same row on
+each shard.
+
+Shard i allocates post, comment and reaction ids from i * SHARD_ID_SPAN
+(see reserve_id_ranges), so an id names its shard without a lookup; the
+shards other than 'default' have to be SQLite or PostgreSQL databases. The
+fb_post.utils functions run on their shard through on_shard_of() and the
+ones spanning authors fan out over the shards and merge. With the default
+single shard nothing is routed.
+
+Changing the number of shards moves users to other shards; it needs a
+data migration, which this module does not do.
+"""
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+
+# Comment paths hold ids as 12 digit segments (PATH_SEGMENT_WIDTH), which
+# leaves room for 100 shards of 10**10 ids each.
+SHARD_ID_SPAN = 10 ** 10
+# Vendors whose id sequences reserve_id_ranges knows how to move.
+SHARD_VENDORS = ('sqlite', 'postgresql')
+
+_current_shard = ContextVar('fb_post_shard', default=None)
+# Tokens of the use_shard() opened by route_migrations.
+_migration_tokens = []
+
+
+def get_shards():
+    return getattr(settings, 'FB_POST_SHARDS', [DEFAULT_DB_ALIAS])
+
+
+def is_sharded():
+    return len(get_shards()) > 1
+
+
+def get_user_shard(user_id):
+    shards = get_shards()
+    if not isinstance(user_id, int):
+        return shards[0]
+    return shards[user_id % len(shards)]
+
+
+def get_id_shard(object_id):
+    """
+    :return: alias of the shard a post, comment or reaction id was allocated
+        on; the first shard for ids no shard allocates, where validation
+        then fails to find them
+    """
+    shards = get_shards()
+    if not isinstance(object_id, int) or object_id < 0:
+        return shards[0]
+    index = object_id // SHARD_ID_SPAN
+    return shards[index] if index < len(shards) else shards[0]
+
+
+def get_record_shard(record):
+    """
+    :param record: bulk_* record; its post_id, comment_id or else user_id
+        decides
+    """
+    if record.get('post_id') is not None:
+        return get_id_shard(record['post_id'])
+    if record.get('comment_id') is not None:
+        return get_id_shard(record['comment_id'])
+    return get_user_shard(record.get('user_id'))
+
+
+def get_current_shard():
+    return _current_shard.get()
+
+
+def get_db():
+    """
+    :return: alias the current code reads and writes fb_post rows on
+    """
+    return _current_shard.get() or DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Routes fb_post queries of the enclosed block to ``alias``; None leaves
+    them to the other routing rules.
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def atomic(func=None):
+    """
+    transaction.atomic on the current shard, as a decorator or a context
+    manager.
+    """
+    if func is None:
+        return transaction.atomic(using=get_db())
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with transaction.atomic(using=get_db()):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def iter_on_shard(iterator, alias):
+    """
+    :return: iterator over ``iterator`` that advances it inside
+        use_shard(alias)
+    """
+    while True:
+        with use_shard(alias):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def on_shard_of(argument):
+    """
+    Decorator running the function on the shard of one of its arguments:
+    ``user_id`` goes through get_user_shard, other ids through get_id_shard.
+    Generators are advanced on the shard too.
+    """
+    get_shard = get_user_shard if argument == 'user_id' else get_id_shard
+
+    def decorator(func):
+        position = list(inspect.signature(func).parameters).index(argument)
+
+        def get_alias(args, kwargs):
+            if len(args) > position:
+                return get_shard(args[position])
+            return get_shard(kwargs.get(argument))
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                if not is_sharded():
+                    yield from func(*args, **kwargs)
+                    return
+                yield from iter_on_shard(func(*args, **kwargs),
+                                         get_alias(args, kwargs))
+            return generator_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_sharded():
+                return func(*args, **kwargs)
+            with use_shard(get_alias(args, kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def group_by_shard(object_ids, get_shard=get_id_shard):
+    """
+    :return: {alias: ids in input order}; {None: ids} without sharding
+    """
+    if not is_sharded():
+        return {None: list(object_ids)}
+    shard_wise_ids = {}
+    for object_id in object_ids:
+        shard_wise_ids.setdefault(get_shard(object_id), []).append(object_id)
+    return shard_wise_ids
+
+
+def for_each_shard(func, *args, **kwargs):
+    """
+    :return: [func(*args, **kwargs) run on each shard], in shard order
+    """
+    if not is_sharded():
+        return [func(*args, **kwargs)]
+    results = []
+    for alias in get_shards():
+        with use_shard(alias):
+            results.append(func(*args, **kwargs))
+    return results
+
+
+def on_record_shards(func):
+    """
+    Decorator for the bulk_* functions: runs ``func`` once per shard on the
+    records of that shard and puts the (aligned results, {index: error})
+    pairs back in record order.
+    """
+    @wraps(func)
+    def wrapper(records, *args, **kwargs):
+        records = list(records)
+        if not is_sharded():
+            return func(records, *args, **kwargs)
+        shard_wise_indexes = group_by_shard(
+            range(len(records)),
+            get_shard=lambda index: get_record_shard(records[index]))
+        results = [None] * len(records)
+        errors = {}
+        for alias, indexes in shard_wise_indexes.items():
+            with use_shard(alias):
+                shard_results, shard_errors = func(
+                    [records[index] for index in indexes], *args, **kwargs)
+            for index, result in zip(indexes, shard_results):
+                results[index] = result
+            errors.update({indexes[shard_index]: error
+                           for shard_index, error in shard_errors.items()})
+        return results, dict(sorted(errors.items()))
+    return wrapper
+
+
+def on_id_shards(func):
+    """
+    Decorator for the functions building {id: details} for a list of post
+    or comment ids: runs ``func`` once per shard on the ids of that shard
+    and merges the dicts.
+    """
+    @wraps(func)
+    def wrapper(object_ids, *args, **kwargs):
+        if not is_sharded():
+            return func(object_ids, *args, **kwargs)
+        shard_wise_ids = group_by_shard(object_ids)
+        if not shard_wise_ids:
+            return func([], *args, **kwargs)
+        results = None
+        for alias, shard_ids in shard_wise_ids.items():
+            with use_shard(alias):
+                shard_results = func(shard_ids, *args, **kwargs)
+            if results is None:
+                results = shard_results
+            else:
+                results.update(shard_results)
+        return results
+    return wrapper
+
+
+def create_user(name, profile_pic):
+    """
+    Creates a user on every shard under one id.
+    :return: user id
+    """
+    from fb_post.models import User
+
+    shards = get_shards()
+    with transaction.atomic(using=shards[0]):
+        user = User.objects.using(shards[0]).create(name=name,
+                                                    profile_pic=profile_pic)
+    for alias in shards[1:]:
+        User.objects.using(alias).create(id=user.id, name=name,
+                                         profile_pic=profile_pic)
+    return user.id
+
+
+def check_shard_vendors():
+    """
+    Called when the app loads.
+    :raise ImproperlyConfigured: a shard other than the first is on a
+        database whose id sequences reserve_id_ranges cannot move
+    """
+    for alias in get_shards()[1:]:
+        vendor = connections[alias].vendor
+        if vendor not in SHARD_VENDORS:
+            raise ImproperlyConfigured(
+                'FB_POST_SHARDS: {} is a {} database; shards after the '
+                'first must be one of {}'.format(
+                    alias, vendor, ', '.join(SHARD_VENDORS)))
+
+
+def route_migrations(using, **kwargs):
+    """
+    pre_migrate receiver running the migrations of a database, a shard
+    say, inside use_shard(), so the ORM queries of data migrations go to
+    the migrated database and not to 'default'.
+    """
+    _migration_tokens.append(_current_shard.set(using))
+
+
+def end_migration_routing(using, **kwargs):
+    """
+    post_migrate receiver closing what route_migrations opened.
+    """
+    if _migration_tokens:
+        _current_shard.reset(_migration_tokens.pop())
+
+
+def reserve_id_ranges(using, **kwargs):
+    """
+    post_migrate receiver moving the id sequences of the Post, Comment and
+    React tables of shard i up to i * SHARD_ID_SPAN.
+    """
+    from fb_post.models import Comment, Post, React
+
+    shards = get_shards()
+    if using not in shards[1:]:
+        return
+    start = shards.index(using) * SHARD_ID_SPAN
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        for model in (Post, Comment, React):
+            table = model._meta.db_table
+            if connection.vendor == 'sqlite':
+                cursor.execute('SELECT seq FROM sqlite_sequence '
+                               'WHERE name = %s', [table])
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute('INSERT INTO sqlite_sequence (name, seq) '
+                                   'VALUES (%s, %s)', [table, start])
+                elif row[0] < start:
+                    cursor.execute('UPDATE sqlite_sequence SET seq = %s '
+                                   'WHERE name = %s', [start, table])
+            else:
+                # postgresql; check_shard_vendors turns away the others.
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    "GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {})))"
+                    .format(connection.ops.quote_name(table)),
+                    [table, start])
@@ -0,0 +1,101 @@
+import re
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from fb_post.purge import purge_deleted_posts
+from fb_post.utils import *
+
+# "SCAN <table>" is SQLite's plan step for reading a whole table (or a whole
+# index, with "USING COVERING INDEX"); indexed access shows up as "SEARCH".
+FULL_SCAN = re.compile(r'\bSCAN (?:TABLE )?(fb_post_\w+)')
+# Tables whose size is fixed by design, where a scan is the cheapest plan.
+FIXED_SIZE_TABLES = {'fb_post_reactioncountshard'}
+
+
+@pytest.fixture
+def post_graph():
+    user_one = User.objects.create(name='Rohit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    user_two = User.objects.create(name='Summit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user_one.id)
+    comment = Comment.objects.create(content='first comment',
+                                     commented_at=datetime.now(),
+                                     commented_by=user_two, post_id=post.id)
+    reply = Comment.objects.create(content='first reply',
+                                   commented_at=datetime.now(),
+                                   commented_by=user_one,
+                                   parent_comment_id=comment.id)
+    react_to_post(user_two.id, post.id, 'HA')
+    react_to_comment(user_one.id, comment.id, 'WO')
+    react_to_comment(user_two.id, reply.id, 'SA')
+    return {'user_one': user_one, 'user_two': user_two, 'post': post,
+            'comment': comment, 'reply': reply}
+
+
+HOT_CALLS = {
+    'create_post': lambda g: create_post(g['user_one'].id, 'post'),
+    'create_comment': lambda g: create_comment(g['user_two'].id, g['post'].id,
+                                               'comment'),
+    'reply_to_comment': lambda g: reply_to_comment(g['user_one'].id,
+                                                   g['comment'].id, 'reply'),
+    'react_to_post': lambda g: react_to_post(g['user_two'].id, g['post'].id,
+                                             'LO'),
+    'react_to_comment': lambda g: react_to_comment(g['user_one'].id,
+                                                   g['comment'].id, 'WO'),
+    'get_reaction_metrics': lambda g: get_reaction_metrics(g['post'].id),
+    'get_total_reaction_count': lambda g: get_total_reaction_count(),
+    'get_posts_with_more_positive_reactions':
+        lambda g: get_posts_with_more_positive_reactions(
+            limit=10, order_by_margin=True, min_margin=1),
+    'delete_post': lambda g: delete_post(g['user_one'].id, g['post'].id),
+    'purge_deleted_posts': lambda g: (
+        delete_post(g['user_one'].id, g['post'].id), purge_deleted_posts()),
+    'get_posts_reacted_by_user': lambda g: get_posts_reacted_by_user(
+        g['user_two'].id),
+    'get_reactions_to_post': lambda g: get_reactions_to_post(g['post'].id),
+    'get_posts': lambda g: get_posts([g['post'].id]),
+    'get_user_posts': lambda g: get_user_posts(g['user_one'].id),
+    'get_user_posts_page': lambda g: get_user_posts_page(g['user_one'].id),
+    'get_replies_for_comments': lambda g: get_replies_for_comments(
+        g['comment'].id),
+    'get_replies_for_comments_page': lambda g: get_replies_for_comments_page(
+        g['comment'].id),
+    'get_comment_thread': lambda g: get_comment_thread(g['comment'].id,
+                                                       max_depth=3),
+}
+
+
+def get_full_scans(sql):
+    if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        plan = [row[-1] for row in cursor.fetchall()]
+    full_scans = []
+    for step in plan:
+        match = FULL_SCAN.search(step)
+        if match and match.group(1) not in FIXED_SIZE_TABLES:
+            full_scans.append(step)
+    return full_scans
+
+
+@pytest.mark.skipif(connection.vendor != 'sqlite',
+                    reason='plans are read with SQLite EXPLAIN QUERY PLAN')
+@pytest.mark.parametrize('name', sorted(HOT_CALLS))
+@pytest.mark.django_db
+def test_hot_queries_do_not_scan_whole_tables(name, post_graph):
+    # Arrange
+    call = HOT_CALLS[name]
+
+    # Act
+    with CaptureQueriesContext(connection) as context:
+        call(post_graph)
+
+    # Assert
+    full_scans = {query['sql']: get_full_scans(query['sql'])
+                  for query in context.captured_queries}
+    assert {sql: steps for sql, steps in full_scans.items() if steps} == {}
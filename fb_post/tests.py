@@ -1,7 +1,19 @@
 import json
+from contextlib import contextmanager
 
 import pytest
-
+from django.db import transaction
+
+from fb_post.identity_map import identity_scope
+from fb_post.json_encoding import dumps
+from fb_post.purge import purge_deleted_posts
+from fb_post.middleware import read_replica_middleware
+from fb_post.reaction_buffer import ReactionBuffer, coalesce_toggles, \
+    stop_reaction_buffer
+from fb_post.sharding import SHARD_ID_SPAN, create_user, get_id_shard, \
+    get_user_shard, group_by_shard, on_record_shards, on_shard_of
+from fb_post.routers import ReadReplicaRouter, is_pinned_to_primary, \
+    replica_reads
 from fb_post.utils import *
 from freezegun import freeze_time
 
@@ -394,10 +406,7 @@ def test_get_total_reaction_count_returns_count_of_total_reaction():
                                profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
     post = Post.objects.create(content='first post', posted_at=datetime.now(),
                                posted_by_id=user.id)
-    React.objects.create(post_id=post.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user.id)
+    react_to_post(user.id, post.id, 'HA')
     total_count = {'count': 1}
     # Act
     total = get_total_reaction_count()
@@ -430,14 +439,8 @@ def test_get_reaction_metrics_returns_metrics_of_reactions():
 
     post = Post.objects.create(content='first post', posted_at=datetime.now(),
                                posted_by_id=user_one.id)
-    React.objects.create(post_id=post.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(post_id=post.id,
-                         reaction='AN',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_two.id)
+    react_to_post(user_one.id, post.id, 'HA')
+    react_to_post(user_two.id, post.id, 'AN')
     metrics = {'HA': 1, 'AN': 1}
 
     # Act
@@ -522,14 +525,8 @@ def test_get_posts_with_more_positive_reactions_returns_list_of_post_ids():
     post_two = Post.objects.create(content='second post',
                                    posted_at=datetime.now(),
                                    posted_by_id=user_two.id)
-    React.objects.create(post_id=post_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(post_id=post_two.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_two.id)
+    react_to_post(user_one.id, post_one.id, 'HA')
+    react_to_post(user_two.id, post_two.id, 'WO')
     list_of_post_ids = [1, 2]
 
     # Act
@@ -537,6 +534,7 @@ def test_get_posts_with_more_positive_reactions_returns_list_of_post_ids():
 
     # Assert
     assert output == list_of_post_ids
+    assert Post.objects.get(id=post_one.id).reaction_margin == 1
 
 
 @pytest.mark.django_db
@@ -563,14 +561,8 @@ def test_get_posts_reacted_by_user_returns_list_of_post_ids():
     post_two = Post.objects.create(content='second post',
                                    posted_at=datetime.now(),
                                    posted_by_id=user_one.id)
-    React.objects.create(post_id=post_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(post_id=post_two.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_post(user_one.id, post_one.id, 'HA')
+    react_to_post(user_one.id, post_two.id, 'WO')
     list_of_post_ids = [1, 2]
 
     # Act
@@ -604,14 +596,8 @@ def test_get_reactions_to_post_returns_list_of_dictionaries():
     post_one = Post.objects.create(content='first post',
                                    posted_at=datetime.now(),
                                    posted_by_id=user_one.id)
-    React.objects.create(post_id=post_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(post_id=post_one.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_two.id)
+    react_to_post(user_one.id, post_one.id, 'HA')
+    react_to_post(user_two.id, post_one.id, 'WO')
     list_of_dictionaries = [{'user_id': 1,
                              'name': 'Rohit',
                              'profile_pic': 'https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619',
@@ -639,18 +625,10 @@ def test_get_reactions_detail_returns_list_of_dictionaries():
     post_one = Post.objects.create(content='first post',
                                    posted_at=datetime.now(),
                                    posted_by_id=user_one.id)
-    React.objects.create(post_id=post_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(post_id=post_one.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_two.id)
+    react_to_post(user_one.id, post_one.id, 'HA')
+    react_to_post(user_two.id, post_one.id, 'WO')
     list_of_dictionaries = defaultdict(list,
-                                       {1: [{'count': 2, 'type': {'HA', 'WO'}},
-                                            {'count': 2,
-                                             'type': {'HA', 'WO'}}]})
+                                       {1: [{'count': 2, 'type': {'HA', 'WO'}}]})
 
     # Act
     output = get_reactions_detail([post_one.id])
@@ -671,10 +649,7 @@ def test_get_reactions_detail_of_comments_returns_list_of_dictionaries():
                                          commented_at=datetime.now(),
                                          commented_by=user_one,
                                          post_id=post_one.id)
-    React.objects.create(comment_id=comment_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, comment_one.id, 'HA')
 
     list_of_dictionaries = defaultdict(list,
                                        {1: [{'count': 1, 'type': ['HA']}]})
@@ -702,10 +677,7 @@ def test_get_reactions_detail_of_comments_replies_returns_list_of_dictionaries()
                                        commented_at=datetime.now(),
                                        commented_by=user_one,
                                        parent_comment_id=comment_one.id)
-    React.objects.create(comment_id=reply_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, reply_one.id, 'HA')
 
     list_of_dictionaries = defaultdict(list, {2: [{'count': 1, 'type': [
         'HA']}]})
@@ -734,10 +706,7 @@ def test_get_replieses_details_returns_list_of_dictionaries():
                                        commented_at=datetime.now(),
                                        commented_by=user_one,
                                        parent_comment_id=comment_one.id)
-    React.objects.create(comment_id=reply_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, reply_one.id, 'HA')
 
     list_of_dictionaries = defaultdict(list,
                                        {1: [{'comment_id': 2,
@@ -774,14 +743,8 @@ def test_get_comments_details_returns_list_of_dictionaries():
                                          commented_at=datetime.now(),
                                          commented_by=user_one,
                                          post_id=post_one.id)
-    React.objects.create(comment_id=comment_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(comment_id=comment_two.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, comment_one.id, 'HA')
+    react_to_comment(user_one.id, comment_two.id, 'WO')
 
     list_of_dictionaries = defaultdict(list,
                                        {1: [{'comment_id': 1,
@@ -829,14 +792,8 @@ def test_get_posts_returns_list_of_dictionaries():
                                          commented_at=datetime.now(),
                                          commented_by=user_one,
                                          post_id=post_one.id)
-    React.objects.create(comment_id=comment_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(comment_id=comment_two.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, comment_one.id, 'HA')
+    react_to_comment(user_one.id, comment_two.id, 'WO')
 
     list_of_dictionaries = [{'post_id': 1,
                              'posted_by': {'user_id': 1,
@@ -892,14 +849,8 @@ def test_get_user_posts_validate_user():
                                          commented_at=datetime.now(),
                                          commented_by=user_one,
                                          post_id=post_one.id)
-    React.objects.create(comment_id=comment_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(comment_id=comment_two.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, comment_one.id, 'HA')
+    react_to_comment(user_one.id, comment_two.id, 'WO')
 
     # Act
     with pytest.raises(Exception) as e:
@@ -925,14 +876,8 @@ def test_get_user_posts_returns_list_of_dictionaries():
                                          commented_at=datetime.now(),
                                          commented_by=user_one,
                                          post_id=post_one.id)
-    React.objects.create(comment_id=comment_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(comment_id=comment_two.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, comment_one.id, 'HA')
+    react_to_comment(user_one.id, comment_two.id, 'WO')
 
     list_of_dictionaries = [{'post_id': 1,
                              'posted_by': {'user_id': 1,
@@ -988,14 +933,8 @@ def test_get_replies_for_comments_validate_comment():
                                          commented_at=datetime.now(),
                                          commented_by=user_one,
                                          post_id=post_one.id)
-    React.objects.create(comment_id=comment_one.id,
-                         reaction='HA',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
-    React.objects.create(comment_id=comment_two.id,
-                         reaction='WO',
-                         reacted_at=datetime.now(),
-                         reacted_by_id=user_one.id)
+    react_to_comment(user_one.id, comment_one.id, 'HA')
+    react_to_comment(user_one.id, comment_two.id, 'WO')
 
     # Act
     with pytest.raises(Exception) as e:
@@ -1036,3 +975,1647 @@ def test_get_replies_for_comments_returns_list_of_dictionaries(snapshot):
     # Assert
     k = json.dumps(list_of_dictionaries)
     snapshot.assert_match(k, response)
+
+
+@pytest.mark.django_db
+def test_get_missing_ids_returns_only_ids_without_rows():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+
+    # Act
+    missing_ids = get_missing_ids(Post, [7, post.id, 5, 7])
+
+    # Assert
+    assert missing_ids == [7, 5]
+
+
+@pytest.mark.django_db
+def test_validate_post_uses_confirmed_id_cache_until_post_is_deleted(
+        settings, django_assert_num_queries):
+    # Arrange
+    from fb_post.validation import confirmed_ids
+    settings.FB_POST_VALIDATION_CACHE_SIZE = 10
+    confirmed_ids.clear()
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+    validate_post(post.id)
+
+    # Act
+    with django_assert_num_queries(0):
+        validate_post(post.id)
+    delete_post(user.id, post.id)
+
+    # Assert
+    with pytest.raises(Exception) as e:
+        validate_post(post.id)
+    assert str(e.value) == "InvalidPostException"
+    confirmed_ids.clear()
+
+
+@pytest.mark.django_db
+def test_get_posts_reports_every_missing_post_id_in_one_query(
+        django_assert_num_queries):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+
+    # Act
+    with django_assert_num_queries(1):
+        with pytest.raises(InvalidPostException) as e:
+            get_posts([4, post.id, 9])
+
+    # Assert
+    assert str(e.value) == "InvalidPostException"
+    assert e.value.post_ids == [4, 9]
+
+
+@pytest.mark.django_db
+def test_react_to_post_reports_created_updated_and_deleted_actions():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+
+    # Act
+    actions = [react_to_post(user.id, post.id, 'HA'),
+               react_to_post(user.id, post.id, 'AN'),
+               react_to_post(user.id, post.id, 'AN')]
+
+    # Assert
+    assert actions == [REACTION_CREATED, REACTION_UPDATED, REACTION_DELETED]
+
+
+@pytest.mark.django_db
+def test_react_to_post_creates_reaction_when_user_reacted_to_another_post():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_one = Post.objects.create(content='first post',
+                                   posted_at=datetime.now(),
+                                   posted_by_id=user.id)
+    post_two = Post.objects.create(content='second post',
+                                   posted_at=datetime.now(),
+                                   posted_by_id=user.id)
+    react_to_post(user.id, post_one.id, 'HA')
+
+    # Act
+    action = react_to_post(user.id, post_two.id, 'HA')
+
+    # Assert
+    assert action == REACTION_CREATED
+    assert React.objects.filter(reacted_by_id=user.id).count() == 2
+
+
+@pytest.mark.django_db
+def test_toggle_reaction_issues_fixed_number_of_queries(
+        django_assert_max_num_queries):
+    # Arrange
+    from fb_post.reactions import toggle_reaction
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+    toggle_reaction(user.id, 'HA', post_id=post.id)
+
+    # Act
+    with django_assert_max_num_queries(3):
+        action = toggle_reaction(user.id, 'WO', post_id=post.id)
+
+    # Assert
+    assert action == REACTION_UPDATED
+
+
+@pytest.mark.django_db
+def test_react_to_post_maintains_reaction_counters_on_post():
+    # Arrange
+    user_one = User.objects.create(name='Rohit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    user_two = User.objects.create(name='Summit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user_one.id)
+    react_to_post(user_one.id, post.id, 'HA')
+    react_to_post(user_two.id, post.id, 'HA')
+
+    # Act
+    react_to_post(user_one.id, post.id, 'AN')
+    react_to_post(user_two.id, post.id, 'HA')
+    post.refresh_from_db()
+
+    # Assert
+    assert (post.haha_count, post.angry_count, post.reactions_count) == \
+           (0, 1, 1)
+
+
+@pytest.mark.django_db
+def test_react_to_post_validate_reaction_type():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+
+    # Act
+    with pytest.raises(Exception) as e:
+        react_to_post(user.id, post.id, 'XX')
+
+    # Assert
+    assert str(e.value) == "InvalidReactionTypeException"
+
+
+@pytest.mark.django_db
+def test_rebuild_reaction_counters_reports_and_fixes_drift():
+    # Arrange
+    from fb_post.reactions import rebuild_reaction_counters
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+    React.objects.create(post_id=post.id, reaction='WO',
+                         reacted_at=datetime.now(), reacted_by_id=user.id)
+
+    # Act
+    drift = rebuild_reaction_counters()
+
+    # Assert
+    assert drift == [('fb_post.Post', post.id,
+                      {'wow_count': (0, 1), 'reactions_count': (0, 1),
+                       'positive_reactions_count': (0, 1),
+                       'reaction_margin': (0, 1)})]
+    assert get_reaction_metrics(post.id) == {'WO': 1}
+    assert rebuild_reaction_counters() == []
+
+
+@pytest.mark.django_db
+def test_rebuild_reaction_counters_keeps_a_toggle_made_during_the_run(
+        monkeypatch):
+    # Arrange
+    from fb_post import reactions
+    users = [User.objects.create(name='user {}'.format(index),
+                                 profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+             for index in range(2)]
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=users[0].id)
+    React.objects.create(post_id=post.id, reaction='WO',
+                         reacted_at=datetime.now(), reacted_by_id=users[0].id)
+    get_counter_values = reactions.get_counter_values
+
+    def get_counter_values_then_toggle(*args):
+        values = get_counter_values(*args)
+        if not React.objects.filter(reacted_by_id=users[1].id).exists():
+            react_to_post(users[1].id, post.id, 'LO')
+        return values
+
+    monkeypatch.setattr(reactions, 'get_counter_values',
+                        get_counter_values_then_toggle)
+
+    # Act
+    reactions.rebuild_reaction_counters()
+
+    # Assert
+    assert get_reaction_metrics(post.id) == {'WO': 1, 'LO': 1}
+
+
+@pytest.mark.django_db
+def test_get_posts_query_count_does_not_grow_with_reactions(
+        django_assert_num_queries):
+    # Arrange
+    users = [User.objects.create(name='user {}'.format(index),
+                                 profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+             for index in range(3)]
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=users[0].id)
+    comment = Comment.objects.create(content='first comment',
+                                     commented_at=datetime.now(),
+                                     commented_by=users[0], post_id=post.id)
+    reply = Comment.objects.create(content='first reply',
+                                   commented_at=datetime.now(),
+                                   commented_by=users[1],
+                                   parent_comment_id=comment.id)
+    for user, reaction in zip(users, ['HA', 'WO', 'HA']):
+        react_to_post(user.id, post.id, reaction)
+        react_to_comment(user.id, comment.id, reaction)
+        react_to_comment(user.id, reply.id, reaction)
+
+    # Act
+    with django_assert_num_queries(4):
+        output = get_posts([post.id])
+
+    # Assert
+    assert output[0]['reactions'] == [{'count': 3, 'type': {'HA', 'WO'}}]
+    assert output[0]['comments'][0]['reaction'] == [
+        {'count': 3, 'type': ['WO', 'HA']}]
+    assert output[0]['comments'][0]['replies'][0]['reactions'] == [
+        {'count': 3, 'type': ['WO', 'HA']}]
+
+
+@pytest.mark.django_db
+def test_get_user_posts_page_walks_posts_newest_first_with_cursor():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'post {}'.format(index))
+                for index in range(3)]
+
+    # Act
+    first_page = get_user_posts_page(user.id, page_size=2)
+    second_page = get_user_posts_page(user.id, page_size=2,
+                                      cursor=first_page['next_cursor'])
+
+    # Assert
+    assert [post['post_id'] for post in first_page['posts']] == \
+           [post_ids[2], post_ids[1]]
+    assert [post['post_id'] for post in second_page['posts']] == \
+           [post_ids[0]]
+    assert second_page['next_cursor'] is None
+
+
+@freeze_time("2022-11-14 05:52:30+00:00", tz_offset=-4)
+@pytest.mark.django_db
+def test_get_replies_for_comments_page_splits_replies_with_same_timestamp():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+    comment = Comment.objects.create(content='first comment',
+                                     commented_at=datetime.now(),
+                                     commented_by=user, post_id=post.id)
+    reply_ids = [reply_to_comment(user.id, comment.id, 'reply')
+                 for _ in range(3)]
+
+    # Act
+    first_page = get_replies_for_comments_page(comment.id, page_size=2)
+    second_page = get_replies_for_comments_page(
+        comment.id, page_size=2, cursor=first_page['next_cursor'])
+
+    # Assert
+    assert [reply['comment_id'] for reply in first_page['replies'] +
+            second_page['replies']] == reply_ids
+    assert second_page['next_cursor'] is None
+
+
+@pytest.mark.django_db
+def test_get_user_posts_page_validate_cursor():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+
+    # Act
+    with pytest.raises(Exception) as e:
+        get_user_posts_page(user.id, cursor='not-a-cursor')
+
+    # Assert
+    assert str(e.value) == "InvalidCursorException"
+
+
+@pytest.fixture
+def post_cache(settings):
+    from django.core.cache import cache
+    from fb_post.post_cache import cache_stats
+    settings.FB_POST_CACHE_ENABLED = True
+    cache.clear()
+    cache_stats.reset()
+    yield cache_stats
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_get_posts_serves_cached_documents_and_loads_misses_in_one_batch(
+        post_cache, django_assert_num_queries):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_one = Post.objects.create(content='first post',
+                                   posted_at=datetime.now(),
+                                   posted_by_id=user.id)
+    post_two = Post.objects.create(content='second post',
+                                   posted_at=datetime.now(),
+                                   posted_by_id=user.id)
+    get_posts([post_one.id])
+
+    # Act
+    with django_assert_num_queries(3):
+        output = get_posts([post_two.id, post_one.id])
+
+    # Assert
+    assert [post['post_id'] for post in output] == [post_two.id, post_one.id]
+    assert post_cache.snapshot() == {'hits': 1, 'misses': 2}
+
+
+@pytest.mark.django_db
+def test_create_comment_invalidates_cached_post_document(
+        post_cache, django_capture_on_commit_callbacks):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post = Post.objects.create(content='first post', posted_at=datetime.now(),
+                               posted_by_id=user.id)
+    get_posts([post.id])
+
+    # Act
+    with django_capture_on_commit_callbacks(execute=True):
+        comment_id = create_comment(user.id, post.id, 'first comment')
+    with django_capture_on_commit_callbacks(execute=True):
+        reply_to_comment(user.id, comment_id, 'first reply')
+    output = get_posts([post.id])
+
+    # Assert
+    assert output[0]['comments_count'] == 1
+    assert output[0]['comments'][0]['replies_count'] == 1
+    assert post_cache.snapshot() == {'hits': 0, 'misses': 2}
+
+
+@pytest.mark.django_db
+def test_iter_user_posts_yields_posts_built_in_chunks():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'post {}'.format(index))
+                for index in range(5)]
+    posts = iter_user_posts(user.id, chunk_size=2)
+
+    # Act
+    first_post = next(posts)
+
+    # Assert
+    assert first_post['post_id'] == post_ids[0]
+    assert [post['post_id'] for post in posts] == post_ids[1:]
+
+
+@pytest.mark.django_db
+def test_iter_posts_validates_each_chunk():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    posts = iter_posts([post_id, 8, 9], chunk_size=1)
+
+    # Act
+    first_post = next(posts)
+    with pytest.raises(InvalidPostException) as e:
+        next(posts)
+
+    # Assert
+    assert first_post['post_id'] == post_id
+    assert e.value.post_ids == [8]
+
+
+@pytest.mark.django_db
+def test_create_comment_and_replies_store_materialized_paths():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+
+    # Act
+    comment_id = create_comment(user.id, post_id, 'first comment')
+    reply_id = reply_to_comment(user.id, comment_id, 'first reply')
+    nested_reply = Comment.objects.get(
+        id=reply_to_comment(user.id, reply_id, 'nested reply'))
+
+    # Assert
+    assert nested_reply.depth == 2
+    assert nested_reply.path == '{:012d}/{:012d}/{:012d}/'.format(
+        comment_id, reply_id, nested_reply.id)
+
+
+@pytest.mark.django_db
+def test_get_comment_thread_returns_nested_replies_in_one_query(
+        django_assert_num_queries):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+    reply_id = reply_to_comment(user.id, comment_id, 'first reply')
+    nested_reply_id = reply_to_comment(user.id, reply_id, 'nested reply')
+    second_reply_id = reply_to_comment(user.id, comment_id, 'second reply')
+    create_comment(user.id, post_id, 'other comment')
+
+    # Act
+    with django_assert_num_queries(3):
+        thread = get_comment_thread(comment_id)
+
+    # Assert
+    assert thread['comment_id'] == comment_id
+    assert [reply['comment_id'] for reply in thread['replies']] == \
+           [reply_id, second_reply_id]
+    assert thread['replies'][0]['replies'][0]['comment_id'] == nested_reply_id
+
+
+@pytest.mark.django_db
+def test_get_comment_thread_limits_depth_and_size():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+    reply_id = reply_to_comment(user.id, comment_id, 'first reply')
+    reply_to_comment(user.id, reply_id, 'nested reply')
+    reply_to_comment(user.id, comment_id, 'second reply')
+
+    # Act
+    shallow_thread = get_comment_thread(comment_id, max_depth=1)
+    small_thread = get_comment_thread(comment_id, max_size=2)
+
+    # Assert
+    assert [len(reply['replies']) for reply in shallow_thread['replies']] == \
+           [0, 0]
+    assert [reply['comment_id'] for reply in small_thread['replies']] == \
+           [reply_id]
+    assert small_thread['replies'][0]['replies'] == []
+
+
+@pytest.mark.django_db
+def test_get_comment_thread_keeps_the_comment_for_limits_below_one():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+    reply_to_comment(user.id, comment_id, 'first reply')
+
+    # Act
+    empty_size_thread = get_comment_thread(comment_id, max_size=0)
+    negative_depth_thread = get_comment_thread(comment_id, max_depth=-1)
+
+    # Assert
+    for thread in (empty_size_thread, negative_depth_thread):
+        assert thread['comment_id'] == comment_id
+        assert thread['replies'] == []
+
+
+@pytest.mark.django_db
+def test_get_comment_thread_follows_replies_past_the_old_path_length():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+    reply_id = comment_id
+    for _ in range(100):
+        reply_id = reply_to_comment(user.id, reply_id, 'reply')
+    bulk_reply_ids, _ = bulk_create_comments(
+        [{'user_id': user.id, 'comment_id': reply_id,
+          'comment_content': 'bulk reply'}])
+
+    # Act
+    thread = get_comment_thread(comment_id)
+
+    # Assert
+    depth = 0
+    while thread['replies']:
+        thread = thread['replies'][0]
+        depth += 1
+    assert depth == 101
+    assert thread['comment_id'] == bulk_reply_ids[0]
+    assert len(Comment.objects.get(id=bulk_reply_ids[0]).path) > 1000
+
+
+@pytest.mark.django_db
+def test_bulk_create_posts_returns_ids_and_per_record_errors():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    records = [{'user_id': user.id, 'post_content': 'first post'},
+               {'user_id': 9, 'post_content': 'second post'},
+               {'user_id': user.id, 'post_content': ''},
+               {'user_id': user.id, 'post_content': 'third post'}]
+
+    # Act
+    post_ids, errors = bulk_create_posts(records, batch_size=1)
+
+    # Assert
+    assert errors == {1: 'InvalidUserException', 2: 'InvalidPostContent'}
+    assert post_ids[1:3] == [None, None]
+    assert list(Post.objects.filter(id__in=post_ids).values_list(
+        'content', flat=True)) == ['first post', 'third post']
+
+
+@pytest.mark.django_db
+def test_bulk_create_comments_sets_reply_paths():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+    records = [{'user_id': user.id, 'post_id': post_id,
+                'comment_content': 'second comment'},
+               {'user_id': user.id, 'comment_id': comment_id,
+                'comment_content': 'first reply'},
+               {'user_id': user.id, 'comment_id': 99,
+                'comment_content': 'lost reply'}]
+
+    # Act
+    comment_ids, errors = bulk_create_comments(records)
+
+    # Assert
+    assert errors == {2: 'InvalidCommentException'}
+    assert [reply['comment_id'] for reply in
+            get_comment_thread(comment_id)['replies']] == [comment_ids[1]]
+    assert Comment.objects.get(id=comment_ids[0]).depth == 0
+
+
+@pytest.mark.django_db
+def test_bulk_react_replays_toggles_in_order_and_updates_counters():
+    # Arrange
+    user_one = User.objects.create(name='Rohit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    user_two = User.objects.create(name='Summit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user_one.id, 'first post')
+    react_to_post(user_two.id, post_id, 'SA')
+    records = [{'user_id': user_one.id, 'post_id': post_id,
+                'reaction_type': 'HA'},
+               {'user_id': user_one.id, 'post_id': post_id,
+                'reaction_type': 'HA'},
+               {'user_id': user_one.id, 'post_id': post_id,
+                'reaction_type': 'LO'},
+               {'user_id': user_two.id, 'post_id': post_id,
+                'reaction_type': 'WO'},
+               {'user_id': user_two.id, 'post_id': post_id,
+                'reaction_type': 'XX'}]
+
+    # Act
+    actions, errors = bulk_react(records)
+
+    # Assert
+    assert actions == [REACTION_CREATED, REACTION_DELETED, REACTION_CREATED,
+                       REACTION_UPDATED, None]
+    assert errors == {4: 'InvalidReactionTypeException'}
+    assert get_reaction_metrics(post_id) == {'LO': 1, 'WO': 1}
+
+
+@pytest.mark.django_db
+def test_bulk_records_with_both_post_and_comment_are_rejected():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+
+    # Act
+    comment_ids, comment_errors = bulk_create_comments(
+        [{'user_id': user.id, 'post_id': post_id, 'comment_id': comment_id,
+          'comment_content': 'second comment'}])
+    actions, react_errors = bulk_react(
+        [{'user_id': user.id, 'post_id': post_id, 'comment_id': comment_id,
+          'reaction_type': 'HA'}])
+
+    # Assert
+    assert comment_ids == [None]
+    assert comment_errors == {0: 'InvalidPostException'}
+    assert actions == [None]
+    assert react_errors == {0: 'InvalidPostException'}
+    assert Comment.objects.count() == 1
+    assert React.objects.count() == 0
+
+
+@pytest.fixture
+def metrics():
+    from fb_post.metrics import registry
+    registry.reset()
+    yield registry
+    registry.enabled = None
+    registry.reset()
+
+
+@pytest.mark.django_db
+def test_utils_functions_record_calls_and_queries(
+        metrics, django_assert_max_num_queries):
+    # Arrange
+    from fb_post.metrics import get_metrics_snapshot
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    metrics.reset()
+
+    # Act
+    with django_assert_max_num_queries(10) as context:
+        get_posts([post_id])
+    with pytest.raises(InvalidPostException):
+        get_posts([post_id + 1])
+
+    # Assert
+    snapshot = get_metrics_snapshot()
+    assert snapshot['get_posts']['calls'] == 2
+    assert snapshot['get_posts']['errors'] == 1
+    assert snapshot['build_posts']['calls'] == 1
+    assert snapshot['get_posts']['sql_queries']['sum'] == \
+        len(context.captured_queries) + 1
+    assert snapshot['get_posts']['duration_seconds']['count'] == 2
+
+
+@pytest.mark.django_db
+def test_iter_posts_metrics_cover_every_step_of_the_stream(metrics):
+    # Arrange
+    from fb_post.metrics import get_metrics_snapshot
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'post') for _ in range(3)]
+    metrics.reset()
+
+    # Act
+    posts = list(iter_posts(post_ids, chunk_size=2))
+
+    # Assert
+    snapshot = get_metrics_snapshot()
+    assert len(posts) == 3
+    assert snapshot['iter_posts']['calls'] == 1
+    assert snapshot['validate_posts']['calls'] == 2
+    assert snapshot['iter_posts']['sql_queries']['sum'] == \
+        snapshot['validate_posts']['sql_queries']['sum'] + \
+        snapshot['build_posts']['sql_queries']['sum']
+
+
+@pytest.mark.django_db
+def test_metrics_can_be_switched_off_at_runtime(metrics):
+    # Arrange
+    from fb_post.metrics import get_metrics_snapshot, set_enabled
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    set_enabled(False)
+
+    # Act
+    create_post(user.id, 'first post')
+
+    # Assert
+    assert get_metrics_snapshot() == {}
+
+
+@pytest.mark.django_db
+def test_metrics_view_renders_prometheus_text(metrics, client):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    create_post(user.id, 'first post')
+
+    # Act
+    response = client.get('/fb_post/metrics/')
+
+    # Assert
+    body = response.content.decode()
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert 'fb_post_calls_total{function="create_post"} 1' in body
+    assert 'fb_post_sql_queries_bucket{function="create_post",le="+Inf"} 1' \
+        in body
+
+
+def get_seeded_graph_signature():
+    return {
+        'posts': sorted(Post.objects.values_list(
+            'posted_by__name', 'content', 'reactions_count', 'sad_count')),
+        'comments': Comment.objects.count(),
+        'reactions': sorted(React.objects.values_list(
+            'reacted_by__name', 'post__content', 'reaction'), key=str),
+    }
+
+
+@pytest.mark.django_db
+def test_seed_graph_resumes_to_same_rows_after_interruption():
+    # Arrange
+    from fb_post.reactions import rebuild_reaction_counters
+    from fb_post.seeding import seed_graph
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(done, total, counts):
+        raise Interrupted()
+
+    seed_graph(12, seed=3, authors_per_chunk=4, reactions_per_post=4)
+    expected_signature = get_seeded_graph_signature()
+    User.objects.all().delete()
+    with pytest.raises(Interrupted):
+        seed_graph(12, seed=3, progress=interrupt, authors_per_chunk=4,
+                   reactions_per_post=4)
+
+    # Act
+    counts = seed_graph(12, seed=3, authors_per_chunk=4, reactions_per_post=4)
+
+    # Assert
+    assert counts['skipped_authors'] == 4
+    assert get_seeded_graph_signature() == expected_signature
+    assert rebuild_reaction_counters(dry_run=True) == []
+    assert Comment.objects.filter(path='').exists() is False
+
+
+@pytest.mark.django_db
+def test_seed_fb_post_command_reports_seeded_rows():
+    # Arrange
+    from io import StringIO
+    from django.core.management import call_command
+    out = StringIO()
+
+    # Act
+    call_command('seed_fb_post', users=5, positive_share=1, stdout=out)
+
+    # Assert
+    assert User.objects.count() == 5
+    assert 'authors 5/5' in out.getvalue()
+    assert React.objects.exclude(
+        reaction__in=POSITIVE_REACTION_TYPES).exists() is False
+
+
+@pytest.mark.django_db
+def test_get_posts_with_more_positive_reactions_orders_and_limits_by_margin():
+    # Arrange
+    users = [User.objects.create(name='user {}'.format(index),
+                                 profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+             for index in range(3)]
+    post_one = create_post(users[0].id, 'first post')
+    post_two = create_post(users[0].id, 'second post')
+    post_three = create_post(users[0].id, 'third post')
+    react_to_post(users[0].id, post_one, 'HA')
+    react_to_post(users[0].id, post_two, 'LI')
+    react_to_post(users[1].id, post_two, 'LO')
+    react_to_post(users[2].id, post_two, 'HA')
+    react_to_post(users[0].id, post_three, 'AN')
+    bulk_react([{'user_id': users[1].id, 'post_id': post_one,
+                 'reaction_type': 'WO'},
+                {'user_id': users[2].id, 'post_id': post_one,
+                 'reaction_type': 'TU'}])
+    react_to_post(users[1].id, post_one, 'TD')
+
+    # Act
+    by_margin = get_posts_with_more_positive_reactions(order_by_margin=True)
+    top_post = get_posts_with_more_positive_reactions(limit=1,
+                                                      order_by_margin=True)
+    at_least_zero = get_posts_with_more_positive_reactions(min_margin=0)
+
+    # Assert
+    assert by_margin == [post_two, post_one]
+    assert top_post == [post_two]
+    assert at_least_zero == [post_one, post_two]
+
+
+@pytest.mark.django_db
+def test_backfill_post_sentiment_fills_tallies_from_reactions():
+    # Arrange
+    from io import StringIO
+    from django.core.management import call_command
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'post') for _ in range(3)]
+    React.objects.create(post_id=post_ids[0], reaction='SA',
+                         reacted_at=datetime.now(), reacted_by_id=user.id)
+    React.objects.create(post_id=post_ids[2], reaction='LO',
+                         reacted_at=datetime.now(), reacted_by_id=user.id)
+    out = StringIO()
+
+    # Act
+    call_command('backfill_post_sentiment', batch_size=2, stdout=out)
+
+    # Assert
+    assert list(Post.objects.order_by('id').values_list(
+        'positive_reactions_count', 'negative_reactions_count',
+        'reaction_margin')) == [(0, 1, -1), (0, 0, 0), (1, 0, 1)]
+    assert 'Backfilled sentiment of 3 posts.' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_total_reaction_count_follows_toggles_bulk_reactions_and_deletes():
+    # Arrange
+    user_one = User.objects.create(name='Rohit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    user_two = User.objects.create(name='Summit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user_one.id, 'first post')
+    other_post_id = create_post(user_one.id, 'second post')
+    comment_id = create_comment(user_two.id, post_id, 'first comment')
+
+    # Act
+    react_to_post(user_one.id, post_id, 'HA')
+    react_to_post(user_one.id, post_id, 'LO')
+    react_to_comment(user_two.id, comment_id, 'SA')
+    bulk_react([{'user_id': user_two.id, 'post_id': other_post_id,
+                 'reaction_type': 'WO'},
+                {'user_id': user_two.id, 'post_id': post_id,
+                 'reaction_type': 'TU'}])
+    react_to_post(user_two.id, other_post_id, 'WO')
+    counts = [get_total_reaction_count()]
+    delete_post(user_one.id, post_id)
+    counts.append(get_total_reaction_count())
+    purge_deleted_posts()
+    counts.append(get_total_reaction_count())
+
+    # Assert
+    assert counts == [{'count': 3}, {'count': 0}, {'count': 0}]
+    assert ReactionCountShard.objects.count() == REACTION_COUNT_SHARDS
+
+
+@pytest.mark.django_db
+def test_compact_reaction_count_shards_verifies_and_folds_shards():
+    # Arrange
+    from io import StringIO
+    from django.core.management import call_command
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'post') for _ in range(3)]
+    for post_id in post_ids[:2]:
+        react_to_post(user.id, post_id, 'HA')
+    React.objects.create(post_id=post_ids[2], reaction='SA',
+                         reacted_at=datetime.now(), reacted_by_id=user.id)
+    dry_run_out = StringIO()
+    out = StringIO()
+
+    # Act
+    call_command('compact_reaction_count_shards', dry_run=True,
+                 stdout=dry_run_out)
+    call_command('compact_reaction_count_shards', stdout=out)
+
+    # Assert
+    assert 'hold 2 reactions, React has 3' in dry_run_out.getvalue()
+    assert 'from 2 to 3 reactions' in out.getvalue()
+    assert get_total_reaction_count() == {'count': 3}
+    assert list(ReactionCountShard.objects.exclude(count=0).values_list(
+        'shard', 'count')) == [(0, 3)]
+
+
+@pytest.mark.django_db
+def test_get_posts_reads_each_user_once_and_shares_profile_dicts(
+        django_assert_num_queries):
+    # Arrange
+    user_one = User.objects.create(name='Rohit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    user_two = User.objects.create(name='Summit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user_one.id, 'first post')
+    for _ in range(3):
+        comment_id = create_comment(user_two.id, post_id, 'comment')
+        reply_to_comment(user_one.id, comment_id, 'reply')
+
+    # Act
+    with django_assert_num_queries(4) as context:
+        post = get_posts([post_id])[0]
+
+    # Assert
+    user_queries = [query['sql'] for query in context.captured_queries
+                    if 'FROM "fb_post_user"' in query['sql']]
+    commenters = {id(comment["commenter"]) for comment in post["comments"]}
+    repliers = {id(reply["commenter"]) for comment in post["comments"]
+                for reply in comment["replies"]}
+    assert len(user_queries) == 1
+    assert commenters == {id(post["comments"][0]["commenter"])}
+    assert repliers == {id(post["posted_by"])}
+    assert post["posted_by"] == {"user_id": user_one.id, "name": 'Rohit',
+                                 "profile_pic": user_one.profile_pic}
+
+
+@pytest.mark.django_db
+@freeze_time("2019-10-15 12:30:00")
+def test_api_creates_post_and_returns_it_with_iso_timestamps(client):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+
+    # Act
+    created = client.post('/fb_post/posts/',
+                          json.dumps({"user_id": user.id,
+                                      "post_content": 'first post'}),
+                          content_type='application/json')
+    post_id = created.json()["post_id"]
+    response = client.get('/fb_post/posts/{}/'.format(post_id))
+    other_post_id = create_post(user.id, 'second post')
+    streamed = client.get('/fb_post/posts/?ids={},{}'.format(other_post_id,
+                                                               post_id))
+
+    # Assert
+    assert created.status_code == 201
+    assert response.status_code == 200
+    assert response.json() == json.loads(dumps(
+        get_posts([post_id], native_timestamps=True)[0]))
+    assert response.json()["posted_at"] == '2019-10-15T12:30:00+00:00'
+    assert streamed.streaming
+    assert [post["post_id"] for post in json.loads(
+        b''.join(streamed.streaming_content))] == [other_post_id, post_id]
+
+
+@pytest.mark.django_db
+def test_api_maps_fb_post_exceptions_to_status_codes(client):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    other_user = User.objects.create(name='Summit',
+                                     profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+
+    # Act
+    missing_post = client.get('/fb_post/posts/?ids={},0'.format(post_id))
+    bad_body = client.post('/fb_post/posts/', 'not json',
+                           content_type='application/json')
+    bad_reaction = client.post(
+        '/fb_post/posts/{}/reactions/'.format(post_id),
+        json.dumps({"user_id": user.id, "reaction_type": 'XX'}),
+        content_type='application/json')
+    forbidden = client.delete(
+        '/fb_post/posts/{}/?user_id={}'.format(post_id, other_user.id))
+
+    # Assert
+    assert missing_post.status_code == 404
+    assert missing_post.json() == {"error": 'InvalidPostException',
+                                   "post_ids": [0]}
+    assert bad_body.status_code == 400
+    assert bad_reaction.json() == {"error": 'InvalidReactionTypeException'}
+    assert forbidden.status_code == 403
+
+
+@pytest.mark.django_db
+def test_api_rejects_body_fields_of_the_wrong_type(client):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+    comments_url = '/fb_post/posts/{}/comments/'.format(post_id)
+    replies_url = '/fb_post/comments/{}/replies/'.format(comment_id)
+
+    # Act
+    responses = [
+        client.post(comments_url,
+                    json.dumps({"user_id": user.id, "comment_content": 5}),
+                    content_type='application/json'),
+        client.post(replies_url,
+                    json.dumps({"user_id": user.id, "reply_content": None}),
+                    content_type='application/json'),
+        client.post('/fb_post/posts/',
+                    json.dumps({"user_id": 'x', "post_content": 'post'}),
+                    content_type='application/json'),
+        client.post('/fb_post/posts/',
+                    json.dumps({"user_id": True, "post_content": 'post'}),
+                    content_type='application/json')]
+    empty_reply = client.post(
+        replies_url, json.dumps({"user_id": user.id, "reply_content": ''}),
+        content_type='application/json')
+
+    # Assert
+    assert [response.status_code for response in responses] == \
+        [400, 400, 400, 400]
+    assert empty_reply.status_code == 400
+    assert empty_reply.json() == {"error": 'comment content is empty'}
+    assert Comment.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_api_toggles_reactions_and_reports_metrics(client):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    url = '/fb_post/posts/{}/reactions/'.format(post_id)
+    body = json.dumps({"user_id": user.id, "reaction_type": 'LO'})
+
+    # Act
+    reacted = client.post(url, body, content_type='application/json')
+    metrics = client.get('/fb_post/posts/{}/reaction-metrics/'.format(
+        post_id))
+    reactions = client.get(url)
+
+    # Assert
+    assert reacted.json() == {"action": REACTION_CREATED}
+    assert metrics.json() == get_reaction_metrics(post_id)
+    assert json.loads(b''.join(reactions.streaming_content)) == \
+        list(get_reactions_to_post(post_id))
+
+
+@pytest.mark.django_db
+def test_api_answers_matching_if_none_match_with_304_until_post_changes(
+        client, django_assert_num_queries):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    url = '/fb_post/posts/{}/'.format(post_id)
+    etag = client.get(url)['ETag']
+
+    # Act
+    with django_assert_num_queries(1):
+        not_modified = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    react_to_post(user.id, post_id, 'LO')
+    modified = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Assert
+    assert not_modified.status_code == 304
+    assert not_modified.content == b''
+    assert modified.status_code == 200
+    assert modified['ETag'] != etag
+    assert modified.has_header('Last-Modified')
+
+
+@pytest.mark.django_db
+def test_post_list_etag_changes_with_replies_at_any_depth(client):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'first post'),
+                create_post(user.id, 'second post')]
+    comment_id = create_comment(user.id, post_ids[1], 'comment')
+    reply_id = reply_to_comment(user.id, comment_id, 'reply')
+    url = '/fb_post/posts/?ids={},{}'.format(*post_ids)
+    etag = client.get(url)['ETag']
+    versions = list(Post.objects.order_by('id').values_list('version',
+                                                            flat=True))
+
+    # Act
+    reply_to_comment(user.id, reply_id, 'reply to reply')
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    # Assert
+    assert versions == [0, 2]
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert Post.objects.get(id=post_ids[1]).version == 3
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']) \
+        .status_code == 304
+
+
+@pytest.mark.django_db
+def test_react_to_post_bumps_the_version_in_the_counter_update(
+        django_assert_max_num_queries):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+
+    # Act
+    with django_assert_max_num_queries(10) as captured:
+        react_to_post(user.id, post_id, 'HA')
+
+    # Assert
+    post_updates = [query['sql'] for query in captured.captured_queries
+                    if query['sql'].startswith('UPDATE "fb_post_post"')]
+    assert len(post_updates) == 1
+    assert Post.objects.get(id=post_id).version == 1
+
+
+@pytest.mark.django_db
+def test_user_posts_etag_covers_the_requested_page_or_the_whole_list(client):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'post {}'.format(index))
+                for index in range(4)]
+    url = '/fb_post/users/{}/posts/'.format(user.id)
+    page_etag = client.get(url + '?page_size=2')['ETag']
+    list_etag = client.get(url)['ETag']
+
+    # Act
+    react_to_post(user.id, post_ids[0], 'LO')
+    page = client.get(url + '?page_size=2', HTTP_IF_NONE_MATCH=page_etag)
+    whole_list = client.get(url, HTTP_IF_NONE_MATCH=list_etag)
+    delete_post(user.id, post_ids[1])
+    after_delete = client.get(url, HTTP_IF_NONE_MATCH=whole_list['ETag'])
+
+    # Assert
+    assert page.status_code == 304
+    assert whole_list.status_code == 200
+    assert after_delete.status_code == 200
+    assert client.get(url, HTTP_IF_NONE_MATCH=after_delete['ETag']) \
+        .status_code == 304
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_api_serves_reads_and_writes_from_worker_threads():
+    # Arrange
+    import asyncio
+    from asgiref.sync import async_to_sync
+    from django.test import AsyncClient
+    from fb_post.async_utils import aget_posts
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    client = AsyncClient()
+
+    async def send_requests():
+        reacted = await client.post(
+            '/fb_post/async/posts/{}/reactions/'.format(post_id),
+            {"user_id": user.id, "reaction_type": 'LO'},
+            content_type='application/json')
+        documents = await asyncio.gather(*[aget_posts([post_id])
+                                           for _ in range(4)])
+        response = await client.get('/fb_post/async/posts/{}/'.format(
+            post_id))
+        not_modified = await client.get(
+            '/fb_post/async/posts/{}/'.format(post_id),
+            headers={'If-None-Match': response['ETag']})
+        missing = await client.get('/fb_post/async/posts/?ids=0')
+        return reacted, documents, response, not_modified, missing
+
+    # Act
+    reacted, documents, response, not_modified, missing = \
+        async_to_sync(send_requests)()
+
+    # Assert
+    assert reacted.json() == {"action": REACTION_CREATED}
+    assert documents == [get_posts([post_id])] * 4
+    assert response.json()["reactions"][0]["count"] == 1
+    assert not_modified.status_code == 304
+    assert missing.status_code == 404
+
+
+@pytest.mark.django_db
+def test_delete_post_hides_post_at_once_and_purge_removes_its_tree():
+    # Arrange
+    user_one = User.objects.create(name='Rohit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    user_two = User.objects.create(name='Summit',
+                                   profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user_one.id, 'first post')
+    kept_post_id = create_post(user_two.id, 'second post')
+    comment_id = create_comment(user_two.id, post_id, 'comment')
+    reply_id = reply_to_comment(user_one.id, comment_id, 'reply')
+    reply_to_comment(user_two.id, reply_id, 'reply to reply')
+    for user in (user_one, user_two):
+        react_to_post(user.id, post_id, 'LO')
+        react_to_comment(user.id, comment_id, 'HA')
+        react_to_comment(user.id, reply_id, 'SA')
+    react_to_post(user_one.id, kept_post_id, 'WO')
+
+    # Act
+    delete_post(user_one.id, post_id)
+    with pytest.raises(Exception) as e:
+        get_posts([post_id])
+    visible = [post["post_id"] for post in get_user_posts(user_one.id)]
+    purged = purge_deleted_posts(batch_size=2)
+    rerun = purge_deleted_posts(batch_size=2)
+
+    # Assert
+    assert str(e.value) == "InvalidPostException"
+    assert visible == []
+    assert Post.all_objects.filter(id=post_id).exists() is False
+    assert purged == {'posts': 1, 'comments': 3, 'reactions': 6,
+                      'batches': 6}
+    assert rerun == {'posts': 0, 'comments': 0, 'reactions': 0,
+                     'batches': 0}
+    assert list(Comment.objects.values_list('id', flat=True)) == []
+    assert get_total_reaction_count() == {"count": 1}
+
+
+@pytest.mark.django_db
+def test_comments_of_a_deleted_post_are_gone_before_the_purge():
+    # Arrange
+    from fb_post import reactions
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    kept_post_id = create_post(user.id, 'second post')
+    comment_id = create_comment(user.id, post_id, 'comment')
+    reply_id = reply_to_comment(user.id, comment_id, 'reply')
+    react_to_comment(user.id, reply_id, 'HA')
+    react_to_post(user.id, kept_post_id, 'LO')
+    calls = [lambda: reply_to_comment(user.id, comment_id, 'late reply'),
+             lambda: reply_to_comment(user.id, reply_id, 'late reply'),
+             lambda: react_to_comment(user.id, comment_id, 'LO'),
+             lambda: react_to_comment(user.id, reply_id, 'HA'),
+             lambda: get_replies_for_comments(comment_id),
+             lambda: get_replies_for_comments_page(comment_id),
+             lambda: get_comment_thread(reply_id)]
+
+    # Act
+    delete_post(user.id, post_id)
+    errors = []
+    for call in calls:
+        with pytest.raises(InvalidCommentException) as e:
+            call()
+        errors.append(str(e.value))
+    _, bulk_errors = bulk_react([{'user_id': user.id, 'comment_id': reply_id,
+                                  'reaction_type': 'WO'}])
+
+    # Assert
+    assert errors == ['InvalidCommentException'] * len(calls)
+    assert bulk_errors == {0: 'InvalidCommentException'}
+    assert Comment.objects.count() == 2
+    assert React.objects.count() == 2
+    assert get_total_reaction_count() == {"count": 1}
+    assert reactions.compact_reaction_count_shards(dry_run=True) == (1, 1)
+
+
+@pytest.mark.django_db
+def test_purge_deleted_posts_resumes_after_an_interrupted_run():
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'comment')
+    for _ in range(3):
+        reply_to_comment(user.id, comment_id, 'reply')
+    delete_post(user.id, post_id)
+
+    # Act
+    first_run = purge_deleted_posts(batch_size=2, max_batches=1)
+    remaining = Comment.objects.count()
+    second_run = purge_deleted_posts(batch_size=2)
+
+    # Assert
+    assert first_run['comments'] == 2
+    assert remaining == 2
+    assert second_run == {'posts': 1, 'comments': 2, 'reactions': 0,
+                          'batches': 2}
+    assert Post.all_objects.count() == 0
+
+
+def test_coalesce_toggles_keeps_the_effect_of_every_toggle_sequence():
+    # Arrange
+    def apply(reaction, reaction_types):
+        for reaction_type in reaction_types:
+            reaction = None if reaction == reaction_type else reaction_type
+        return reaction
+    sequences = [['LI'], ['LI', 'LI'], ['LI', 'HA'], ['LI', 'HA', 'HA'],
+                 ['LI', 'HA', 'LI'], ['LI', 'LI', 'LI', 'HA', 'SA', 'LI'],
+                 ['LI', 'HA', 'SA', 'SA', 'HA', 'LI', 'LI']]
+
+    # Act
+    coalesced = [coalesce_toggles(sequence) for sequence in sequences]
+
+    # Assert
+    for sequence, toggles in zip(sequences, coalesced):
+        assert len(toggles) <= 3
+        for reaction in (None, 'LI', 'HA', 'SA', 'AN'):
+            assert apply(reaction, toggles) == apply(reaction, sequence)
+
+
+@pytest.mark.django_db
+def test_react_to_post_in_buffered_mode_queues_and_coalesces_toggles(
+        settings):
+    # Arrange
+    settings.FB_POST_REACTION_BUFFER_ENABLED = True
+    settings.FB_POST_REACTION_BUFFER_INTERVAL = 60
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'comment')
+
+    # Act
+    actions = [react_to_post(user.id, post_id, 'LI'),
+               react_to_post(user.id, post_id, 'LI'),
+               react_to_post(user.id, post_id, 'HA'),
+               react_to_comment(user.id, comment_id, 'SA')]
+    queued_count = React.objects.count()
+    stop_reaction_buffer()
+
+    # Assert
+    assert actions == [REACTION_QUEUED] * 4
+    assert queued_count == 0
+    assert sorted(React.objects.values_list('reaction', flat=True)) == \
+        ['HA', 'SA']
+    assert get_reaction_metrics(post_id) == {'HA': 1}
+    assert get_total_reaction_count() == {"count": 2}
+
+
+@pytest.mark.django_db
+def test_reaction_buffer_replays_its_journal_once_after_a_crash(tmp_path):
+    # Arrange
+    journal_path = str(tmp_path / 'reactions.jsonl')
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    crashed = ReactionBuffer(journal_path=journal_path, fsync=False)
+    crashed.add(user.id, post_id, None, 'LO')
+    crashed.flush()
+    crashed.add(user.id, post_id, None, 'LO')
+    crashed.add(user.id, post_id, None, 'WO')
+    crashed.journal.close()
+
+    # Act
+    flushed_before_crash = get_reaction_metrics(post_id)
+    for _ in range(2):
+        restarted = ReactionBuffer(journal_path=journal_path, fsync=False)
+        restarted.replay()
+        restarted.journal.close()
+
+    # Assert
+    assert flushed_before_crash == {'LO': 1}
+    assert get_reaction_metrics(post_id) == {'WO': 1}
+    assert restarted.flushed == 0
+    assert list(tmp_path.iterdir()) == [tmp_path / 'reactions.jsonl']
+
+
+def test_reaction_buffer_logs_failed_flushes_and_keeps_retrying(caplog):
+    # Arrange
+    buffer = ReactionBuffer(interval=0)
+    attempts = []
+
+    def flush():
+        attempts.append(len(attempts))
+        if len(attempts) == 3:
+            buffer._stopped.set()
+        raise RuntimeError('database is down')
+
+    buffer.flush = flush
+
+    # Act
+    buffer.run()
+
+    # Assert
+    assert attempts == [0, 1, 2]
+    assert buffer.failed_flushes == 3
+    assert [(record.levelname, str(record.exc_info[1]))
+            for record in caplog.records] == \
+        [('ERROR', 'database is down')] * 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_read_replica_router_reads_from_replicas_until_the_first_write(
+        settings):
+    # Arrange
+    settings.FB_POST_READ_REPLICAS = ['replica']
+    router = ReadReplicaRouter()
+
+    # Act
+    outside_scope = router.db_for_read(Post)
+    with replica_reads():
+        before_write = router.db_for_read(Post)
+        with transaction.atomic():
+            in_transaction = router.db_for_read(Post)
+        write = router.db_for_write(Post)
+        after_write = router.db_for_read(Post)
+    with replica_reads():
+        next_scope = router.db_for_read(Post)
+
+    # Assert
+    assert outside_scope == 'default'
+    assert (before_write, in_transaction) == ('replica', 'default')
+    assert (write, after_write) == ('default', 'default')
+    assert next_scope == 'replica'
+
+
+@contextmanager
+def sqlite_database(alias, path):
+    """
+    Adds a database alias on the SQLite file ``path`` for the block.
+    """
+    from django.db import connections
+    connections.settings[alias] = dict(connections.settings['default'],
+                                       NAME=str(path))
+    try:
+        yield connections[alias]
+    finally:
+        connections[alias].close()
+        del connections[alias]
+        del connections.settings[alias]
+
+
+@pytest.fixture
+def lagging_replica(settings, tmp_path):
+    """
+    A 'replica' alias with the schema but none of the rows of 'default'.
+    """
+    from django.core.management import call_command
+    with sqlite_database('replica', tmp_path / 'replica.sqlite3'):
+        call_command('migrate', database='replica', verbosity=0)
+        settings.FB_POST_READ_REPLICAS = ['replica']
+        yield 'replica'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_writes_check_their_rows_on_the_primary_not_a_lagging_replica(
+        lagging_replica):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+    comment_id = create_comment(user.id, post_id, 'first comment')
+
+    # Act
+    with replica_reads():
+        lagging = Post.objects.filter(id=post_id).exists()
+    with replica_reads():
+        post_action = react_to_post(user.id, post_id, 'LO')
+    with replica_reads():
+        comment_action = react_to_comment(user.id, comment_id, 'HA')
+    with replica_reads():
+        _, errors = bulk_react([{'user_id': user.id, 'post_id': post_id,
+                                 'reaction_type': 'WO'}])
+    with replica_reads():
+        delete_post(user.id, post_id)
+
+    # Assert
+    assert lagging is False
+    assert (post_action, comment_action) == (REACTION_CREATED,
+                                             REACTION_CREATED)
+    assert errors == {}
+    assert Post.all_objects.get(id=post_id).deleted_at is not None
+
+
+def test_read_replica_middleware_keeps_the_scope_while_streaming():
+    # Arrange
+    from django.http import StreamingHttpResponse
+    from django.test import RequestFactory
+    pinned = []
+
+    def stream():
+        pinned.append(is_pinned_to_primary())
+        yield b'['
+        ReadReplicaRouter().db_for_write(Post)
+        pinned.append(is_pinned_to_primary())
+        yield b']'
+
+    def view(request):
+        pinned.append(is_pinned_to_primary())
+        return StreamingHttpResponse(stream())
+
+    # Act
+    response = read_replica_middleware(view)(RequestFactory().get('/'))
+    pinned.append(is_pinned_to_primary())
+    content = b''.join(response.streaming_content)
+
+    # Assert
+    assert content == b'[]'
+    assert pinned == [False, True, False, True]
+
+
+def test_shards_are_chosen_by_user_id_and_by_id_range(settings):
+    # Arrange
+    settings.FB_POST_SHARDS = ['default', 'other']
+
+    # Act
+    user_shards = [get_user_shard(user_id) for user_id in (1, 2, 3)]
+    id_shards = [get_id_shard(object_id) for object_id in
+                 (7, SHARD_ID_SPAN + 7, 2 * SHARD_ID_SPAN + 7, -1, 'x')]
+
+    # Assert
+    assert user_shards == ['other', 'default', 'other']
+    assert id_shards == ['default', 'other', 'default', 'default', 'default']
+    assert group_by_shard([SHARD_ID_SPAN + 1, 2, SHARD_ID_SPAN + 3]) == {
+        'other': [SHARD_ID_SPAN + 1, SHARD_ID_SPAN + 3], 'default': [2]}
+
+
+def test_sharded_functions_route_their_queries_and_realign_bulk_results(
+        settings):
+    # Arrange
+    settings.FB_POST_SHARDS = ['default', 'other']
+    router = ReadReplicaRouter()
+
+    @on_shard_of('post_id')
+    def get_databases(user_id, post_id):
+        return router.db_for_read(Post), router.db_for_write(Post)
+
+    @on_shard_of('user_id')
+    def iter_databases(user_id):
+        yield router.db_for_read(Post)
+        yield router.db_for_read(Post)
+
+    @on_record_shards
+    def create(records):
+        return ([(router.db_for_write(Post), record['user_id'])
+                 for record in records],
+                {0: 'InvalidUserException'})
+
+    # Act
+    by_post = get_databases(2, post_id=SHARD_ID_SPAN + 1)
+    by_user = list(iter_databases(3))
+    outside = router.db_for_read(Post)
+    results, errors = create([{'user_id': 1}, {'user_id': 2},
+                              {'user_id': 3, 'post_id': 4}])
+
+    # Assert
+    assert by_post == ('other', 'other')
+    assert by_user == ['other', 'other']
+    assert outside == 'default'
+    assert results == [('other', 1), ('default', 2), ('default', 3)]
+    assert errors == {0: 'InvalidUserException', 1: 'InvalidUserException'}
+
+
+@pytest.mark.django_db
+def test_migrating_a_shard_fills_its_own_tables(settings, tmp_path,
+                                                monkeypatch):
+    # Arrange
+    from django.core.exceptions import ImproperlyConfigured
+    from django.core.management import call_command
+    from fb_post import sharding
+    settings.FB_POST_SHARDS = ['default', 'other']
+
+    # Act
+    with sqlite_database('other', tmp_path / 'other.sqlite3') as other:
+        call_command('migrate', database='other', verbosity=0)
+        shard_rows = ReactionCountShard.objects.using('other').count()
+        with other.cursor() as cursor:
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s',
+                           [Post._meta.db_table])
+            first_id = cursor.fetchone()[0] + 1
+        monkeypatch.setattr(sharding, 'SHARD_VENDORS', ('postgresql',))
+        with pytest.raises(ImproperlyConfigured):
+            sharding.check_shard_vendors()
+
+    # Assert
+    assert shard_rows == REACTION_COUNT_SHARDS
+    assert ReactionCountShard.objects.count() == REACTION_COUNT_SHARDS
+    assert get_id_shard(first_id) == 'other'
+    assert sharding.get_current_shard() is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_comments_and_reactions_are_read_from_the_shard_they_live_on(
+        settings, tmp_path):
+    # Arrange
+    from django.core.management import call_command
+    settings.FB_POST_SHARDS = ['default', 'other']
+
+    with sqlite_database('other', tmp_path / 'other.sqlite3'):
+        call_command('migrate', database='other', verbosity=0)
+        user_ids = [create_user('Rohit', 'https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+                    for _ in range(2)]
+        user_ids.sort(key=get_user_shard)
+        post_ids = [create_post(user_id, 'post') for user_id in user_ids]
+        comment_ids = [create_comment(user_ids[0], post_id, 'comment')
+                       for post_id in post_ids]
+        reply_ids = [reply_to_comment(user_ids[0], comment_id, 'reply')
+                     for comment_id in comment_ids]
+        for post_id, comment_id, reply_id in zip(post_ids, comment_ids,
+                                                 reply_ids):
+            react_to_post(user_ids[0], post_id, 'HA')
+            react_to_comment(user_ids[0], comment_id, 'LO')
+            react_to_comment(user_ids[0], reply_id, 'WO')
+
+        # Act
+        validate_comment(comment_ids[1])
+        validate_comment(reply_ids[1])
+        post_reactions = get_reactions_detail(post_ids)
+        comment_reactions = get_reactions_detail_of_comments(comment_ids)
+        reply_reactions = get_reactions_detail_of_comments_replies(
+            comment_ids)
+        replies = get_replieses_details(comment_ids)
+        comments = get_comments_details(post_ids)
+        with pytest.raises(InvalidCommentException):
+            validate_comment(comment_ids[1] + 1000)
+
+    # Assert
+    assert [get_id_shard(post_id) for post_id in post_ids] == \
+        ['default', 'other']
+    assert get_id_shard(comment_ids[1]) == 'other'
+    assert set(post_reactions) == set(post_ids)
+    assert post_reactions[post_ids[1]][0]['type'] == {'HA'}
+    assert set(comment_reactions) == set(comment_ids)
+    assert comment_reactions[comment_ids[1]][0]['type'] == ['LO']
+    assert set(reply_reactions) == set(reply_ids)
+    assert [reply['comment_id'] for reply in replies[comment_ids[1]]] == \
+        [reply_ids[1]]
+    assert set(comments) == set(post_ids)
+    assert comments[post_ids[1]][0]['comment_id'] == comment_ids[1]
+    assert comments[post_ids[1]][0]['replies'][0]['reactions'][0]['type'] \
+        == ['WO']
+
+
+@pytest.mark.django_db
+def test_api_streams_posts_after_checking_each_post_once(
+        client, django_assert_num_queries):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_ids = [create_post(user.id, 'post {}'.format(index))
+                for index in range(2)]
+    comment_id = create_comment(user.id, post_ids[0], 'first comment')
+    reply_to_comment(user.id, comment_id, 'first reply')
+
+    # Act
+    with django_assert_num_queries(5) as context:
+        response = client.get('/fb_post/posts/?ids={},{}'.format(*post_ids))
+        posts = json.loads(b''.join(response.streaming_content))
+
+    # Assert
+    post_queries = [query['sql'] for query in context.captured_queries
+                    if 'FROM "fb_post_post"' in query['sql']]
+    user_queries = [query['sql'] for query in context.captured_queries
+                    if 'FROM "fb_post_user"' in query['sql']]
+    assert [post['post_id'] for post in posts] == post_ids
+    assert (len(post_queries), len(user_queries)) == (2, 1)
+
+
+@pytest.mark.django_db
+def test_identity_scope_reuses_lookups_until_its_first_write(
+        django_assert_num_queries):
+    # Arrange
+    user = User.objects.create(name='Rohit',
+                               profile_pic='https://www.shutterstock.com/image-photo/large-thick-industrial-black-metal-chain-1081708619')
+    post_id = create_post(user.id, 'first post')
+
+    # Act
+    with identity_scope():
+        with django_assert_num_queries(4) as context:
+            validate_user(user.id)
+            validate_post(post_id)
+            posts = get_user_posts(user.id)
+        with pytest.raises(InvalidPostException), \
+                django_assert_num_queries(1):
+            validate_posts([post_id, post_id + 1])
+            validate_post(post_id + 1)
+        delete_post(user.id, post_id)
+        with pytest.raises(InvalidPostException):
+            validate_post(post_id)
+
+    # Assert
+    user_queries = [query['sql'] for query in context.captured_queries
+                    if 'FROM "fb_post_user"' in query['sql']]
+    assert len(user_queries) == 1
+    assert [post['post_id'] for post in posts] == [post_id]
+    assert posts[0]['posted_by']['name'] == 'Rohit'
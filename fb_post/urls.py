@@ -0,0 +1,21 @@
+from django.urls import include, path
+
+from fb_post import views
+
+urlpatterns = [
+    path('metrics/', views.metrics, name='metrics'),
+    path('posts/', views.posts, name='posts'),
+    path('posts/<int:post_id>/', views.post, name='post'),
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
+    path('posts/<int:post_id>/reactions/', views.post_reactions,
+         name='post_reactions'),
+    path('posts/<int:post_id>/reaction-metrics/', views.post_reaction_metrics,
+         name='post_reaction_metrics'),
+    path('users/<int:user_id>/posts/', views.user_posts, name='user_posts'),
+    path('comments/<int:comment_id>/replies/', views.comment_replies,
+         name='comment_replies'),
+    path('comments/<int:comment_id>/reactions/', views.comment_reactions,
+         name='comment_reactions'),
+    path('async/', include('fb_post.async_urls')),
+]
@@ -1,27 +1,65 @@
+import heapq
 from collections import defaultdict
 from datetime import datetime
+from functools import partial
+from itertools import islice
 
-from django.db import transaction
-from django.db.models import Count, Case, When, IntegerField, F
+from django.db.models import CharField, OuterRef, Subquery, TextField, \
+    Value
+from django.db.models.functions import Cast, Coalesce, Concat, LPad
 
 from fb_post.models import *
 from fb_post.exceptions import InvalidUserException, InvalidPostContent, \
-    InvalidPostException, InvalidCommentException, \
-    UserCannotDeletePostException
+    InvalidPostException, InvalidCommentException, InvalidCommentContent, \
+    UserCannotDeletePostException, InvalidReactionTypeException
+from fb_post.metrics import instrument_module
+from fb_post.pagination import get_keyset_page, DEFAULT_PAGE_SIZE
+from fb_post.profiles import UserProfiles, load_user_profiles
+from fb_post.post_cache import get_post_documents, invalidate_posts
+from fb_post.post_versions import touch_posts, touch_comment_posts
+from fb_post.purge import get_tree_reaction_count
+from fb_post import reaction_buffer
+from fb_post.identity_map import get_rows, identity_scoped, remember_rows
+from fb_post.routers import pinned_to_primary
+from fb_post.sharding import atomic, on_shard_of, on_id_shards, \
+    on_record_shards, group_by_shard, for_each_shard, use_shard
+from fb_post.reactions import toggle_reaction, apply_reaction_toggles, \
+    get_reaction_counts, get_reaction_summary, get_reaction_summaries, \
+    get_total_reaction_count_from_shards, add_to_total_reaction_count, \
+    REACTION_CREATED, REACTION_UPDATED, REACTION_DELETED, REACTION_QUEUED, \
+    COUNTER_FIELDS
+from fb_post.validation import get_missing_ids, forget_ids, forget_model, \
+    load_posts, load_comments, ID_BATCH_SIZE
+
+STREAM_CHUNK_SIZE = 100
+BULK_BATCH_SIZE = 1000
 
 
 def validate_post(post_id):
-    if post_id not in Post.objects.values_list('id', flat=True):
-        raise InvalidPostException('InvalidPostException')
+    validate_posts([post_id])
+
+
+def validate_posts(post_ids):
+    missing_post_ids = []
+    for alias, shard_post_ids in group_by_shard(post_ids).items():
+        with use_shard(alias):
+            missing_post_ids += get_missing_ids(Post, shard_post_ids,
+                                                load_rows=load_posts)
+    if missing_post_ids:
+        raise InvalidPostException('InvalidPostException',
+                                   post_ids=missing_post_ids)
 
 
 def validate_user(user_id):
-    if user_id not in User.objects.values_list('id', flat=True):
+    # In an identity scope the profile is loaded with the check, for the
+    # post and comment rows that show the user later in the call.
+    if get_missing_ids(User, [user_id], load_rows=load_user_profiles):
         raise InvalidUserException('InvalidUserException')
 
 
+@on_shard_of('comment_id')
 def validate_comment(comment_id):
-    if comment_id not in Comment.objects.values_list('id', flat=True):
+    if get_missing_ids(Comment, [comment_id]):
         raise InvalidCommentException('InvalidCommentException')
 
 
@@ -32,10 +70,17 @@ def validate_post_content(post_content):
 
 def validate_comment_content(comment_content):
     if len(comment_content) == 0:
-        raise InvalidCommentException('comment content is empty')
+        raise InvalidCommentContent('comment content is empty')
+
 
+def validate_reaction_type(reaction_type):
+    if reaction_type not in REACTION_COUNT_FIELDS:
+        raise InvalidReactionTypeException('InvalidReactionTypeException')
 
-@transaction.atomic
+
+@pinned_to_primary
+@on_shard_of('user_id')
+@atomic
 def create_post(user_id, post_content):
     """
     :param user_id:
@@ -49,7 +94,9 @@ def create_post(user_id, post_content):
     return post.id
 
 
-@transaction.atomic
+@pinned_to_primary
+@on_shard_of('post_id')
+@atomic
 def create_comment(user_id, post_id, comment_content):
     """
     :param user_id:
@@ -63,10 +110,13 @@ def create_comment(user_id, post_id, comment_content):
     comment = Comment.objects.create(content=comment_content,
                                      commented_at=datetime.now(),
                                      commented_by_id=user_id, post_id=post_id)
+    touch_posts([post_id])
     return comment.id
 
 
-@transaction.atomic
+@pinned_to_primary
+@on_shard_of('comment_id')
+@atomic
 def reply_to_comment(user_id, comment_id, reply_content):
     """
     :param user_id:
@@ -82,94 +132,254 @@ def reply_to_comment(user_id, comment_id, reply_content):
                                      commented_at=datetime.now(),
                                      commented_by_id=user_id,
                                      parent_comment_id=comment_id)
+    touch_comment_posts([comment_id])
     return comment.id
 
 
-@transaction.atomic
+@pinned_to_primary
+@on_shard_of('post_id')
 def react_to_post(user_id, post_id, reaction_type):
     """
     :param user_id:
     :param post_id:
     :param reaction_type:
-    :return:
+    :return: REACTION_CREATED, REACTION_UPDATED or REACTION_DELETED;
+        REACTION_QUEUED in buffered mode (fb_post.reaction_buffer)
     """
     validate_user(user_id)
     validate_post(post_id)
+    validate_reaction_type(reaction_type)
 
-    if user_id not in React.objects.values_list('reacted_by', flat=True):
-        React.objects.create(post_id=post_id,
-                             reaction=reaction_type,
-                             reacted_at=datetime.now(),
-                             reacted_by_id=user_id)
-    else:
-        if reaction_type in React.objects.filter(
-                reacted_by_id=user_id, post=post_id).values_list('reaction',
-                                                                 flat=True):
-            React.objects.filter(
-                reacted_by_id=user_id, post=post_id).delete()
-        else:
-            reaction_id = list(React.objects.filter(reacted_by_id=user_id,
-                                                    post=post_id).values_list(
-                'id', flat=True))
-            React.objects.filter(id=reaction_id[0]).update(
-                reaction=reaction_type,
-                reacted_at=datetime.now())
+    if reaction_buffer.is_enabled():
+        reaction_buffer.get_reaction_buffer().add(
+            user_id, post_id, None, reaction_type)
+        return REACTION_QUEUED
+    with atomic():
+        # The counter UPDATE moves the post to its next version.
+        action = toggle_reaction(user_id, reaction_type, post_id=post_id)
+        invalidate_posts([post_id])
+    return action
 
 
-@transaction.atomic
+@pinned_to_primary
+@on_shard_of('comment_id')
 def react_to_comment(user_id, comment_id, reaction_type):
     """
     :param user_id:
     :param comment_id:
     :param reaction_type:
-    :return:
+    :return: REACTION_CREATED, REACTION_UPDATED or REACTION_DELETED;
+        REACTION_QUEUED in buffered mode (fb_post.reaction_buffer)
     """
     validate_user(user_id)
     validate_comment(comment_id)
-
-    User.objects.values_list('id', flat=True)
-    if user_id not in React.objects.values_list('reacted_by', flat=True):
-        React.objects.create(comment_id=comment_id,
-                             reaction=reaction_type,
-                             reacted_at=datetime.now(),
-                             reacted_by_id=user_id)
-    else:
-        if reaction_type in React.objects.filter(
-                reacted_by_id=user_id, comment_id=comment_id) \
-                .values_list('reaction', flat=True):
-            React.objects.filter(
-                reacted_by_id=user_id, comment_id=comment_id).delete()
-        else:
-            reaction_id = list(React.objects.filter(reacted_by_id=user_id,
-                                                    comment_id=comment_id).values_list(
-                'id', flat=True))
-            React.objects.filter(id=reaction_id[0]).update(
-                reaction=reaction_type,
-                reacted_at=datetime.now())
+    validate_reaction_type(reaction_type)
+
+    if reaction_buffer.is_enabled():
+        reaction_buffer.get_reaction_buffer().add(
+            user_id, None, comment_id, reaction_type)
+        return REACTION_QUEUED
+    with atomic():
+        action = toggle_reaction(user_id, reaction_type, comment_id=comment_id)
+        touch_comment_posts([comment_id])
+    return action
+
+
+def get_record_errors(records, user_ids, post_ids=(), comment_ids=(),
+                      require_target=False):
+    """
+    Validates the ids referenced by bulk records with one batched existence
+    check per model.
+    :param require_target: every record needs either a post_id or a
+        comment_id, not both
+    :return: {record index: error message}
+    """
+    missing_user_ids = set(get_missing_ids(User, user_ids))
+    missing_post_ids = set(get_missing_ids(Post, post_ids))
+    missing_comment_ids = set(get_missing_ids(Comment, comment_ids))
+    errors = dict()
+    for index, record in enumerate(records):
+        if record['user_id'] in missing_user_ids:
+            errors[index] = 'InvalidUserException'
+        elif record.get('post_id') in missing_post_ids:
+            errors[index] = 'InvalidPostException'
+        elif record.get('comment_id') in missing_comment_ids:
+            errors[index] = 'InvalidCommentException'
+        elif require_target and (record.get('post_id') is None) == \
+                (record.get('comment_id') is None):
+            errors[index] = 'InvalidPostException'
+    return errors
+
+
+@pinned_to_primary
+@on_record_shards
+def bulk_create_posts(records, batch_size=BULK_BATCH_SIZE):
+    """
+    :param records: iterable of {"user_id", "post_content"}
+    :param batch_size: rows per INSERT
+    :return: (post ids aligned with records, None where the record failed,
+              {record index: error message})
+    """
+    records = list(records)
+    errors = get_record_errors(
+        records, user_ids=[record['user_id'] for record in records])
+    for index, record in enumerate(records):
+        if index not in errors and len(record['post_content']) == 0:
+            errors[index] = 'InvalidPostContent'
+
+    valid_indexes = [index for index in range(len(records))
+                     if index not in errors]
+    now = datetime.now()
+    posts = [Post(content=records[index]['post_content'], posted_at=now,
+                  posted_by_id=records[index]['user_id'])
+             for index in valid_indexes]
+    with atomic():
+        Post.objects.bulk_create(posts, batch_size=batch_size)
+
+    post_ids = [None] * len(records)
+    for index, post in zip(valid_indexes, posts):
+        post_ids[index] = post.id
+    return post_ids, errors
+
+
+def set_comment_paths(comment_ids):
+    """
+    Fills path and depth of comments created without Comment.save, in one
+    UPDATE per batch that reads each parent's path in a subquery.
+    :param comment_ids: new comments, ordered so parents come first
+    :return:
+    """
+    parents = Comment.objects.filter(id=OuterRef('parent_comment_id'))
+    own_segment = Concat(LPad(Cast('id', CharField()), PATH_SEGMENT_WIDTH,
+                              Value('0')), Value('/'))
+    for start in range(0, len(comment_ids), ID_BATCH_SIZE):
+        Comment.objects.filter(
+            id__in=comment_ids[start:start + ID_BATCH_SIZE]).update(
+            path=Concat(Coalesce(Subquery(parents.values('path')), Value('')),
+                        own_segment, output_field=TextField()),
+            depth=Coalesce(Subquery(parents.values('depth')) + 1, Value(0)))
+
+
+@pinned_to_primary
+@on_record_shards
+def bulk_create_comments(records, batch_size=BULK_BATCH_SIZE):
+    """
+    :param records: iterable of {"user_id", "comment_content"} plus either
+        "post_id" for a comment or "comment_id" for a reply to that comment
+    :param batch_size: rows per INSERT
+    :return: (comment ids aligned with records, None where the record failed,
+              {record index: error message})
+    """
+    records = list(records)
+    errors = get_record_errors(
+        records,
+        user_ids=[record['user_id'] for record in records],
+        post_ids=[record['post_id'] for record in records
+                  if record.get('post_id') is not None],
+        comment_ids=[record['comment_id'] for record in records
+                     if record.get('comment_id') is not None],
+        require_target=True)
+    for index, record in enumerate(records):
+        if index not in errors and len(record['comment_content']) == 0:
+            errors[index] = 'comment content is empty'
+
+    valid_indexes = [index for index in range(len(records))
+                     if index not in errors]
+    parent_ids = list({records[index]['comment_id'] for index in valid_indexes
+                       if records[index].get('comment_id') is not None})
+    now = datetime.now()
+    comments = [Comment(content=records[index]['comment_content'],
+                        commented_at=now,
+                        commented_by_id=records[index]['user_id'],
+                        post_id=records[index].get('post_id'),
+                        parent_comment_id=records[index].get('comment_id'))
+                for index in valid_indexes]
+    with atomic():
+        Comment.objects.bulk_create(comments, batch_size=batch_size)
+        set_comment_paths([comment.id for comment in comments])
+        touch_posts({comment.post_id for comment in comments
+                     if comment.post_id is not None})
+        touch_comment_posts(parent_ids)
+
+    comment_ids = [None] * len(records)
+    for index, comment in zip(valid_indexes, comments):
+        comment_ids[index] = comment.id
+    return comment_ids, errors
+
+
+@pinned_to_primary
+@on_record_shards
+def bulk_react(records, batch_size=BULK_BATCH_SIZE):
+    """
+    Applies react_to_post / react_to_comment toggles in record order, with
+    set-based reads and batched writes in one transaction.
+    :param records: iterable of {"user_id", "reaction_type"} plus either
+        "post_id" or "comment_id"
+    :param batch_size: rows per INSERT / UPDATE / DELETE
+    :return: (REACTION_CREATED/UPDATED/DELETED aligned with records, None
+              where the record failed, {record index: error message})
+    """
+    records = list(records)
+    errors = get_record_errors(
+        records,
+        user_ids=[record['user_id'] for record in records],
+        post_ids=[record['post_id'] for record in records
+                  if record.get('post_id') is not None],
+        comment_ids=[record['comment_id'] for record in records
+                     if record.get('comment_id') is not None],
+        require_target=True)
+    for index, record in enumerate(records):
+        if index not in errors and \
+                record['reaction_type'] not in REACTION_COUNT_FIELDS:
+            errors[index] = 'InvalidReactionTypeException'
+
+    valid_indexes = [index for index in range(len(records))
+                     if index not in errors]
+    toggles = [(records[index]['user_id'], records[index].get('post_id'),
+                records[index].get('comment_id'),
+                records[index]['reaction_type'])
+               for index in valid_indexes]
+    with atomic():
+        toggle_actions = apply_reaction_toggles(toggles, batch_size=batch_size)
+        invalidate_posts({post_id for _, post_id, _, _ in toggles
+                          if post_id is not None})
+        touch_comment_posts({comment_id for _, _, comment_id, _ in toggles
+                             if comment_id is not None})
+
+    actions = [None] * len(records)
+    for index, action in zip(valid_indexes, toggle_actions):
+        actions[index] = action
+    return actions, errors
 
 
 def get_total_reaction_count():
-    reaction_count = React.objects.aggregate(count=Count(
-        'reaction'))
-    return reaction_count
+    """
+    :return: {"count": total number of reactions}, summed over the reaction
+        count shards instead of counting React rows
+    """
+    return {"count": sum(
+        for_each_shard(get_total_reaction_count_from_shards))}
 
 
+@on_shard_of('post_id')
 def get_reaction_metrics(post_id):
     """
     :param post_id:
     :return:
     """
-    validate_post(post_id)
-    reactions = React.objects.filter(
-        post=post_id).values('post_id',
-                             'reaction').annotate(Count('reaction'))
-    reaction_materics = {reaction['reaction']: reaction['reaction__count']
-                         for reaction in reactions}
-    return reaction_materics
+    post = Post.objects.filter(id=post_id).only(*COUNTER_FIELDS).first()
+    if post is None:
+        raise InvalidPostException('InvalidPostException', post_ids=[post_id])
+    return get_reaction_counts(post)
 
 
+@pinned_to_primary
+@on_shard_of('post_id')
 def delete_post(user_id, post_id):
     """
+    Hides the post, its comments and their reactions at once behind a
+    tombstone and takes the reactions off the total count; fb_post.purge
+    removes the rows later in small batches.
     :param user_id:
     :param post_id:
     :return:
@@ -182,22 +392,42 @@ def delete_post(user_id, post_id):
         raise UserCannotDeletePostException(
             'User is not the creator of the post')
     else:
-        Post.objects.filter(id=post_id).delete()
-
+        with atomic():
+            add_to_total_reaction_count(-get_tree_reaction_count(post_id))
+            Post.objects.filter(id=post_id).update(deleted_at=datetime.now())
+        forget_ids(Post, [post_id])
+        # The ids of the post's comments are unknown.
+        forget_model(Comment)
+        invalidate_posts([post_id])
+
+
+def get_posts_with_more_positive_reactions(limit=None, order_by_margin=False,
+                                           min_margin=1):
+    """
+    Reads the sentiment tallies kept on Post by the reaction write path, as
+    a range query over the reaction margin index.
+    :param limit: most post ids to return, None for all
+    :param order_by_margin: largest margin first instead of by post id
+    :param min_margin: least positive minus negative reactions; the default
+        keeps posts with more positive than negative reactions
+    :return: list of post ids
+    """
+    def get_shard_posts():
+        posts = Post.objects.filter(reaction_margin__gte=min_margin)
+        if order_by_margin:
+            posts = posts.order_by('-reaction_margin', 'id').values_list(
+                'reaction_margin', 'id')
+        else:
+            posts = posts.order_by('id').values_list('id')
+        if limit is not None:
+            posts = posts[:limit]
+        return list(posts)
 
-def get_posts_with_more_positive_reactions():
-    positive_reaction = ('TU', 'LI', 'LO', 'HA', 'WO')
-    negative_reaction = ('SA', 'AN', 'TD')
-    posts = React.objects.values('post_id').annotate(
-        positive_reaction_count=Count(Case(
-            When(reaction__in=positive_reaction, then=1),
-            output_field=IntegerField(),
-        )), negative_reaction_count=Count(Case(
-            When(reaction__in=negative_reaction, then=1),
-            output_field=IntegerField(),
-        ))).filter(positive_reaction_count__gt=F('negative_reaction_count')) \
-        .values_list('post_id', flat=True)
-    return list(posts)
+    # Each shard's list is sorted already; merge them by the same key.
+    posts = heapq.merge(*for_each_shard(get_shard_posts),
+                        key=(lambda row: (-row[0], row[1]))
+                        if order_by_margin else None)
+    return [row[-1] for row in islice(posts, limit)]
 
 
 def get_posts_reacted_by_user(user_id):
@@ -207,219 +437,396 @@ def get_posts_reacted_by_user(user_id):
     """
     validate_user(user_id)
 
-    posts = Post.objects.filter(react__reacted_by=user_id).values_list('id',
-                                                                       flat=True)
-    return list(posts)
+    def get_shard_posts():
+        return list(Post.objects.filter(react__reacted_by=user_id)
+                    .values_list('id', flat=True))
+
+    return [post_id for shard_post_ids in for_each_shard(get_shard_posts)
+            for post_id in shard_post_ids]
 
 
+@on_shard_of('post_id')
+@identity_scoped
 def get_reactions_to_post(post_id):
     """
     :param post_id:
     :return:
     """
     validate_post(post_id)
-    reactions_list = list(React.objects.filter(
-        post=post_id).select_related('reacted_by'))
+    reactions_list = list(React.objects.filter(post=post_id).values_list(
+        'reacted_by_id', 'reaction'))
+    user_profiles = UserProfiles()
+    user_profiles.want(user_id for user_id, _ in reactions_list)
     reactions = [
-        {
-            "user_id": reaction.reacted_by.id,
-            "name": reaction.reacted_by.name,
-            "profile_pic": reaction.reacted_by.profile_pic,
-            "reaction": reaction.reaction,
-        }
-        for reaction in reactions_list
+        dict(user_profiles[user_id], reaction=reaction)
+        for user_id, reaction in reactions_list
     ]
     return reactions
 
 
+@on_id_shards
 def get_reactions_detail(post_ids):
     """
     :param post_ids:
     :return:
     """
-    reactions_list = list(React.objects.filter(
-        post_id__in=post_ids).select_related('post'))
-    post_id_wise_reaction = defaultdict(list)
-    for reaction in reactions_list:
-        post_id_wise_reaction[reaction.post_id].append(reaction)
-
+    summaries = get_reaction_summaries(Post.objects.filter(id__in=post_ids))
     post_id_wise_reaction_details = defaultdict(list)
-    for reactions in reactions_list:
-        reaction_detail_dict = dict()
-        reaction_detail_dict["count"] = len(post_id_wise_reaction[reactions.post_id])
-        type_of_reaction = set()
-        for i in post_id_wise_reaction[reactions.post_id]:
-            type_of_reaction.add(i.reaction)
-        reaction_detail_dict["type"] = set(type_of_reaction)
-        post_id_wise_reaction_details[reactions.post_id].append(reaction_detail_dict)
+    for post_id, summary in summaries.items():
+        summary["type"] = set(summary["type"])
+        post_id_wise_reaction_details[post_id].append(summary)
     return post_id_wise_reaction_details
 
 
+@on_id_shards
 def get_reactions_detail_of_comments(comment_ids):
     """
     :param comment_ids:
     :return:
     """
-    reactions_list = list(React.objects.filter(
-        comment_id__in=comment_ids).select_related('comment'))
-    comment_id_wise_reactions = defaultdict(list)
-    for reaction in reactions_list:
-        comment_id_wise_reactions[reaction.comment_id].append(reaction)
-
-    comment_id_wise_reactions_details = defaultdict(list)
-    for reactions in reactions_list:
-        reaction_detail_dict = dict()
-        reaction_detail_dict["count"] = len(comment_id_wise_reactions[reactions.comment_id])
-        type_of_reaction = set()
-        for i in comment_id_wise_reactions[reactions.comment_id]:
-            type_of_reaction.add(i.reaction)
-        reaction_detail_dict["type"] = list(type_of_reaction)
-        comment_id_wise_reactions_details[reactions.comment_id].append(reaction_detail_dict)
-    return comment_id_wise_reactions_details
+    summaries = get_reaction_summaries(
+        Comment.objects.filter(id__in=comment_ids))
+    return defaultdict(list, {comment_id: [summary]
+                              for comment_id, summary in summaries.items()})
 
 
+@on_id_shards
 def get_reactions_detail_of_comments_replies(comment_ids):
     """
     :param comment_ids:
     :return:
     """
-    reactions_list = list(React.objects.filter(
-        comment__parent_comment_id__in=comment_ids).select_related('comment'))
-    comment_id_wise_reactions = defaultdict(list)
-    for reaction in reactions_list:
-        comment_id_wise_reactions[reaction.comment_id].append(reaction)
+    summaries = get_reaction_summaries(
+        Comment.objects.filter(parent_comment_id__in=comment_ids))
+    return defaultdict(list, {comment_id: [summary]
+                              for comment_id, summary in summaries.items()})
 
-    comment_id_wise_reactions_details = defaultdict(list)
-    for reactions in reactions_list:
-        reaction_detail_dict = dict()
-        reaction_detail_dict["count"] = len(comment_id_wise_reactions[reactions.comment_id])
-        type_of_reaction = set()
-        for i in comment_id_wise_reactions[reactions.comment_id]:
-            type_of_reaction.add(i.reaction)
-        reaction_detail_dict["type"] = list(type_of_reaction)
-        comment_id_wise_reactions_details[reactions.comment_id].append(reaction_detail_dict)
-    return comment_id_wise_reactions_details
 
+def get_reactions_details_list(target, type_class=list):
+    """
+    :param target: Post or Comment with its counter fields loaded
+    :param type_class: container for the reaction types
+    :return: [summary], or [] when nobody reacted
+    """
+    summary = get_reaction_summary(target)
+    if summary is None:
+        return []
+    summary["type"] = type_class(summary["type"])
+    return [summary]
 
-def get_replieses_details(comment_ids):
+
+@on_id_shards
+def get_replieses_details(comment_ids, user_profiles=None,
+                          native_timestamps=False):
     """
     :param comment_ids:
+    :param user_profiles: UserProfiles shared with the caller's other rows
+    :param native_timestamps: keep commented_at a datetime instead of str
     :return:
     """
+    user_profiles = user_profiles or UserProfiles()
     reply_list = list(Comment.objects.filter(
-        parent_comment_id__in=comment_ids).select_related('commented_by'))
-    replies_reactions = get_reactions_detail_of_comments_replies(comment_ids)
+        parent_comment_id__in=comment_ids))
+    remember_rows(Comment, reply_list)
+    user_profiles.want(reply.commented_by_id for reply in reply_list)
     parent_comment_id_wise_reply_details = defaultdict(list)
     for reply in reply_list:
-        reactions_details = replies_reactions[reply.id]
         reply_detail = dict()
         reply_detail["comment_id"] = reply.pk
-        user_detail_dict = {"user_id": reply.commented_by.id,
-                            "name": reply.commented_by.name,
-                            "profile_pic": reply.commented_by.profile_pic}
-        reply_detail["commenter"] = user_detail_dict
-        reply_detail["commented_at"] = str(reply.commented_at)
+        reply_detail["commenter"] = user_profiles[reply.commented_by_id]
+        reply_detail["commented_at"] = get_timestamp(reply.commented_at,
+                                                     native_timestamps)
         reply_detail["comment_content"] = reply.content
-        reply_detail["reactions"] = reactions_details
+        reply_detail["reactions"] = get_reactions_details_list(reply)
         parent_comment_id_wise_reply_details[reply.parent_comment_id].append(reply_detail)
     return parent_comment_id_wise_reply_details
 
 
-def get_comments_details(post_ids):
+@on_id_shards
+def get_comments_details(post_ids, user_profiles=None,
+                         native_timestamps=False):
     """
     :param post_ids:
+    :param user_profiles: UserProfiles shared with the caller's other rows
+    :param native_timestamps: keep commented_at a datetime instead of str
     :return:{1:[{1:}, {]}
     """
-    comment_list = list(
-        Comment.objects.filter(post_id__in=post_ids).select_related(
-            'commented_by'))
+    user_profiles = user_profiles or UserProfiles()
+    comment_list = list(Comment.objects.filter(post_id__in=post_ids))
+    remember_rows(Comment, comment_list)
+    user_profiles.want(comment.commented_by_id for comment in comment_list)
     post_id_wise_comments_details_list = defaultdict(list)
-    comment_ids = list(Comment.objects.filter(
-        post_id__in=post_ids).values_list('id', flat=True)
-                       )
-    comments_replies = get_replieses_details(comment_ids)
-    comments_reactions = get_reactions_detail_of_comments(comment_ids)
+    comment_ids = [comment.id for comment in comment_list]
+    comments_replies = get_replieses_details(comment_ids, user_profiles,
+                                             native_timestamps)
     for comment in comment_list:
         replies = comments_replies[comment.id]
-        reactions_details = comments_reactions[comment.id]
         comment_details = dict()
         comment_details["comment_id"] = comment.pk
-        user_detail_dict = {"user_id": comment.commented_by.id,
-                            "name": comment.commented_by.name,
-                            "profile_pic": comment.commented_by.profile_pic}
-        comment_details["commenter"] = user_detail_dict
-        comment_details["commented_at"] = str(comment.commented_at)
+        comment_details["commenter"] = user_profiles[comment.commented_by_id]
+        comment_details["commented_at"] = get_timestamp(comment.commented_at,
+                                                        native_timestamps)
         comment_details["comment_content"] = comment.content
-        comment_details["reaction"] = reactions_details
+        comment_details["reaction"] = get_reactions_details_list(comment)
         comment_details["replies_count"] = len(replies)
         comment_details["replies"] = replies
         post_id_wise_comments_details_list[comment.post_id].append(comment_details)
     return post_id_wise_comments_details_list
 
 
-def get_posts(post_ids):
+def get_timestamp(timestamp, native_timestamps):
+    if native_timestamps:
+        return timestamp
+    return str(timestamp)
+
+
+@identity_scoped
+def get_posts(post_ids, native_timestamps=False):
     """
     :param post_ids:
+    :param native_timestamps: datetimes instead of str for JSON encoders
+        that serialize them natively
     :return:
     """
-    for post_id in post_ids:
-        validate_post(post_id)
+    validate_posts(post_ids)
+
+    return load_post_documents(post_ids, native_timestamps)
+
+
+def load_post_documents(post_ids, native_timestamps=False):
+    """
+    Post documents of existing posts through the document cache; the two
+    timestamp flavours are cached separately. Posts of several shards are
+    loaded shard by shard and put back in the order of post_ids.
+    """
+    def load_shard_documents(alias, shard_post_ids):
+        with use_shard(alias):
+            return get_post_documents(
+                shard_post_ids,
+                partial(build_posts, native_timestamps=native_timestamps),
+                variant='native' if native_timestamps else 'str')
+
+    shard_wise_post_ids = group_by_shard(post_ids)
+    if len(shard_wise_post_ids) == 1:
+        return load_shard_documents(*shard_wise_post_ids.popitem())
 
-    post_objs = Post.objects.filter(id__in=post_ids).select_related('posted_by')
-    list_of_posts = []
-    post_id_wise_comments_details_list = get_comments_details(post_ids)
-    post_id_wise_reactions_details = get_reactions_detail(post_ids)
+    post_id_wise_documents = {}
+    for alias, shard_post_ids in shard_wise_post_ids.items():
+        for document in load_shard_documents(alias, shard_post_ids):
+            post_id_wise_documents[document["post_id"]] = document
+    return [post_id_wise_documents[post_id] for post_id in post_ids
+            if post_id in post_id_wise_documents]
+
+
+def build_posts(post_ids, native_timestamps=False):
+    """
+    Builds post documents for ids already known to exist.
+    :param post_ids:
+    :param native_timestamps: keep posted_at/commented_at datetimes
+    :return: documents in the order of post_ids
+    """
+    post_objs = list(get_rows(Post, post_ids, load_posts).values())
+    user_profiles = UserProfiles()
+    user_profiles.want(post_obj.posted_by_id for post_obj in post_objs)
+    post_id_wise_details = dict()
+    post_id_wise_comments_details_list = get_comments_details(
+        post_ids, user_profiles, native_timestamps)
     for post_obj in post_objs:
         comments = post_id_wise_comments_details_list[post_obj.id]
-        reactions = post_id_wise_reactions_details[post_obj.id]
-        user_detail_dict = {"user_id": post_obj.posted_by.id,
-                            "name": post_obj.posted_by.name,
-                            "profile_pic": post_obj.posted_by.profile_pic}
+        reactions = get_reactions_details_list(post_obj, type_class=set)
         detail_dict = {
 
             "post_id": post_obj.id,
-            "posted_by": user_detail_dict,
-            "posted_at": str(post_obj.posted_at),
+            "posted_by": user_profiles[post_obj.posted_by_id],
+            "posted_at": get_timestamp(post_obj.posted_at,
+                                       native_timestamps),
             "post_content": post_obj.content,
             "reactions": reactions,
             "comments": comments,
             "comments_count": len(comments)
         }
-        list_of_posts.append(detail_dict)
-    return list_of_posts
+        post_id_wise_details[post_obj.id] = detail_dict
+    return [post_id_wise_details[post_id] for post_id in dict.fromkeys(post_ids)
+            if post_id in post_id_wise_details]
 
 
-def get_user_posts(user_id):
+@on_shard_of('user_id')
+@identity_scoped
+def get_user_posts(user_id, native_timestamps=False):
     """
     :param user_id:
+    :param native_timestamps: datetimes instead of str
     :return:
     """
     validate_user(user_id)
 
-    posts = Post.objects.filter(posted_by_id=user_id).values()
-    list_of_post_ids = [post['id'] for post in posts]
-    post_list = get_posts(list_of_post_ids)
+    list_of_post_ids = list(Post.objects.filter(
+        posted_by_id=user_id).values_list('id', flat=True))
+    post_list = load_post_documents(list_of_post_ids, native_timestamps)
     return post_list
 
 
-def get_replies_for_comments(comment_id):
+def get_chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, chunk_size))
+
+
+@identity_scoped
+def iter_posts(post_ids, chunk_size=STREAM_CHUNK_SIZE,
+               native_timestamps=False):
+    """
+    Streaming get_posts: builds ``chunk_size`` posts at a time and yields
+    them one by one, so memory follows the chunk instead of the whole list.
+    Each chunk is validated before it is built; an invalid id stops the
+    stream with InvalidPostException once its chunk is reached.
+    :param post_ids: iterable of post ids
+    :param chunk_size:
+    :param native_timestamps: datetimes instead of str
+    :return: generator of post documents
+    """
+    for chunk in get_chunks(post_ids, chunk_size):
+        validate_posts(chunk)
+        yield from load_post_documents(chunk, native_timestamps)
+
+
+@on_shard_of('user_id')
+@identity_scoped
+def iter_user_posts(user_id, chunk_size=STREAM_CHUNK_SIZE,
+                    native_timestamps=False):
+    """
+    Streaming get_user_posts; post ids are read with a chunked iterator too.
+    :param user_id:
+    :param chunk_size:
+    :param native_timestamps: datetimes instead of str
+    :return: generator of post documents
+    """
+    validate_user(user_id)
+
+    post_ids = Post.objects.filter(posted_by_id=user_id).order_by(
+        'id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+    for chunk in get_chunks(post_ids, chunk_size):
+        yield from load_post_documents(chunk, native_timestamps)
+
+
+@on_shard_of('user_id')
+@identity_scoped
+def get_user_posts_page(user_id, page_size=DEFAULT_PAGE_SIZE, cursor=None,
+                        native_timestamps=False):
+    """
+    :param user_id:
+    :param page_size:
+    :param cursor: next_cursor of the previous page, None for the first one
+    :param native_timestamps: datetimes instead of str
+    :return: {"posts": newest posts first, "next_cursor": str or None}
+    """
+    validate_user(user_id)
+
+    posts, next_cursor = get_keyset_page(
+        Post.objects.filter(posted_by_id=user_id).only('id', 'posted_at'),
+        'posted_at', page_size, cursor, descending=True)
+    post_ids = [post.id for post in posts]
+    return {"posts": load_post_documents(post_ids, native_timestamps),
+            "next_cursor": next_cursor}
+
+
+def get_reply_details(reply, user_profiles, native_timestamps=False):
+    return {"comment_id": reply.pk,
+            "commenter": user_profiles[reply.commented_by_id],
+            "commented_at": get_timestamp(reply.commented_at,
+                                          native_timestamps),
+            "comment_content": reply.content}
+
+
+@on_shard_of('comment_id')
+@identity_scoped
+def get_replies_for_comments(comment_id, native_timestamps=False):
     """
     :param comment_id:
+    :param native_timestamps: datetimes instead of str
     :return:
     """
     validate_comment(comment_id)
 
-    reply_list = list(Comment.objects.filter(
-        parent_comment=comment_id).select_related('commented_by'))
-    all_replies = list()
-    for reply in reply_list:
-        single_reply_detail = dict()
-        single_reply_detail["comment_id"] = reply.pk
-        user_detail_dict = {"user_id": reply.commented_by.id,
-                            "name": reply.commented_by.name,
-                            "profile_pic": reply.commented_by.profile_pic}
-        single_reply_detail["commenter"] = user_detail_dict
-        single_reply_detail["commented_at"] = str(reply.commented_at)
-        single_reply_detail["comment_content"] = reply.content
-        all_replies.append(single_reply_detail)
-    return all_replies
+    reply_list = list(Comment.objects.filter(parent_comment=comment_id))
+    remember_rows(Comment, reply_list)
+    user_profiles = UserProfiles()
+    user_profiles.want(reply.commented_by_id for reply in reply_list)
+    return [get_reply_details(reply, user_profiles, native_timestamps)
+            for reply in reply_list]
+
+
+@on_shard_of('comment_id')
+@identity_scoped
+def get_replies_for_comments_page(comment_id, page_size=DEFAULT_PAGE_SIZE,
+                                  cursor=None, native_timestamps=False):
+    """
+    :param comment_id:
+    :param page_size:
+    :param cursor: next_cursor of the previous page, None for the first one
+    :param native_timestamps: datetimes instead of str
+    :return: {"replies": oldest replies first, "next_cursor": str or None}
+    """
+    validate_comment(comment_id)
+
+    replies, next_cursor = get_keyset_page(
+        Comment.objects.filter(parent_comment=comment_id),
+        'commented_at', page_size, cursor)
+    remember_rows(Comment, replies)
+    user_profiles = UserProfiles()
+    user_profiles.want(reply.commented_by_id for reply in replies)
+    return {"replies": [get_reply_details(reply, user_profiles,
+                                          native_timestamps)
+                        for reply in replies],
+            "next_cursor": next_cursor}
+
+
+@on_shard_of('comment_id')
+@identity_scoped
+def get_comment_thread(comment_id, max_depth=None, max_size=None):
+    """
+    Returns a comment with all of its nested replies, read with one range
+    query over the materialized path.
+    :param comment_id:
+    :param max_depth: levels of replies below the comment, None for all;
+        clamped to 0 and up
+    :param max_size: most comments in the thread, the comment included;
+        comments are kept in depth-first order; clamped to 1 and up, so
+        the comment itself is always returned
+    :return: comment dict whose "replies" hold reply dicts of the same shape
+    """
+    root = get_rows(Comment, [comment_id], load_comments).get(comment_id)
+    if root is None:
+        raise InvalidCommentException('InvalidCommentException')
+
+    lower, upper = get_subtree_path_range(root.path)
+    thread = Comment.objects.filter(
+        path__gte=lower, path__lt=upper).order_by('path')
+    if max_depth is not None:
+        thread = thread.filter(depth__lte=root.depth + max(0, max_depth))
+    if max_size is not None:
+        thread = thread[:max(1, max_size)]
+    thread = list(thread)
+    remember_rows(Comment, thread)
+    user_profiles = UserProfiles()
+    user_profiles.want(comment.commented_by_id for comment in thread)
+
+    comment_id_wise_details = dict()
+    for comment in thread:
+        comment_details = get_reply_details(comment, user_profiles)
+        comment_details["reactions"] = get_reactions_details_list(comment)
+        comment_details["replies"] = []
+        comment_id_wise_details[comment.id] = comment_details
+        parent_details = comment_id_wise_details.get(comment.parent_comment_id)
+        if comment.id != root.id and parent_details is not None:
+            parent_details["replies"].append(comment_details)
+    return comment_id_wise_details[root.id]
+
+
+# Keep this last so every function above is wrapped. Per-row helpers are left
+# alone to keep the overhead per call instead of per row.
+instrument_module(globals(), exclude={'get_chunks', 'get_reply_details',
+                                      'get_reactions_details_list',
+                                      'get_timestamp'})
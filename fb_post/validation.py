@@ -0,0 +1,186 @@
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.db.models import F
+
+from fb_post.identity_map import get_identity_map, get_rows
+from fb_post.models import Post, Comment, get_root_comment_id
+
+# Keeps every ``id IN (...)`` below SQLite's bound-parameter limit.
+ID_BATCH_SIZE = 500
+
+
+class ConfirmedIdCache:
+    """
+    Bounded LRU of (model, id) pairs already seen in the database.
+
+    The size is read from ``FB_POST_VALIDATION_CACHE_SIZE`` on every use, so
+    the cache can be switched on and off at runtime; 0 disables it.
+    """
+
+    def __init__(self):
+        self._keys = OrderedDict()
+        self._lock = Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'FB_POST_VALIDATION_CACHE_SIZE', 0)
+
+    def contains(self, model, object_id):
+        key = (model._meta.label, object_id)
+        with self._lock:
+            if key not in self._keys:
+                return False
+            self._keys.move_to_end(key)
+            return True
+
+    def add_many(self, model, object_ids):
+        max_size = self.max_size
+        if max_size <= 0:
+            return
+        label = model._meta.label
+        with self._lock:
+            for object_id in object_ids:
+                self._keys[(label, object_id)] = None
+                self._keys.move_to_end((label, object_id))
+            while len(self._keys) > max_size:
+                self._keys.popitem(last=False)
+
+    def discard(self, model, object_ids):
+        label = model._meta.label
+        with self._lock:
+            for object_id in object_ids:
+                self._keys.pop((label, object_id), None)
+
+    def discard_model(self, model):
+        label = model._meta.label
+        with self._lock:
+            for key in [key for key in self._keys if key[0] == label]:
+                del self._keys[key]
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+confirmed_ids = ConfirmedIdCache()
+
+
+def load_posts(post_ids):
+    """
+    :return: {post_id: Post} of the posts that exist
+    """
+    return {post.id: post for post in Post.objects.filter(id__in=post_ids)}
+
+
+def load_comments(comment_ids):
+    """
+    :return: {comment_id: Comment} of the comments that exist, outside the
+        threads of deleted posts
+    """
+    comments = Comment.objects.filter(id__in=comment_ids).annotate(
+        post_deleted_at=F('post__deleted_at'))
+    live_ids = get_live_comment_ids(
+        (comment.id, comment.path, comment.post_id, comment.post_deleted_at)
+        for comment in comments)
+    return {comment.id: comment for comment in comments
+            if comment.id in live_ids}
+
+
+def get_live_comment_ids(rows):
+    """
+    Leaves out the comments in threads of posts deleted by delete_post. A
+    top-level comment brings the tombstone of its post through the post_id
+    join; replies are checked through their top-level comments, in one
+    more query.
+    :param rows: (id, path, post_id, deleted_at of the post) of comments
+    :return: set of the ids that are live
+    """
+    live_ids = set()
+    reply_root_ids = {}
+    for comment_id, path, post_id, post_deleted_at in rows:
+        if post_id is not None:
+            if post_deleted_at is None:
+                live_ids.add(comment_id)
+        elif path:
+            reply_root_ids[comment_id] = get_root_comment_id(path)
+    root_ids = list(set(reply_root_ids.values()))
+    live_root_ids = set()
+    for start in range(0, len(root_ids), ID_BATCH_SIZE):
+        live_root_ids.update(Comment.objects.filter(
+            id__in=root_ids[start:start + ID_BATCH_SIZE],
+            post__deleted_at__isnull=True).values_list('id', flat=True))
+    live_ids.update(comment_id
+                    for comment_id, root_id in reply_root_ids.items()
+                    if root_id in live_root_ids)
+    return live_ids
+
+
+def get_existing_ids(model, object_ids):
+    """
+    :return: set of the ids with a row: Post.objects leaves out tombstoned
+        posts, get_live_comment_ids their comments
+    """
+    if model is Comment:
+        return get_live_comment_ids(Comment.objects.filter(
+            id__in=object_ids).values_list('id', 'path', 'post_id',
+                                           'post__deleted_at'))
+    return set(model.objects.filter(id__in=object_ids).values_list(
+        'id', flat=True))
+
+
+def get_missing_ids(model, object_ids, load_rows=None):
+    """
+    Existence checks answer from the identity map of the current scope
+    (fb_post.identity_map) and the confirmed-id cache before the database.
+    :param model: model class whose primary keys are checked
+    :param object_ids: iterable of primary keys, duplicates allowed
+    :param load_rows: in an identity scope, loads the rows of the ids to
+        check ({id: row}) instead of just their ids, for rows the caller
+        is going to show anyway
+    :return: list of the ids without a row, in first-seen order
+    """
+    object_ids = list(dict.fromkeys(object_ids))
+    identity_map = get_identity_map()
+    known_ids = set()
+    missing_ids = set()
+    if identity_map is not None:
+        known_ids, missing_ids = identity_map.get_known_ids(model, object_ids)
+        known_ids |= missing_ids
+    unchecked_ids = [object_id for object_id in object_ids
+                     if object_id not in known_ids and
+                     not confirmed_ids.contains(model, object_id)]
+    if identity_map is not None and load_rows is not None:
+        existing_ids = set(get_rows(model, unchecked_ids, load_rows))
+    else:
+        existing_ids = set()
+        for start in range(0, len(unchecked_ids), ID_BATCH_SIZE):
+            batch = unchecked_ids[start:start + ID_BATCH_SIZE]
+            existing_ids.update(get_existing_ids(model, batch))
+    confirmed_ids.add_many(model, existing_ids)
+    missing_ids.update(object_id for object_id in unchecked_ids
+                       if object_id not in existing_ids)
+    if identity_map is not None:
+        identity_map.add_ids(model, existing_ids, missing_ids)
+    return [object_id for object_id in object_ids
+            if object_id in missing_ids]
+
+
+def forget_ids(model, object_ids):
+    """
+    Drops ids from the confirmed-id cache after their rows are deleted.
+    :param model:
+    :param object_ids:
+    :return:
+    """
+    confirmed_ids.discard(model, object_ids)
+
+
+def forget_model(model):
+    """
+    Drops every cached id of ``model``, for cascades whose ids are unknown.
+    :param model:
+    :return:
+    """
+    confirmed_ids.discard_model(model)
@@ -1,3 +1,295 @@
-from django.shortcuts import render
+from functools import wraps
 
-# Create your views here.
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, \
+    require_http_methods, condition
+
+from fb_post.exceptions import InvalidUserException, InvalidPostContent, \
+    InvalidPostException, InvalidCommentException, \
+    UserCannotDeletePostException, InvalidCommentContent, \
+    InvalidReactionTypeException, InvalidCursorException
+from fb_post.json_encoding import dumps, loads, iter_json_array
+from fb_post.metrics import render_prometheus
+from fb_post.post_versions import get_post_validators, \
+    get_user_post_validators, get_post_etag, get_combined_etag, \
+    get_last_modified
+from fb_post import utils
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+JSON_CONTENT_TYPE = 'application/json'
+MAX_IDS_PER_REQUEST = 1000
+BODY_FIELD_TYPES = {
+    'user_id': int,
+    'post_content': str,
+    'comment_content': str,
+    'reply_content': str,
+    'reaction_type': str,
+}
+
+ERROR_STATUSES = {
+    InvalidUserException: 404,
+    InvalidPostException: 404,
+    InvalidCommentException: 404,
+    InvalidPostContent: 400,
+    InvalidCommentContent: 400,
+    InvalidReactionTypeException: 400,
+    InvalidCursorException: 400,
+    UserCannotDeletePostException: 403,
+}
+
+
+class InvalidRequestBody(Exception):
+    pass
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status,
+                        content_type=JSON_CONTENT_TYPE)
+
+
+def reaction_response(action):
+    # A queued toggle (buffered mode) is accepted, not yet applied.
+    status = 202 if action == utils.REACTION_QUEUED else 200
+    return json_response({"action": action}, status=status)
+
+
+def streaming_json_response(items):
+    return StreamingHttpResponse(iter_json_array(items),
+                                 content_type=JSON_CONTENT_TYPE)
+
+
+def error_response(error, status):
+    body = {"error": str(error)}
+    if isinstance(error, InvalidPostException) and error.post_ids:
+        body["post_ids"] = error.post_ids
+    return json_response(body, status=status)
+
+
+def api_view(view):
+    """
+    Turns the fb_post exceptions raised by a view into JSON error responses.
+    Streaming views must validate before they return, since an exception
+    raised while streaming cannot change the status any more.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except InvalidRequestBody as error:
+            return error_response(error, 400)
+        except tuple(ERROR_STATUSES) as error:
+            return error_response(error, ERROR_STATUSES[type(error)])
+    return wrapper
+
+
+def get_body(request, *fields):
+    """
+    :return: values of ``fields`` in the JSON object sent as request body,
+        each of the type BODY_FIELD_TYPES gives for it
+    """
+    try:
+        body = loads(request.body)
+        values = [body[field] for field in fields]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidRequestBody('InvalidRequestBody')
+    for field, value in zip(fields, values):
+        # bool is an int to isinstance, but true is no user id.
+        if isinstance(value, bool) or \
+                not isinstance(value, BODY_FIELD_TYPES[field]):
+            raise InvalidRequestBody('InvalidRequestBody')
+    return values
+
+
+def get_int_list(request, name):
+    try:
+        values = [int(value) for value in request.GET.get(name, '').split(',')
+                  if value]
+    except ValueError:
+        raise InvalidRequestBody('InvalidRequestBody')
+    if len(values) > MAX_IDS_PER_REQUEST:
+        raise InvalidRequestBody('InvalidRequestBody')
+    return values
+
+
+def get_int(request, name, default=None):
+    try:
+        return int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        raise InvalidRequestBody('InvalidRequestBody')
+
+
+def conditional(get_validators):
+    """
+    Django's condition() with ETag and Last-Modified from one
+    ``get_validators(request, *args, **kwargs)`` call, made for GET and HEAD
+    only. It returns (etag, last modified) or None to serve the request
+    unconditionally, e.g. when the view is going to answer with an error.
+    A matching If-None-Match is answered with 304 before the view runs.
+    """
+    def get_request_validators(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if not hasattr(request, 'fb_post_validators'):
+            request.fb_post_validators = get_validators(request, *args,
+                                                        **kwargs)
+        return request.fb_post_validators
+
+    def etag(request, *args, **kwargs):
+        validators = get_request_validators(request, *args, **kwargs)
+        return validators and validators[0]
+
+    def last_modified(request, *args, **kwargs):
+        validators = get_request_validators(request, *args, **kwargs)
+        return validators and validators[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def get_single_post_validators(request, post_id):
+    validators = get_post_validators([post_id])
+    if post_id not in validators:
+        return None
+    version, updated_at = validators[post_id]
+    return get_post_etag(post_id, version), updated_at
+
+
+def get_post_list_validators(request):
+    post_ids = list(dict.fromkeys(get_int_list(request, 'ids')))
+    validators = get_post_validators(post_ids)
+    if len(validators) != len(post_ids):
+        return None
+    validators = {post_id: validators[post_id] for post_id in post_ids}
+    return get_combined_etag(validators), get_last_modified(validators)
+
+
+def get_user_posts_validators(request, user_id):
+    if 'page_size' in request.GET or 'cursor' in request.GET:
+        return get_user_post_validators(
+            user_id, get_int(request, 'page_size', utils.DEFAULT_PAGE_SIZE),
+            request.GET.get('cursor'))
+    return get_user_post_validators(user_id)
+
+
+def metrics(request):
+    return HttpResponse(render_prometheus(),
+                        content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@api_view
+@conditional(get_post_list_validators)
+def posts(request):
+    """
+    GET ?ids=1,2,3 streams the posts in that order; POST {"user_id",
+    "post_content"} creates one.
+    """
+    if request.method == 'POST':
+        user_id, post_content = get_body(request, 'user_id', 'post_content')
+        post_id = utils.create_post(user_id, post_content)
+        return json_response({"post_id": post_id}, status=201)
+
+    post_ids = get_int_list(request, 'ids')
+    utils.validate_posts(post_ids)
+    return streaming_json_response(
+        utils.iter_posts(post_ids, native_timestamps=True))
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'DELETE'])
+@api_view
+@conditional(get_single_post_validators)
+def post(request, post_id):
+    """
+    GET returns the post; DELETE ?user_id= deletes it.
+    """
+    if request.method == 'DELETE':
+        utils.delete_post(get_int(request, 'user_id'), post_id)
+        return HttpResponse(status=204)
+
+    return json_response(utils.get_posts([post_id],
+                                         native_timestamps=True)[0])
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+@api_view
+def post_comments(request, post_id):
+    user_id, comment_content = get_body(request, 'user_id', 'comment_content')
+    comment_id = utils.create_comment(user_id, post_id, comment_content)
+    return json_response({"comment_id": comment_id}, status=201)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@api_view
+@conditional(get_single_post_validators)
+def post_reactions(request, post_id):
+    """
+    GET streams who reacted how; POST {"user_id", "reaction_type"} toggles
+    the user's reaction.
+    """
+    if request.method == 'POST':
+        user_id, reaction_type = get_body(request, 'user_id', 'reaction_type')
+        action = utils.react_to_post(user_id, post_id, reaction_type)
+        return reaction_response(action)
+
+    return streaming_json_response(utils.get_reactions_to_post(post_id))
+
+
+@require_GET
+@api_view
+@conditional(get_single_post_validators)
+def post_reaction_metrics(request, post_id):
+    return json_response(utils.get_reaction_metrics(post_id))
+
+
+@require_GET
+@api_view
+@conditional(get_user_posts_validators)
+def user_posts(request, user_id):
+    """
+    Streams all posts of the user, or with ?page_size= / ?cursor= returns
+    one page {"posts", "next_cursor"}, newest first.
+    """
+    if 'page_size' in request.GET or 'cursor' in request.GET:
+        page_size = get_int(request, 'page_size', utils.DEFAULT_PAGE_SIZE)
+        return json_response(utils.get_user_posts_page(
+            user_id, page_size, request.GET.get('cursor'),
+            native_timestamps=True))
+
+    utils.validate_user(user_id)
+    return streaming_json_response(
+        utils.iter_user_posts(user_id, native_timestamps=True))
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@api_view
+def comment_replies(request, comment_id):
+    """
+    GET streams the replies, or one page with ?page_size= / ?cursor=;
+    POST {"user_id", "reply_content"} replies to the comment.
+    """
+    if request.method == 'POST':
+        user_id, reply_content = get_body(request, 'user_id', 'reply_content')
+        reply_id = utils.reply_to_comment(user_id, comment_id, reply_content)
+        return json_response({"comment_id": reply_id}, status=201)
+
+    if 'page_size' in request.GET or 'cursor' in request.GET:
+        page_size = get_int(request, 'page_size', utils.DEFAULT_PAGE_SIZE)
+        return json_response(utils.get_replies_for_comments_page(
+            comment_id, page_size, request.GET.get('cursor'),
+            native_timestamps=True))
+    return streaming_json_response(utils.get_replies_for_comments(
+        comment_id, native_timestamps=True))
+
+
+@csrf_exempt
+@require_http_methods(['POST'])
+@api_view
+def comment_reactions(request, comment_id):
+    user_id, reaction_type = get_body(request, 'user_id', 'reaction_type')
+    action = utils.react_to_comment(user_id, comment_id, reaction_type)
+    return reaction_response(action)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +49,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'fb_post.middleware.read_replica_middleware',
+    'fb_post.middleware.identity_map_middleware',
 ]
 
 ROOT_URLCONF = 'testing_assignment_004.urls'
@@ -81,6 +84,33 @@ DATABASES = {
     }
 }
 
+# Aliases of read-only copies of 'default' that fb_post.routers sends a
+# request's reads to until it writes; empty keeps everything on 'default'.
+# To try it locally, point FB_POST_REPLICA_DB at a second SQLite file and
+# keep it in sync with `python manage.py sync_read_replica --interval 1`.
+FB_POST_READ_REPLICAS = []
+if os.environ.get('FB_POST_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['FB_POST_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    FB_POST_READ_REPLICAS = ['replica']
+
+# Aliases fb_post.sharding partitions posts, comments and reactions over by
+# author, 'default' first; run `migrate --database <alias>` for each. To try
+# it locally, list extra SQLite files in FB_POST_SHARD_DBS, comma separated.
+FB_POST_SHARDS = ['default']
+for index, path in enumerate(
+        filter(None, os.environ.get('FB_POST_SHARD_DBS', '').split(',')), 1):
+    DATABASES['shard_{}'.format(index)] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+    }
+    FB_POST_SHARDS.append('shard_{}'.format(index))
+
+DATABASE_ROUTERS = ['fb_post.routers.ReadReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -122,3 +152,36 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# fb_post
+
+# Number of ids fb_post.validation remembers as existing; 0 disables the cache.
+FB_POST_VALIDATION_CACHE_SIZE = 0
+
+# Rows one request or utils call keeps in its identity map
+# (fb_post.identity_map); 0 turns the map off.
+FB_POST_IDENTITY_MAP_SIZE = 10000
+
+# Versioned get_posts document cache (fb_post.post_cache), stored in the
+# FB_POST_CACHE_ALIAS cache for FB_POST_CACHE_TIMEOUT seconds.
+FB_POST_CACHE_ENABLED = False
+FB_POST_CACHE_ALIAS = 'default'
+FB_POST_CACHE_TIMEOUT = 300
+
+# Per-function call, latency and SQL metrics of fb_post.utils, served at
+# /fb_post/metrics/; fb_post.metrics.set_enabled() overrides it at runtime.
+FB_POST_METRICS_ENABLED = True
+
+# Threads fb_post.async_utils runs the utils calls of the async views on.
+FB_POST_ASYNC_WORKERS = 8
+
+# Write-behind reaction toggles (fb_post.reaction_buffer): queued in process
+# and written every FB_POST_REACTION_BUFFER_INTERVAL seconds or once
+# FB_POST_REACTION_BUFFER_SIZE users/targets wait; journaled first to
+# FB_POST_REACTION_JOURNAL, one file per process, when set.
+FB_POST_REACTION_BUFFER_ENABLED = False
+FB_POST_REACTION_BUFFER_INTERVAL = 0.05
+FB_POST_REACTION_BUFFER_SIZE = 500
+FB_POST_REACTION_JOURNAL = None
+FB_POST_REACTION_JOURNAL_FSYNC = True